@@ -50,7 +50,8 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware'
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'users.middleware.PageVisitMiddleware',
 ]
 
 ROOT_URLCONF = 'a.urls'
@@ -172,4 +173,79 @@ LOGGING = {
             'propagate': True,
         },
     },
-}
\ No newline at end of file
+}
+
+# Tracking events (views, searches) are queued and written by a background thread
+TRACKING_QUEUE_SIZE = 10000         # bounded queue between requests and the writer
+TRACKING_BATCH_SIZE = 200           # events per write
+TRACKING_FLUSH_INTERVAL = 5         # seconds before a partial batch is written
+TRACKING_FULL_POLICY = 'drop_oldest'  # 'block', 'drop_oldest' or 'sample' when the queue is full
+TRACKING_SAMPLE_RATE = 0.1          # share of events kept under the 'sample' policy
+TRACKING_BLOCK_TIMEOUT = 1          # seconds a request may wait under the 'block' policy
+
+# 'database' writes events directly; 'spool' only appends them to files under
+# TRACKING_SPOOL_DIR, to be loaded by a scheduled `manage.py load_tracking_spool`
+TRACKING_BACKEND = 'database'
+TRACKING_SPOOL_DIR = BASE_DIR / 'spool'
+TRACKING_SPOOL_SEGMENT_BYTES = 8 * 1024 * 1024   # rotate segments at this size
+TRACKING_SPOOL_SEGMENT_SECONDS = 60              # or after this many seconds
+
+# Repeat views of the same video/page by the same viewer within this many
+# seconds are recorded once (0 disables); at most TRACKING_DEDUP_MAX_KEYS are remembered
+TRACKING_DEDUP_WINDOW = 300
+TRACKING_DEDUP_MAX_KEYS = 100000
+
+# Distinct user-agent strings kept in the per-process id cache
+USER_AGENT_CACHE_SIZE = 2048
+
+# In-process video search index; rebuilt when older than this many seconds
+# (0 disables) or after `manage.py rebuild_search_index`
+SEARCH_INDEX_MAX_AGE = 600
+# Minimum trigram similarity (Dice) for correcting a misspelled search word
+SEARCH_FUZZY_THRESHOLD = 0.4
+
+# Top results kept (packed) with each SearchHistory row
+SEARCH_SNAPSHOT_SIZE = 100
+
+# Seconds a normalized query's result ids stay cached. Saving, deleting or
+# bulk-updating a video invalidates them at once in the worker that made the
+# change, and in the others within SEARCH_CATALOG_CHECK_INTERVAL seconds.
+SEARCH_CACHE_TIMEOUT = 300
+SEARCH_CATALOG_CHECK_INTERVAL = 5
+
+# Search box suggestions: completions returned per prefix, and how often the
+# suggestion trie is rebuilt from titles and the search log (seconds)
+AUTOCOMPLETE_TOP_K = 10
+AUTOCOMPLETE_REBUILD_INTERVAL = 900
+
+# Admin dashboard figures are served from a cached snapshot and recomputed
+# in the background once older than this many seconds
+DASHBOARD_SNAPSHOT_TTL = 60
+
+# HyperLogLog sketches of daily unique viewers and queries use 2**HLL_PRECISION
+# registers (14: about 0.8% error, at most 16 KB before compression)
+HLL_PRECISION = 14
+
+# Trending searches/videos: counters per Space-Saving summary, and how often
+# each process merges its summaries into the database (seconds)
+HEAVY_HITTERS_CAPACITY = 100
+HEAVY_HITTERS_PERSIST_INTERVAL = 60
+
+# ?sort=trending: a view's weight halves every TRENDING_HALF_LIFE seconds
+# (run rebuild_trending_scores after changing it); pending score updates are
+# written every TRENDING_PERSIST_INTERVAL seconds
+TRENDING_HALF_LIFE = 2 * 24 * 3600
+TRENDING_PERSIST_INTERVAL = 60
+
+# Page-visit analytics (users/middleware.py): the session cookie expires after
+# ANALYTICS_SESSION_TIMEOUT seconds without a page view; paths starting with
+# any of ANALYTICS_EXCLUDED_PATHS are not recorded
+ANALYTICS_SESSION_COOKIE = 'analytics_session'
+ANALYTICS_SESSION_TIMEOUT = 30 * 60
+ANALYTICS_EXCLUDED_PATHS = ('/static/', '/media/', '/admin/', '/accounts/analytics/')
+
+# sessionize_visits (run every few minutes) closes sessions after
+# ANALYTICS_SESSION_TIMEOUT of inactivity. It leaves visits younger than
+# ANALYTICS_SESSIONIZE_DELAY seconds for the next run; keep this above the
+# tracking flush/spool loading lag, as later-arriving visits are skipped.
+ANALYTICS_SESSIONIZE_DELAY = 5 * 60
@@ -0,0 +1,7 @@
+# Loaded automatically by gunicorn from the working directory
+
+
+def worker_exit(server, worker):
+    # Write out queued tracking events before the worker goes away
+    from tutorial.tracking import event_writer
+    event_writer.close()
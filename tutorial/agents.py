@@ -0,0 +1,110 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from user_agents import parse
+
+from .models import UserAgent
+
+
+def hash_user_agent(user_agent):
+    return hashlib.sha256(user_agent.encode('utf-8', 'replace')).hexdigest()
+
+
+def parse_user_agent(user_agent):
+    agent = parse(user_agent)
+    if agent.is_tablet:
+        device_type = 'tablet'
+    elif agent.is_mobile:
+        device_type = 'mobile'
+    elif agent.is_pc:
+        device_type = 'desktop'
+    else:
+        device_type = 'unknown'
+
+    return {
+        'device_type': device_type,
+        'browser': (agent.browser.family or 'Other')[:50],
+        'os': (agent.os.family or 'Other')[:50],
+        'is_bot': agent.is_bot,
+    }
+
+
+class UserAgentCache:
+    # LRU map from raw user-agent string to UserAgent id
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or getattr(settings, 'USER_AGENT_CACHE_SIZE', 2048)
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_agent):
+        with self._lock:
+            agent_id = self._ids.get(user_agent)
+            if agent_id is not None:
+                self._ids.move_to_end(user_agent)
+            return agent_id
+
+    def update(self, ids):
+        with self._lock:
+            for user_agent, agent_id in ids.items():
+                self._ids[user_agent] = agent_id
+                self._ids.move_to_end(user_agent)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+agent_cache = UserAgentCache()
+
+
+def intern_user_agents(user_agents):
+    # Map each distinct string to a UserAgent id, creating missing rows
+    ids = {}
+    missing = set()
+    for user_agent in set(user_agents):
+        agent_id = agent_cache.get(user_agent)
+        if agent_id is None:
+            missing.add(user_agent)
+        else:
+            ids[user_agent] = agent_id
+    if not missing:
+        return ids
+
+    hashes = {hash_user_agent(user_agent): user_agent for user_agent in missing}
+    UserAgent.objects.bulk_create([
+        UserAgent(user_agent_hash=digest, user_agent=user_agent, **parse_user_agent(user_agent))
+        for digest, user_agent in hashes.items()
+    ], ignore_conflicts=True)
+
+    found = {}
+    for digest, agent_id in UserAgent.objects.filter(user_agent_hash__in=hashes).values_list('user_agent_hash', 'id'):
+        found[hashes[digest]] = agent_id
+    ids.update(found)
+
+    # Rows created inside a transaction that later rolls back must not be cached
+    transaction.on_commit(lambda: agent_cache.update(found))
+    return ids
+
+
+def device_distribution(queryset):
+    # queryset is a ViewerHistory or SearchHistory queryset
+    return list(
+        queryset.values(device_type=F('user_agent__device_type'))
+        .annotate(count=Count('id'))
+        .order_by('-count')
+    )
+
+
+def browser_distribution(queryset):
+    return list(
+        queryset.values(browser=F('user_agent__browser'))
+        .annotate(count=Count('id'))
+        .order_by('-count')
+    )
@@ -0,0 +1,176 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+
+from .models import YoutubeVideo, QueryStats
+from .search_index import tokenize
+
+# Past queries outweigh single title words
+QUERY_WEIGHT = 5
+
+
+def normalize_prefix(text):
+    return ' '.join(text.casefold().split())
+
+
+class _Node:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.top = []
+
+
+class CompletionTrie:
+    # Prefix tree where every node keeps its own top-k completions, so a
+    # lookup only walks the prefix and never the subtree below it.
+
+    def __init__(self, k=10):
+        self.k = k
+        self.root = _Node()
+        self.weights = {}
+        self._lock = threading.Lock()
+
+    def insert(self, term, weight=1):
+        if not term:
+            return
+        with self._lock:
+            total = self.weights.get(term, 0) + weight
+            self.weights[term] = total
+
+            node = self.root
+            self._offer(node, term, total)
+            for char in term:
+                node = node.children.setdefault(char, _Node())
+                self._offer(node, term, total)
+
+    def remove(self, term, weight=None):
+        # Take weight off term (all of it by default). Nodes on its path
+        # recompute their top-k from their children's, deepest first, so
+        # terms that were crowded out can move back up.
+        with self._lock:
+            total = self.weights.get(term)
+            if total is None:
+                return
+            total -= total if weight is None else weight
+            if total > 0:
+                self.weights[term] = total
+            else:
+                del self.weights[term]
+
+            path = [self.root]
+            for char in term:
+                path.append(path[-1].children[char])
+            for depth in range(len(path) - 1, -1, -1):
+                node = path[depth]
+                candidates = {name: value for child in node.children.values() for value, name in child.top}
+                if term[:depth] in self.weights:
+                    candidates[term[:depth]] = self.weights[term[:depth]]
+                node.top = sorted(((value, name) for name, value in candidates.items()),
+                                  key=lambda entry: (-entry[0], entry[1]))[:self.k]
+                if depth and not node.top:
+                    del path[depth - 1].children[term[depth - 1]]
+
+    def _offer(self, node, term, weight):
+        top = [entry for entry in node.top if entry[1] != term]
+        if len(top) < self.k or weight > top[-1][0]:
+            top.append((weight, term))
+            top.sort(key=lambda entry: (-entry[0], entry[1]))
+            del top[self.k:]
+        node.top = top
+
+    def complete(self, prefix, limit=None):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [term for weight, term in node.top[:limit or self.k]]
+
+    def __len__(self):
+        return len(self.weights)
+
+
+def build_trie():
+    trie = CompletionTrie(k=getattr(settings, 'AUTOCOMPLETE_TOP_K', 10))
+
+    titles = YoutubeVideo.objects.filter(is_active=True).values_list('title', flat=True)
+    for title in titles.iterator(chunk_size=2000):
+        for token in set(tokenize(title)):
+            trie.insert(token)
+
+    # Weighted by the searches that found something; typo fallbacks are
+    # recorded as zero-result, so misspellings never become suggestions.
+    # QueryStats keys are token-sorted (normalize_query), and so are the
+    # multi-word completions; search ignores word order anyway.
+    queries = (
+        QueryStats.objects.filter(search_count__gt=F('zero_result_count'))
+        .annotate(matched=F('search_count') - F('zero_result_count'))
+        .values_list('query', 'matched')
+        .order_by()
+    )
+    for query, matched in queries.iterator(chunk_size=2000):
+        trie.insert(normalize_prefix(query), matched * QUERY_WEIGHT)
+    return trie
+
+
+class Autocomplete:
+    # Holds the current trie and swaps in a fresh one, built on a
+    # background thread, every AUTOCOMPLETE_REBUILD_INTERVAL seconds.
+
+    def __init__(self):
+        self.trie = None
+        self.built_at = None
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self.trie is None:
+            with self._lock:
+                if self.trie is None:
+                    self._swap(build_trie())
+        elif time.time() - self.built_at > getattr(settings, 'AUTOCOMPLETE_REBUILD_INTERVAL', 900):
+            self._rebuild_in_background()
+        return self.trie
+
+    def add_title(self, title):
+        if self.trie is not None:
+            for token in set(tokenize(title)):
+                self.trie.insert(token)
+
+    def remove_title(self, title):
+        # Undo add_title; words other titles share keep their weight
+        if self.trie is not None:
+            for token in set(tokenize(title)):
+                self.trie.remove(token, 1)
+
+    def _swap(self, trie):
+        self.trie = trie
+        self.built_at = time.time()
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, name='autocomplete-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self._swap(build_trie())
+        finally:
+            self._rebuilding = False
+            connections.close_all()
+
+
+autocomplete = Autocomplete()
+
+
+def suggest(prefix, limit=None):
+    prefix = normalize_prefix(prefix)
+    if not prefix:
+        return []
+    return autocomplete.get().complete(prefix, limit)
@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+class ViewDeduplicator:
+    # Remembers recently seen view keys in time buckets covering the last
+    # `window` seconds. A key already present in any live bucket is a repeat.
+    # Keys are stored as their hash, and once max_keys are held the oldest
+    # bucket is discarded, so memory stays bounded under any traffic.
+
+    def __init__(self, window=None, max_keys=None, buckets=6):
+        self.window = getattr(settings, 'TRACKING_DEDUP_WINDOW', 300) if window is None else window
+        self.max_keys = max_keys or getattr(settings, 'TRACKING_DEDUP_MAX_KEYS', 100000)
+        self.bucket_seconds = max(self.window / buckets, 1)
+        self.bucket_keys = max(self.max_keys // buckets, 1)
+        self._buckets = deque()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+
+    def seen(self, key):
+        if not self.window:
+            return False
+
+        digest = hash(key)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            for started, keys in self._buckets:
+                if digest in keys:
+                    self._hits += 1
+                    return True
+
+            if (not self._buckets
+                    or now - self._buckets[-1][0] >= self.bucket_seconds
+                    or len(self._buckets[-1][1]) >= self.bucket_keys):
+                self._buckets.append((now, set()))
+            self._buckets[-1][1].add(digest)
+            self._size += 1
+            self._misses += 1
+
+            while self._size > self.max_keys:
+                self._drop_oldest()
+            return False
+
+    def stats(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'window': self.window,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / total if total else 0.0,
+                'keys': self._size,
+                'evicted': self._evicted,
+            }
+
+    def _expire(self, now):
+        while self._buckets and now - self._buckets[0][0] >= self.window + self.bucket_seconds:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        started, keys = self._buckets.popleft()
+        self._size -= len(keys)
+        self._evicted += len(keys)
@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import YoutubeVideo, HeavyHitterBucket
+from .query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+QUERIES = 'query'
+VIDEOS = 'video'
+
+# Bucket granularity (seconds) -> how long its buckets are kept
+GRANULARITIES = {
+    300: timedelta(hours=1),
+    3600: timedelta(days=7),
+}
+
+# Window -> (length, granularity of the buckets merged to cover it)
+WINDOWS = {
+    'hour': (timedelta(hours=1), 300),
+    'day': (timedelta(days=1), 3600),
+    'week': (timedelta(days=7), 3600),
+}
+
+
+def _capacity():
+    return getattr(settings, 'HEAVY_HITTERS_CAPACITY', 100)
+
+
+class SpaceSaving:
+    # Space-Saving top-k summary: at most `capacity` counters. A new item
+    # takes over the smallest counter, inheriting its count as error, so
+    # any item seen more than total/capacity times is always kept and a
+    # counter never under-estimates.
+
+    def __init__(self, capacity=None, counters=None):
+        self.capacity = capacity or _capacity()
+        # item -> [count, error]
+        self.counters = counters if counters is not None else {}
+
+    def offer(self, item, weight=1):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [weight, 0]
+        else:
+            smallest = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(smallest)[0]
+            self.counters[item] = [floor + weight, floor]
+
+    def floor(self):
+        # Most an untracked item can have been seen
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, error in self.counters.values())
+
+    def merge(self, other):
+        own_floor, other_floor = self.floor(), other.floor()
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(item, (own_floor, own_floor))
+            other_count, other_error = other.counters.get(item, (other_floor, other_floor))
+            merged[item] = [count + other_count, error + other_error]
+        top = sorted(merged.items(), key=lambda entry: -entry[1][0])[:self.capacity]
+        self.counters = {item: counter for item, counter in top}
+        return self
+
+    def top(self, limit=10):
+        ranked = sorted(self.counters.items(), key=lambda entry: (-entry[1][0], entry[0]))
+        return [{'item': item, 'count': count, 'error': error} for item, (count, error) in ranked[:limit]]
+
+
+def _bucket_start(moment, granularity):
+    seconds = int(moment.timestamp())
+    return datetime.fromtimestamp(seconds - seconds % granularity, tz=dt_timezone.utc)
+
+
+class HeavyHitters:
+    # Per-process Space-Saving summaries per (stream, granularity, bucket),
+    # fed by the tracking writers and merged into HeavyHitterBucket rows
+    # every HEAVY_HITTERS_PERSIST_INTERVAL seconds.
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._persisted_at = time.monotonic()
+
+    def offer(self, stream, items):
+        # items: (item, when) pairs
+        with self._lock:
+            for item, when in items:
+                for granularity in GRANULARITIES:
+                    key = (stream, granularity, _bucket_start(when, granularity))
+                    self._buckets.setdefault(key, SpaceSaving()).offer(item)
+
+    def maybe_persist(self):
+        interval = getattr(settings, 'HEAVY_HITTERS_PERSIST_INTERVAL', 60)
+        if time.monotonic() - self._persisted_at >= interval:
+            self.persist()
+
+    def persist(self):
+        with self._lock:
+            buckets, self._buckets = self._buckets, {}
+            self._persisted_at = time.monotonic()
+        try:
+            for (stream, granularity, bucket_start), summary in buckets.items():
+                _merge_into(stream, granularity, bucket_start, summary)
+            _expire()
+        except Exception:
+            logger.exception("Failed to persist %d heavy-hitter buckets", len(buckets))
+
+
+def _merge_into(stream, granularity, bucket_start, summary):
+    lookup = {'stream': stream, 'granularity': granularity, 'bucket_start': bucket_start}
+    with transaction.atomic():
+        row = HeavyHitterBucket.objects.select_for_update().filter(**lookup).first()
+        if row is None:
+            try:
+                with transaction.atomic():
+                    HeavyHitterBucket.objects.create(**lookup, counters=summary.counters)
+                return
+            except IntegrityError:
+                row = HeavyHitterBucket.objects.select_for_update().get(**lookup)
+        row.counters = SpaceSaving(counters=row.counters).merge(summary).counters
+        row.save(update_fields=['counters'])
+
+
+def _expire():
+    now = timezone.now()
+    for granularity, keep in GRANULARITIES.items():
+        HeavyHitterBucket.objects.filter(granularity=granularity, bucket_start__lt=now - keep).delete()
+
+
+heavy_hitters = HeavyHitters()
+
+
+def record_view_hitters(events):
+    heavy_hitters.offer(VIDEOS, ((str(event['video_id']), event['view_date']) for event in events))
+    heavy_hitters.maybe_persist()
+
+
+def record_query_hitters(events):
+    queries = ((normalize_query(event['query']), event['search_date']) for event in events)
+    heavy_hitters.offer(QUERIES, ((query, when) for query, when in queries if query))
+    heavy_hitters.maybe_persist()
+
+
+def top_items(stream, window='day', limit=10):
+    # Heaviest items of a stream over a sliding window, merged from the
+    # persisted buckets and cached for a minute
+    key = f"tutorial:heavy_hitters:{stream}:{window}:{limit}"
+    result = cache.get(key)
+    if result is None:
+        length, granularity = WINDOWS[window]
+        start = _bucket_start(timezone.now() - length, granularity)
+        rows = HeavyHitterBucket.objects.filter(
+            stream=stream, granularity=granularity, bucket_start__gte=start
+        ).values_list('counters', flat=True)
+        summary = SpaceSaving()
+        for counters in rows:
+            summary.merge(SpaceSaving(counters=counters))
+        result = summary.top(limit)
+        cache.set(key, result, 60)
+    return result
+
+
+def top_videos(window='day', limit=10):
+    # top_items for video views, with the videos resolved in one query
+    hitters = top_items(VIDEOS, window, limit)
+    videos = YoutubeVideo.objects.only('id', 'title').in_bulk([int(hitter['item']) for hitter in hitters])
+    return [
+        {'video': videos[int(hitter['item'])], 'count': hitter['count'], 'error': hitter['error']}
+        for hitter in hitters if int(hitter['item']) in videos
+    ]
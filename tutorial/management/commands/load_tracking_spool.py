@@ -0,0 +1,92 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tutorial.heavy_hitters import heavy_hitters
+from tutorial.models import SpoolCheckpoint
+from tutorial.spool import closed_segments, close_stale_segments, decode_event
+from tutorial.tracking import WRITERS
+from tutorial.trending import trending_scores
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Load closed tracking spool segments into ViewerHistory/SearchHistory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Events written per transaction")
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep segment files after they are fully loaded")
+        parser.add_argument('--close-stale', type=int, default=3600, metavar='SECONDS',
+                            help="Close open segments untouched for this long (0 disables)")
+
+    def handle(self, *args, **options):
+        if options['close_stale']:
+            for path in close_stale_segments(options['close_stale']):
+                self.stdout.write(f"Closed stale segment {path.name}")
+
+        total = 0
+        for path in closed_segments():
+            loaded = self.load_segment(path, options['batch_size'])
+            total += loaded
+            if not options['keep']:
+                # File first: a checkpoint without its file is harmless,
+                # a file without its checkpoint would be loaded again
+                path.unlink()
+                SpoolCheckpoint.objects.filter(segment=path.name).delete()
+            self.stdout.write(f"{path.name}: {loaded} events")
+
+        # Checkpoints left behind by runs that died between the two deletes
+        on_disk = {path.name for path in closed_segments()}
+        SpoolCheckpoint.objects.filter(completed=True).exclude(segment__in=on_disk).delete()
+
+        heavy_hitters.persist()
+        trending_scores.persist()
+        self.stdout.write(self.style.SUCCESS(f"Loaded {total} events"))
+
+    def load_segment(self, path, batch_size):
+        checkpoint, created = SpoolCheckpoint.objects.get_or_create(segment=path.name)
+        if checkpoint.completed:
+            return 0
+
+        loaded = 0
+        with open(path, 'rb') as spool_file:
+            # Resume where the last run stopped
+            spool_file.seek(checkpoint.offset)
+            while True:
+                lines = []
+                for line in spool_file:
+                    lines.append(line)
+                    if len(lines) >= batch_size:
+                        break
+                if not lines:
+                    break
+
+                events = []
+                for line in lines:
+                    try:
+                        events.append(decode_event(line))
+                    except ValueError:
+                        logger.warning("Skipping unreadable line in %s", path.name)
+
+                # Events and checkpoint commit together, so a rerun never loads twice
+                with transaction.atomic():
+                    self.write_events(events)
+                    checkpoint.offset = spool_file.tell()
+                    checkpoint.events_loaded += len(events)
+                    checkpoint.save()
+                loaded += len(events)
+
+        checkpoint.completed = True
+        checkpoint.save()
+        return loaded
+
+    def write_events(self, events):
+        grouped = {}
+        for kind, payload in events:
+            grouped.setdefault(kind, []).append(payload)
+        for kind, payloads in grouped.items():
+            WRITERS[kind](payloads)
@@ -0,0 +1,192 @@
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from tutorial.models import (
+    YoutubeVideo, ViewerHistory, SearchHistory, PageImpression, DailyVideoStats, DailySearchStats,
+    DailyDeviceStats, DailyViewerSketch, DailyQuerySketch,
+)
+from tutorial.packing import unpack_ids
+from tutorial.query_cache import normalize_query
+from tutorial.sketches import HyperLogLog, viewer_key
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the DailyVideoStats/DailySearchStats/DailyDeviceStats rollups and the daily viewer/query "
+            "sketches from raw view, impression and search history")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Only rebuild the last N days plus today (default: all history)")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Rows per bulk insert")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['days'] is not None:
+            start = timezone.localdate() - timedelta(days=options['days'])
+            since = timezone.make_aware(datetime.combine(start, time.min))
+
+        with transaction.atomic():
+            videos = self.rebuild_video_stats(since, options['batch_size'])
+            searches = self.rebuild_search_stats(since, options['batch_size'])
+            devices = self.rebuild_device_stats(since, options['batch_size'])
+            sketches = self.rebuild_sketches(since, options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {videos} daily video rows, {searches} daily search rows, "
+            f"{devices} daily device rows and {sketches} sketches"
+        ))
+
+    def rebuild_video_stats(self, since, batch_size):
+        views = ViewerHistory.objects.all()
+        impressions = PageImpression.objects.all()
+        stale = DailyVideoStats.objects.all()
+        if since is not None:
+            views = views.filter(view_date__gte=since)
+            impressions = impressions.filter(impression_date__gte=since)
+            stale = stale.filter(date__gte=timezone.localdate(since))
+        stale.delete()
+
+        counts = Counter()
+        rows = (
+            views.annotate(date=TruncDate('view_date'))
+            .values('date', 'video_id', 'page_type')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        for row in rows.iterator(chunk_size=batch_size):
+            counts[row['date'], row['video_id'], row['page_type']] += row['count']
+
+        # Impressions only hold packed ids, so they are counted here rather than in SQL
+        existing = set(YoutubeVideo.objects.values_list('id', flat=True))
+        rows = impressions.values_list('impression_date', 'video_ids')
+        for impression_date, video_ids in rows.iterator(chunk_size=batch_size):
+            date = timezone.localdate(impression_date)
+            for video_id in set(unpack_ids(video_ids)):
+                if video_id in existing:
+                    counts[date, video_id, 'list'] += 1
+
+        DailyVideoStats.objects.bulk_create(
+            (DailyVideoStats(date=date, video_id=video_id, page_type=page_type, count=count)
+             for (date, video_id, page_type), count in counts.items()),
+            batch_size=batch_size,
+        )
+        return len(counts)
+
+    def rebuild_search_stats(self, since, batch_size):
+        searches = SearchHistory.objects.all()
+        stale = DailySearchStats.objects.all()
+        if since is not None:
+            searches = searches.filter(search_date__gte=since)
+            stale = stale.filter(date__gte=timezone.localdate(since))
+        stale.delete()
+
+        rows = (
+            searches.annotate(date=TruncDate('search_date'))
+            .values('date')
+            .annotate(
+                search_count=Count('id'),
+                results_total=Sum('results_count'),
+                zero_result_count=Count('id', filter=Q(results_count=0)),
+            )
+            .order_by()
+        )
+        stats = [
+            DailySearchStats(
+                date=row['date'],
+                search_count=row['search_count'],
+                results_total=row['results_total'] or 0,
+                zero_result_count=row['zero_result_count'],
+            )
+            for row in rows
+        ]
+        DailySearchStats.objects.bulk_create(stats, batch_size=batch_size)
+        return len(stats)
+
+    def rebuild_device_stats(self, since, batch_size):
+        views = ViewerHistory.objects.all()
+        stale = DailyDeviceStats.objects.all()
+        if since is not None:
+            views = views.filter(view_date__gte=since)
+            stale = stale.filter(date__gte=timezone.localdate(since))
+        stale.delete()
+
+        rows = (
+            views.annotate(
+                date=TruncDate('view_date'),
+                device_type=Coalesce('user_agent__device_type', Value('unknown')),
+            )
+            .values('date', 'device_type')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        stats = [DailyDeviceStats(date=row['date'], device_type=row['device_type'], count=row['count']) for row in rows]
+        DailyDeviceStats.objects.bulk_create(stats, batch_size=batch_size)
+        return len(stats)
+
+    def rebuild_sketches(self, since, batch_size):
+        views = ViewerHistory.objects.all()
+        searches = SearchHistory.objects.all()
+        stale_viewers = DailyViewerSketch.objects.all()
+        stale_queries = DailyQuerySketch.objects.all()
+        if since is not None:
+            views = views.filter(view_date__gte=since)
+            searches = searches.filter(search_date__gte=since)
+            stale_viewers = stale_viewers.filter(date__gte=timezone.localdate(since))
+            stale_queries = stale_queries.filter(date__gte=timezone.localdate(since))
+        stale_viewers.delete()
+        stale_queries.delete()
+
+        created = 0
+        sketches = []
+
+        def save(model, **fields):
+            nonlocal created
+            sketches.append(model(**fields))
+            created += 1
+            if len(sketches) >= batch_size:
+                model.objects.bulk_create(sketches)
+                sketches.clear()
+
+        # Ordered by video, so only one per-video sketch is held at a time;
+        # the site-wide ones (one per day) are kept until the end
+        site = {}
+        current, sketch = None, None
+        rows = views.order_by('video_id', 'view_date').values_list('video_id', 'view_date', 'user_id', 'ip_address')
+        for video_id, view_date, user_id, ip_address in rows.iterator(chunk_size=batch_size):
+            date = timezone.localdate(view_date)
+            if (video_id, date) != current:
+                if sketch is not None:
+                    save(DailyViewerSketch, video_id=current[0], date=current[1], sketch=sketch.to_bytes())
+                current, sketch = (video_id, date), HyperLogLog()
+            key = viewer_key({'user_id': user_id, 'ip_address': ip_address})
+            sketch.add(key)
+            site.setdefault(date, HyperLogLog()).add(key)
+        if sketch is not None:
+            save(DailyViewerSketch, video_id=current[0], date=current[1], sketch=sketch.to_bytes())
+        for date, sketch in site.items():
+            save(DailyViewerSketch, video_id=None, date=date, sketch=sketch.to_bytes())
+        DailyViewerSketch.objects.bulk_create(sketches)
+        sketches.clear()
+
+        current, sketch = None, None
+        rows = searches.order_by('search_date').values_list('search_date', 'query')
+        for search_date, query in rows.iterator(chunk_size=batch_size):
+            date = timezone.localdate(search_date)
+            if date != current:
+                if sketch is not None:
+                    save(DailyQuerySketch, date=current, sketch=sketch.to_bytes())
+                current, sketch = date, HyperLogLog()
+            query = normalize_query(query)
+            if query:
+                sketch.add(query)
+        if sketch is not None:
+            save(DailyQuerySketch, date=current, sketch=sketch.to_bytes())
+        DailyQuerySketch.objects.bulk_create(sketches)
+        return created
@@ -0,0 +1,21 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from tutorial.models import YoutubeVideo
+from tutorial.search_index import rebuild_marker
+
+
+class Command(BaseCommand):
+    help = "Tell running workers to rebuild their video search index in the background"
+
+    def handle(self, *args, **options):
+        # Workers compare the marker's mtime with their own build time; the
+        # index itself lives in each worker, so there is nothing to build here
+        Path(rebuild_marker()).touch()
+
+        videos = YoutubeVideo.objects.count()
+        active = YoutubeVideo.objects.filter(is_active=True).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Marked the search index stale; workers will reindex {videos} videos ({active} active)"
+        ))
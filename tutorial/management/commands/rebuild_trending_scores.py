@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tutorial.trending import rebuild_trending_scores
+
+
+class Command(BaseCommand):
+    help = "Recompute YoutubeVideo.trending_score from raw view history (e.g. after changing TRENDING_HALF_LIFE)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Rows per bulk update")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            scored = rebuild_trending_scores(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt trending scores ({scored} videos with views)"))
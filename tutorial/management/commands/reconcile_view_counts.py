@@ -0,0 +1,19 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from tutorial.stats import reconcile_view_counts
+
+
+class Command(BaseCommand):
+    help = "Correct the per-video view counters on YoutubeVideo from raw ViewerHistory and PageImpression rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Also rebuild the daily rollups from raw history (see rebuild_daily_stats)")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            call_command('rebuild_daily_stats', stdout=self.stdout)
+        # The counters no longer depend on the rollups, so this needs no rebuild first
+        drifted = reconcile_view_counts()
+        self.stdout.write(self.style.SUCCESS(f"Corrected view counters on {drifted} videos"))
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tutorial.models import YoutubeVideo
+from tutorial.retention import CHUNK_SIZE, cohort_retention, video_retention
+
+
+class Command(BaseCommand):
+    help = "Print weekly cohort retention and per-video repeat-view/retention rates from ViewerHistory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=12,
+                            help="Cohorts and weeks after registration to cover")
+        parser.add_argument('--days', type=int, default=30,
+                            help="Views from the last N days used for per-video figures")
+        parser.add_argument('--top', type=int, default=20,
+                            help="Videos listed, most viewers first")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help="ViewerHistory rows converted to arrays at a time")
+
+    def handle(self, *args, **options):
+        weeks = options['weeks']
+        cohorts = cohort_retention(weeks=weeks, chunk_size=options['chunk_size'])
+        self.stdout.write("Cohort       Users  " + ' '.join(f"w{week:<5}" for week in range(weeks)))
+        for start, size, row in zip(cohorts['cohorts'], cohorts['sizes'], cohorts['matrix']):
+            self.stdout.write(f"{start}  {size:>5}  " + ' '.join(f"{value:<6}" for value in row))
+
+        since = timezone.now() - timedelta(days=options['days'])
+        videos = video_retention(since=since, chunk_size=options['chunk_size'])
+        top = videos.sort_values('viewers', ascending=False).head(options['top'])
+        titles = YoutubeVideo.objects.in_bulk(top.index.tolist())
+
+        self.stdout.write("")
+        self.stdout.write(f"{'Video':<40} {'Viewers':>8} {'Repeat':>8} {'Retained':>9}")
+        for video_id, row in top.iterrows():
+            title = titles[video_id].title if video_id in titles else f"#{video_id}"
+            self.stdout.write(
+                f"{title[:40]:<40} {int(row['viewers']):>8} {row['repeat_rate']:>8.1%} {row['retention']:>9.1%}"
+            )
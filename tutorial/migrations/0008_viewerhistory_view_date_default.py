@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0007_remove_commentresponse_comment_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='viewerhistory',
+            name='view_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0008_viewerhistory_view_date_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='searchhistory',
+            name='search_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,98 @@
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+from user_agents import parse
+
+
+# Frozen copies of tutorial.agents.hash_user_agent / parse_user_agent, so
+# later changes to that module can't change what this migration does
+
+def hash_user_agent(user_agent):
+    return hashlib.sha256(user_agent.encode('utf-8', 'replace')).hexdigest()
+
+
+def parse_user_agent(user_agent):
+    agent = parse(user_agent)
+    if agent.is_tablet:
+        device_type = 'tablet'
+    elif agent.is_mobile:
+        device_type = 'mobile'
+    elif agent.is_pc:
+        device_type = 'desktop'
+    else:
+        device_type = 'unknown'
+
+    return {
+        'device_type': device_type,
+        'browser': (agent.browser.family or 'Other')[:50],
+        'os': (agent.os.family or 'Other')[:50],
+        'is_bot': agent.is_bot,
+    }
+
+
+def intern_existing_user_agents(apps, schema_editor):
+    UserAgent = apps.get_model('tutorial', 'UserAgent')
+    ViewerHistory = apps.get_model('tutorial', 'ViewerHistory')
+    SearchHistory = apps.get_model('tutorial', 'SearchHistory')
+
+    for model in (ViewerHistory, SearchHistory):
+        strings = model.objects.values_list('user_agent', flat=True).distinct()
+        for user_agent in strings.iterator():
+            agent, created = UserAgent.objects.get_or_create(
+                user_agent_hash=hash_user_agent(user_agent),
+                defaults={'user_agent': user_agent, **parse_user_agent(user_agent)},
+            )
+            # One UPDATE per distinct string, not per row
+            model.objects.filter(user_agent=user_agent).update(agent=agent)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0010_spoolcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_agent_hash', models.CharField(max_length=64, unique=True)),
+                ('user_agent', models.TextField()),
+                ('device_type', models.CharField(choices=[('desktop', 'Desktop'), ('mobile', 'Mobile'), ('tablet', 'Tablet'), ('unknown', 'Unknown')], db_index=True, default='unknown', max_length=10)),
+                ('browser', models.CharField(db_index=True, max_length=50)),
+                ('os', models.CharField(max_length=50)),
+                ('is_bot', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='viewerhistory',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='tutorial.useragent'),
+        ),
+        migrations.AddField(
+            model_name='searchhistory',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='tutorial.useragent'),
+        ),
+        migrations.RunPython(intern_existing_user_agents, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='viewerhistory',
+            name='user_agent',
+        ),
+        migrations.RemoveField(
+            model_name='searchhistory',
+            name='user_agent',
+        ),
+        migrations.RenameField(
+            model_name='viewerhistory',
+            old_name='agent',
+            new_name='user_agent',
+        ),
+        migrations.RenameField(
+            model_name='searchhistory',
+            old_name='agent',
+            new_name='user_agent',
+        ),
+    ]
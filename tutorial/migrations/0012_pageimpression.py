@@ -0,0 +1,49 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_list_view_count(apps, schema_editor):
+    # Legacy 'list' history rows; impressions only start with this migration
+    YoutubeVideo = apps.get_model('tutorial', 'YoutubeVideo')
+    ViewerHistory = apps.get_model('tutorial', 'ViewerHistory')
+    rows = ViewerHistory.objects.filter(page_type='list').values('video_id').annotate(count=Count('id')).order_by()
+    for row in rows.iterator(chunk_size=5000):
+        YoutubeVideo.objects.filter(pk=row['video_id']).update(list_view_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0011_useragent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageImpression',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.GenericIPAddressField()),
+                ('query', models.CharField(blank=True, max_length=255)),
+                ('page_number', models.PositiveIntegerField(default=1)),
+                ('video_ids', models.BinaryField()),
+                ('impression_date', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('user_agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='tutorial.useragent')),
+            ],
+            options={
+                'ordering': ['-impression_date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='youtubevideo',
+            name='list_view_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_list_view_count, migrations.RunPython.noop),
+    ]
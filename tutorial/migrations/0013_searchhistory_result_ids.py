@@ -0,0 +1,48 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:13
+
+import sys
+from array import array
+from itertools import groupby
+
+from django.db import migrations, models
+
+# Matches the default SEARCH_SNAPSHOT_SIZE
+SNAPSHOT_SIZE = 100
+
+
+def pack_ids(ids):
+    # Frozen copy of tutorial.packing.pack_ids: little-endian signed 64-bit
+    packed = array('q', ids)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def pack_existing_results(apps, schema_editor):
+    SearchHistory = apps.get_model('tutorial', 'SearchHistory')
+    SearchResult = apps.get_model('tutorial', 'SearchResult')
+
+    rows = (
+        SearchResult.objects.order_by('search_id', 'position')
+        .values_list('search_id', 'video_id')
+        .iterator(chunk_size=5000)
+    )
+    for search_id, results in groupby(rows, key=lambda row: row[0]):
+        video_ids = [video_id for _, video_id in results][:SNAPSHOT_SIZE]
+        SearchHistory.objects.filter(pk=search_id).update(result_ids=pack_ids(video_ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0012_pageimpression'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchhistory',
+            name='result_ids',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.RunPython(pack_existing_results, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:18
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+
+
+def normalize_query(query):
+    # Same normalization as tutorial.query_cache.normalize_query
+    return ' '.join(sorted(query.casefold().split()))[:255]
+
+
+def backfill_query_stats(apps, schema_editor):
+    SearchHistory = apps.get_model('tutorial', 'SearchHistory')
+    QueryStats = apps.get_model('tutorial', 'QueryStats')
+
+    totals = {}
+    rows = SearchHistory.objects.values('query').annotate(
+        searches=Count('id'),
+        results=Sum('results_count'),
+        zero_results=Count('id', filter=Q(results_count=0)),
+        first_seen=Min('search_date'),
+        last_seen=Max('search_date'),
+    ).order_by()
+    for row in rows.iterator(chunk_size=5000):
+        query = normalize_query(row['query'])
+        if not query:
+            continue
+        stats = totals.get(query)
+        if stats is None:
+            totals[query] = QueryStats(
+                query=query,
+                search_count=row['searches'],
+                results_total=row['results'] or 0,
+                zero_result_count=row['zero_results'],
+                first_seen=row['first_seen'],
+                last_seen=row['last_seen'],
+            )
+        else:
+            stats.search_count += row['searches']
+            stats.results_total += row['results'] or 0
+            stats.zero_result_count += row['zero_results']
+            stats.first_seen = min(stats.first_seen, row['first_seen'])
+            stats.last_seen = max(stats.last_seen, row['last_seen'])
+    QueryStats.objects.bulk_create(totals.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0013_searchhistory_result_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=255, unique=True)),
+                ('search_count', models.PositiveIntegerField(db_index=True, default=0)),
+                ('results_total', models.BigIntegerField(default=0)),
+                ('zero_result_count', models.PositiveIntegerField(default=0)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'Query Stats',
+                'ordering': ['-search_count'],
+            },
+        ),
+        migrations.RunPython(backfill_query_stats, migrations.RunPython.noop),
+    ]
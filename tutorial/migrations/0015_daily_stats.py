@@ -0,0 +1,117 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:19
+
+import sys
+from array import array
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def unpack_ids(data):
+    # Frozen copy of tutorial.packing.unpack_ids: little-endian signed 64-bit
+    packed = array('q')
+    if data:
+        packed.frombytes(bytes(data))
+        if sys.byteorder != 'little':
+            packed.byteswap()
+    return packed.tolist()
+
+
+def backfill_daily_stats(apps, schema_editor):
+    # Same totals as `manage.py rebuild_daily_stats`, so the charts cover
+    # history from before the rollups existed
+    YoutubeVideo = apps.get_model('tutorial', 'YoutubeVideo')
+    ViewerHistory = apps.get_model('tutorial', 'ViewerHistory')
+    PageImpression = apps.get_model('tutorial', 'PageImpression')
+    SearchHistory = apps.get_model('tutorial', 'SearchHistory')
+    DailyVideoStats = apps.get_model('tutorial', 'DailyVideoStats')
+    DailySearchStats = apps.get_model('tutorial', 'DailySearchStats')
+
+    counts = Counter()
+    rows = (
+        ViewerHistory.objects.annotate(date=TruncDate('view_date'))
+        .values('date', 'video_id', 'page_type')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for row in rows.iterator(chunk_size=5000):
+        counts[row['date'], row['video_id'], row['page_type']] += row['count']
+
+    existing = set(YoutubeVideo.objects.values_list('id', flat=True))
+    impressions = PageImpression.objects.values_list('impression_date', 'video_ids')
+    for impression_date, video_ids in impressions.iterator(chunk_size=5000):
+        date = timezone.localdate(impression_date)
+        for video_id in set(unpack_ids(video_ids)):
+            if video_id in existing:
+                counts[date, video_id, 'list'] += 1
+
+    DailyVideoStats.objects.bulk_create(
+        (DailyVideoStats(date=date, video_id=video_id, page_type=page_type, count=count)
+         for (date, video_id, page_type), count in counts.items()),
+        batch_size=1000,
+    )
+
+    rows = (
+        SearchHistory.objects.annotate(date=TruncDate('search_date'))
+        .values('date')
+        .annotate(
+            search_count=Count('id'),
+            results_total=Sum('results_count'),
+            zero_result_count=Count('id', filter=Q(results_count=0)),
+        )
+        .order_by()
+    )
+    DailySearchStats.objects.bulk_create(
+        (DailySearchStats(
+            date=row['date'],
+            search_count=row['search_count'],
+            results_total=row['results_total'] or 0,
+            zero_result_count=row['zero_result_count'],
+        ) for row in rows.iterator(chunk_size=5000)),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0014_querystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySearchStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('search_count', models.PositiveIntegerField(default=0)),
+                ('results_total', models.BigIntegerField(default=0)),
+                ('zero_result_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Search Stats',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyVideoStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('page_type', models.CharField(choices=[('list', 'List Page'), ('detail', 'Detail Page')], max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='tutorial.youtubevideo')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Video Stats',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['video', 'date'], name='tutorial_da_video_i_7b4e02_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'video', 'page_type'), name='unique_daily_video_stats')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
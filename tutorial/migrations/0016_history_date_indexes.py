@@ -0,0 +1,27 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0015_daily_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='searchhistory',
+            index=models.Index(fields=['search_date'], name='tutorial_se_search__73f9bc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viewerhistory',
+            index=models.Index(fields=['view_date'], name='tutorial_vi_view_da_7b5dff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viewerhistory',
+            index=models.Index(fields=['video', 'view_date'], name='tutorial_vi_video_i_b5dfd5_idx'),
+        ),
+    ]
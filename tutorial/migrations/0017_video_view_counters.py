@@ -0,0 +1,66 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:21
+
+import sys
+from array import array
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def unpack_ids(data):
+    # Frozen copy of tutorial.packing.unpack_ids: little-endian signed 64-bit
+    packed = array('q')
+    if data:
+        packed.frombytes(bytes(data))
+        if sys.byteorder != 'little':
+            packed.byteswap()
+    return packed.tolist()
+
+
+def backfill_view_counters(apps, schema_editor):
+    YoutubeVideo = apps.get_model('tutorial', 'YoutubeVideo')
+    ViewerHistory = apps.get_model('tutorial', 'ViewerHistory')
+    PageImpression = apps.get_model('tutorial', 'PageImpression')
+
+    list_views = Counter()
+    detail_views = Counter()
+    rows = ViewerHistory.objects.values('video_id', 'page_type').annotate(count=Count('id')).order_by()
+    for row in rows.iterator(chunk_size=5000):
+        counter = list_views if row['page_type'] == 'list' else detail_views
+        counter[row['video_id']] += row['count']
+    impressions = PageImpression.objects.values_list('video_ids', flat=True)
+    for video_ids in impressions.iterator(chunk_size=5000):
+        list_views.update(set(unpack_ids(video_ids)))
+
+    videos = []
+    for video in YoutubeVideo.objects.only('id').iterator(chunk_size=2000):
+        video.list_view_count = list_views[video.pk]
+        video.detail_view_count = detail_views[video.pk]
+        video.view_count = video.list_view_count + video.detail_view_count
+        if video.view_count:
+            videos.append(video)
+    YoutubeVideo.objects.bulk_update(
+        videos, ['view_count', 'list_view_count', 'detail_view_count'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0016_history_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='youtubevideo',
+            name='detail_view_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='youtubevideo',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_view_counters, migrations.RunPython.noop),
+    ]
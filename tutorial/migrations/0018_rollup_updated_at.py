@@ -0,0 +1,24 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0017_video_view_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailysearchstats',
+            name='updated_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='dailyvideostats',
+            name='updated_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0018_rollup_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyQuerySketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('sketch', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyViewerSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('sketch', models.BinaryField()),
+                ('video', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tutorial.youtubevideo')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['video', 'date'], name='tutorial_da_video_i_a25919_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'video'), name='unique_daily_viewer_sketch'), models.UniqueConstraint(condition=models.Q(('video__isnull', True)), fields=('date',), name='unique_daily_site_viewer_sketch')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0019_hll_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeavyHitterBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stream', models.CharField(choices=[('query', 'Search queries'), ('video', 'Video views')], max_length=10)),
+                ('granularity', models.PositiveIntegerField(help_text='Bucket length in seconds')),
+                ('bucket_start', models.DateTimeField()),
+                ('counters', models.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ['-bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('stream', 'granularity', 'bucket_start'), name='unique_heavy_hitter_bucket')],
+            },
+        ),
+    ]
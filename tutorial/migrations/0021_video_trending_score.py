@@ -0,0 +1,49 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:30
+
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Same epoch and weighting as tutorial/trending.py at the time of writing
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def backfill_trending_scores(apps, schema_editor):
+    YoutubeVideo = apps.get_model('tutorial', 'YoutubeVideo')
+    ViewerHistory = apps.get_model('tutorial', 'ViewerHistory')
+
+    rate = math.log(2) / getattr(settings, 'TRENDING_HALF_LIFE', 2 * 24 * 3600)
+    scores = {}
+    rows = ViewerHistory.objects.filter(page_type='detail').order_by().values_list('video_id', 'view_date')
+    for video_id, view_date in rows.iterator(chunk_size=5000):
+        weight = rate * (view_date - EPOCH).total_seconds()
+        score = scores.get(video_id)
+        scores[video_id] = weight if score is None else max(score, weight) + math.log1p(math.exp(-abs(score - weight)))
+
+    videos = []
+    for video in YoutubeVideo.objects.filter(pk__in=scores).only('id').iterator(chunk_size=2000):
+        video.trending_score = scores[video.pk]
+        videos.append(video)
+    YoutubeVideo.objects.bulk_update(videos, ['trending_score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0020_heavy_hitters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='youtubevideo',
+            name='trending_score',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='youtubevideo',
+            index=models.Index(fields=['-trending_score', '-timestamp'], name='tutorial_yo_trendin_05278b_idx'),
+        ),
+        migrations.RunPython(backfill_trending_scores, migrations.RunPython.noop),
+    ]
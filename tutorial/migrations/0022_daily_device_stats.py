@@ -0,0 +1,53 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:53
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_device_stats(apps, schema_editor):
+    # Same totals as `manage.py rebuild_daily_stats`
+    ViewerHistory = apps.get_model('tutorial', 'ViewerHistory')
+    DailyDeviceStats = apps.get_model('tutorial', 'DailyDeviceStats')
+
+    rows = (
+        ViewerHistory.objects.annotate(
+            date=TruncDate('view_date'),
+            device_type=Coalesce('user_agent__device_type', Value('unknown')),
+        )
+        .values('date', 'device_type')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    DailyDeviceStats.objects.bulk_create(
+        (DailyDeviceStats(date=row['date'], device_type=row['device_type'], count=row['count'])
+         for row in rows.iterator(chunk_size=5000)),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0021_video_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDeviceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('device_type', models.CharField(choices=[('desktop', 'Desktop'), ('mobile', 'Mobile'), ('tablet', 'Tablet'), ('unknown', 'Unknown')], max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Device Stats',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'device_type'), name='unique_daily_device_stats')],
+            },
+        ),
+        migrations.RunPython(backfill_device_stats, migrations.RunPython.noop),
+    ]
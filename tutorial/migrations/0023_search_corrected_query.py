@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0022_daily_device_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchhistory',
+            name='corrected_query',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
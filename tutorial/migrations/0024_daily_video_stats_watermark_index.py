@@ -0,0 +1,17 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0023_search_corrected_query'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailyvideostats',
+            index=models.Index(fields=['page_type', 'updated_at'], name='tutorial_da_page_ty_7d1f77_idx'),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+from .packing import unpack_ids
 
 class YoutubeVideo(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -11,13 +14,55 @@ class YoutubeVideo(models.Model):
     timestamp_modified = models.DateTimeField(auto_now=True)
     password = models.CharField(max_length=128, blank=True, null=True)
     admin_notes = models.TextField(blank=True, null=True)
+    # Maintained with F() updates as views are written (tutorial/stats.py)
+    view_count = models.PositiveIntegerField(default=0, editable=False)
+    list_view_count = models.PositiveIntegerField(default=0, editable=False)
+    detail_view_count = models.PositiveIntegerField(default=0, editable=False)
+    # Log of the time-decayed detail view count (tutorial/trending.py)
+    trending_score = models.FloatField(default=0.0, editable=False)
+    
+    # Counts of raw history rows, which reconcile_view_counts can recompute
+    VIEW_COUNTER_FIELDS = ('view_count', 'list_view_count', 'detail_view_count')
+    # Everything save() must leave to the F() updates
+    COUNTER_FIELDS = VIEW_COUNTER_FIELDS + ('trending_score',)
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-trending_score', '-timestamp']),
+        ]
+    
+    def save(self, *args, **kwargs):
+        # Never write back counter values read before a concurrent increment
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return self.title
 
+class UserAgent(models.Model):
+    DEVICE_CHOICES = (
+        ('desktop', 'Desktop'),
+        ('mobile', 'Mobile'),
+        ('tablet', 'Tablet'),
+        ('unknown', 'Unknown'),
+    )
+    
+    # sha256 of the raw string; keeps the unique index small
+    user_agent_hash = models.CharField(max_length=64, unique=True)
+    user_agent = models.TextField()
+    device_type = models.CharField(max_length=10, choices=DEVICE_CHOICES, default='unknown', db_index=True)
+    browser = models.CharField(max_length=50, db_index=True)
+    os = models.CharField(max_length=50)
+    is_bot = models.BooleanField(default=False)
+    
+    def __str__(self):
+        return f"{self.browser} on {self.os} ({self.device_type})"
+
 class ViewerHistory(models.Model):
     PAGE_CHOICES = (
         ('list', 'List Page'),
@@ -27,13 +72,17 @@ class ViewerHistory(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
     video = models.ForeignKey(YoutubeVideo, on_delete=models.CASCADE)
     ip_address = models.GenericIPAddressField()
-    user_agent = models.TextField()
-    view_date = models.DateTimeField(auto_now_add=True)
+    user_agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    view_date = models.DateTimeField(default=timezone.now)
     page_type = models.CharField(max_length=10, choices=PAGE_CHOICES, default='detail')
     
     class Meta:
         ordering = ['-view_date']
         verbose_name_plural = 'Viewer Histories'
+        indexes = [
+            models.Index(fields=['view_date']),
+            models.Index(fields=['video', 'view_date']),
+        ]
     
     def __str__(self):
         return f"{self.video.title} viewed on {self.view_date}"
@@ -42,17 +91,175 @@ class SearchHistory(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
     query = models.CharField(max_length=255)
     ip_address = models.GenericIPAddressField()
-    user_agent = models.TextField()
+    user_agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    # Matches for the query as typed; 0 when only the typo fallback found any
     results_count = models.PositiveIntegerField(default=0)
-    search_date = models.DateTimeField(auto_now_add=True)
+    # Query the fallback searched instead, when it fired
+    corrected_query = models.CharField(max_length=255, blank=True)
+    # Ranked ids of the top results shown, packed (see tutorial/packing.py)
+    result_ids = models.BinaryField(default=b'', blank=True)
+    search_date = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ['-search_date']
         verbose_name_plural = 'Search Histories'
+        indexes = [
+            models.Index(fields=['search_date']),
+        ]
+    
+    @property
+    def result_id_list(self):
+        return unpack_ids(self.result_ids)
     
     def __str__(self):
         return f"Search: {self.query} ({self.search_date})"
 
+class QueryStats(models.Model):
+    # Running totals per normalized query, updated as searches are written
+    query = models.CharField(max_length=255, unique=True)
+    search_count = models.PositiveIntegerField(default=0, db_index=True)
+    results_total = models.BigIntegerField(default=0)
+    zero_result_count = models.PositiveIntegerField(default=0)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-search_count']
+        verbose_name_plural = 'Query Stats'
+    
+    @property
+    def avg_results(self):
+        return self.results_total / self.search_count if self.search_count else 0
+    
+    def __str__(self):
+        return f"{self.query} ({self.search_count} searches)"
+
+class DailyVideoStats(models.Model):
+    # Views per video, page type and day; list views come from page impressions
+    date = models.DateField()
+    video = models.ForeignKey(YoutubeVideo, on_delete=models.CASCADE, related_name='daily_stats')
+    page_type = models.CharField(max_length=10, choices=ViewerHistory.PAGE_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    # Last write; the newest one is the watermark behind chart ETags
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'Daily Video Stats'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'video', 'page_type'], name='unique_daily_video_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['video', 'date']),
+            # Per-page-type watermark (tutorial/view/t_charts.py)
+            models.Index(fields=['page_type', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.video_id} {self.page_type} on {self.date}: {self.count}"
+
+class DailySearchStats(models.Model):
+    date = models.DateField(unique=True)
+    search_count = models.PositiveIntegerField(default=0)
+    results_total = models.BigIntegerField(default=0)
+    zero_result_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'Daily Search Stats'
+    
+    def __str__(self):
+        return f"{self.search_count} searches on {self.date}"
+
+class DailyDeviceStats(models.Model):
+    # Views (both page types) per device type and day, for the device chart
+    date = models.DateField()
+    device_type = models.CharField(max_length=10, choices=UserAgent.DEVICE_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'Daily Device Stats'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'device_type'], name='unique_daily_device_stats'),
+        ]
+    
+    def __str__(self):
+        return f"{self.device_type} views on {self.date}: {self.count}"
+
+class DailyViewerSketch(models.Model):
+    # HyperLogLog of distinct viewers for one video and day; video is null
+    # for the site-wide sketch of the day (see tutorial/sketches.py)
+    date = models.DateField()
+    video = models.ForeignKey(YoutubeVideo, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    sketch = models.BinaryField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'video'], name='unique_daily_viewer_sketch'),
+            models.UniqueConstraint(fields=['date'], condition=models.Q(video__isnull=True),
+                                    name='unique_daily_site_viewer_sketch'),
+        ]
+        indexes = [
+            models.Index(fields=['video', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"Viewers of {self.video_id or 'all videos'} on {self.date}"
+
+class DailyQuerySketch(models.Model):
+    # HyperLogLog of distinct normalized queries for one day
+    date = models.DateField(unique=True)
+    sketch = models.BinaryField()
+    
+    def __str__(self):
+        return f"Queries on {self.date}"
+
+class HeavyHitterBucket(models.Model):
+    # Space-Saving summary of the most frequent queries or videos in one
+    # time bucket (see tutorial/heavy_hitters.py)
+    STREAM_CHOICES = (
+        ('query', 'Search queries'),
+        ('video', 'Video views'),
+    )
+    
+    stream = models.CharField(max_length=10, choices=STREAM_CHOICES)
+    granularity = models.PositiveIntegerField(help_text="Bucket length in seconds")
+    bucket_start = models.DateTimeField()
+    # item -> [count, error]
+    counters = models.JSONField(default=dict)
+    
+    class Meta:
+        ordering = ['-bucket_start']
+        constraints = [
+            models.UniqueConstraint(fields=['stream', 'granularity', 'bucket_start'], name='unique_heavy_hitter_bucket'),
+        ]
+    
+    def __str__(self):
+        return f"{self.stream} top items from {self.bucket_start}"
+
+class PageImpression(models.Model):
+    # One row per rendered list page, holding the ids of every video shown
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    ip_address = models.GenericIPAddressField()
+    user_agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    query = models.CharField(max_length=255, blank=True)
+    page_number = models.PositiveIntegerField(default=1)
+    video_ids = models.BinaryField()
+    impression_date = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        ordering = ['-impression_date']
+    
+    @property
+    def video_id_list(self):
+        return unpack_ids(self.video_ids)
+    
+    def __str__(self):
+        return f"Page {self.page_number} impression ({self.impression_date})"
+
 class SearchResult(models.Model):
     search = models.ForeignKey(SearchHistory, on_delete=models.CASCADE, related_name='results')
     video = models.ForeignKey(YoutubeVideo, on_delete=models.CASCADE)
@@ -62,4 +269,14 @@ class SearchResult(models.Model):
         ordering = ['position']
     
     def __str__(self):
-        return f"Result for {self.search.query}: {self.video.title}"
\ No newline at end of file
+        return f"Result for {self.search.query}: {self.video.title}"
+
+class SpoolCheckpoint(models.Model):
+    segment = models.CharField(max_length=255, unique=True)
+    offset = models.BigIntegerField(default=0)
+    events_loaded = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.segment} @ {self.offset}"
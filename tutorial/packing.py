@@ -0,0 +1,21 @@
+from array import array
+import sys
+
+# Video ids packed as little-endian signed 64-bit integers
+TYPECODE = 'q'
+
+
+def pack_ids(ids):
+    packed = array(TYPECODE, ids)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_ids(data):
+    packed = array(TYPECODE)
+    if data:
+        packed.frombytes(bytes(data))
+        if sys.byteorder != 'little':
+            packed.byteswap()
+    return packed.tolist()
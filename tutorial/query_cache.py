@@ -0,0 +1,126 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import YoutubeVideo
+from .search_index import get_search_index, search_index
+
+# This process' last reading of the catalog version: [version, monotonic time]
+_catalog = [None, 0.0]
+
+
+def normalize_query(query):
+    # Case-folded, whitespace-collapsed and token-sorted
+    return ' '.join(sorted(query.casefold().split()))
+
+
+def catalog_version():
+    # Derived from the catalog itself, so a save, delete or bulk update in
+    # any worker changes it for every worker (bulk updates must set
+    # timestamp_modified). Each process re-reads it at most every
+    # SEARCH_CATALOG_CHECK_INTERVAL seconds, which bounds how long another
+    # worker's change can go unseen.
+    version, read_at = _catalog
+    interval = getattr(settings, 'SEARCH_CATALOG_CHECK_INTERVAL', 5)
+    if version is None or time.monotonic() - read_at > interval:
+        catalog = YoutubeVideo.objects.aggregate(videos=Count('id'), modified=Max('timestamp_modified'))
+        modified = catalog['modified']
+        version = f"{catalog['videos']}-{int(modified.timestamp() * 1000000) if modified else 0}"
+        _catalog[:] = [version, time.monotonic()]
+    return version
+
+
+def bump_catalog_version():
+    # Re-read the version on the next search, so this worker sees its own
+    # change at once; cached result lists keyed with the old one become
+    # unreachable
+    _catalog[0] = None
+
+
+def advance_index_version(previous):
+    # After this process applied its own catalog change to the search
+    # index: if the index matched the catalog version from before the
+    # change, it matches the new one too, so its results stay cacheable
+    # without a rebuild
+    bump_catalog_version()
+    if search_index.built_at is not None and previous is not None and search_index.version == previous:
+        search_index.version = catalog_version()
+
+
+def search_ids(query, include_inactive=False, include_links=False):
+    # Ranked video ids for query, served from the cache when possible.
+    # Returns (ids, corrected query or None when no typo fallback was used).
+    normalized = normalize_query(query)
+    if not normalized:
+        return [], None
+
+    version = catalog_version()
+    scope = f"{int(include_inactive)}{int(include_links)}"
+    digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+    key = f"tutorial:search:{version}:{scope}:{digest}"
+
+    result = cache.get(key)
+    if result is None:
+        index = get_search_index(version)
+        result = index.fuzzy_search(
+            normalized, include_inactive=include_inactive, include_links=include_links
+        )
+        # The version is only a cache key: results from an index still
+        # missing another worker's change are served but not cached
+        if index.version == version:
+            cache.set(key, result, getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300))
+    return result
+
+
+class VideoIdList:
+    # Lazy, paginatable sequence over a ranked id list. Ids the queryset
+    # no longer matches (deleted or deactivated since they were ranked)
+    # are dropped first, so the length and page boundaries are exact. The
+    # surviving ids are cached per catalog version, so a cache hit costs
+    # one primary-key IN query for the requested page.
+
+    batch_size = 500
+
+    def __init__(self, queryset, ids):
+        self.queryset = queryset
+        self.ranked_ids = ids
+        self._ids = None
+
+    def _cache_key(self):
+        ranked = ','.join(map(str, self.ranked_ids))
+        digest = hashlib.sha1(f"{self.queryset.query}|{ranked}".encode('utf-8')).hexdigest()
+        return f"tutorial:search:live:{catalog_version()}:{digest}"
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            key = self._cache_key()
+            ids = cache.get(key)
+            if ids is None:
+                present = set()
+                for start in range(0, len(self.ranked_ids), self.batch_size):
+                    batch = self.ranked_ids[start:start + self.batch_size]
+                    present.update(self.queryset.filter(pk__in=batch).values_list('pk', flat=True))
+                ids = [pk for pk in self.ranked_ids if pk in present]
+                cache.set(key, ids, getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300))
+            self._ids = ids
+        return self._ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __bool__(self):
+        return bool(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            ids = self.ids[index]
+            videos = self.queryset.in_bulk(ids)
+            return [videos[pk] for pk in ids if pk in videos]
+        return self.queryset.get(pk=self.ids[index])
+
+    def __iter__(self):
+        return iter(self[:])
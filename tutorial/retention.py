@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .models import ViewerHistory
+
+# ViewerHistory rows converted to arrays per step; memory is bounded by
+# this plus the number of distinct users, viewers and (viewer, video) pairs,
+# never by the number of rows
+CHUNK_SIZE = 100000
+
+WEEK_SECONDS = 7 * 24 * 3600
+DAY_SECONDS = 24 * 3600
+# Mondays, so weekly cohorts line up with calendar weeks (1970-01-05 was one)
+EPOCH_MONDAY = 4 * DAY_SECONDS
+
+
+def _seconds(values):
+    # datetimes -> int64 unix seconds, vectorized through pandas
+    return pd.to_datetime(pd.Series(values, dtype=object), utc=True).to_numpy('datetime64[s]').astype(np.int64)
+
+
+def _week(seconds):
+    return (seconds - EPOCH_MONDAY) // WEEK_SECONDS
+
+
+def _week_start(week):
+    return datetime.fromtimestamp(int(week) * WEEK_SECONDS + EPOCH_MONDAY, tz=dt_timezone.utc).date()
+
+
+def view_chunks(queryset=None, chunk_size=CHUNK_SIZE):
+    # Stream ViewerHistory as DataFrames of typed columns: viewer (uint64
+    # hash of the user id, or of the IP for anonymous views), user_id
+    # (0 when anonymous), video_id and ts (unix seconds)
+    queryset = ViewerHistory.objects.all() if queryset is None else queryset
+    rows = queryset.order_by().values_list('user_id', 'ip_address', 'video_id', 'view_date')
+
+    batch = []
+    for row in rows.iterator(chunk_size=min(chunk_size, 10000)):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield _view_frame(batch)
+            batch = []
+    if batch:
+        yield _view_frame(batch)
+
+
+def _view_frame(rows):
+    user_ids, ips, video_ids, dates = zip(*rows)
+    user_ids = pd.array(user_ids, dtype='Int64').fillna(0).to_numpy(np.int64)
+    viewers = np.where(
+        user_ids > 0,
+        pd.util.hash_array(user_ids.astype(str).astype(object)),
+        pd.util.hash_array(np.asarray(ips, dtype=object)),
+    )
+    return pd.DataFrame({
+        'viewer': viewers.astype(np.uint64),
+        'user_id': user_ids,
+        'video_id': np.asarray(video_ids, dtype=np.int64),
+        'ts': _seconds(dates),
+    })
+
+
+def cohort_retention(weeks=12, since=None, chunk_size=CHUNK_SIZE):
+    # Weekly cohorts by CustomUser.registration_date. matrix[c][k] is the
+    # percentage of cohort c that viewed at least one video in week k
+    # after registering (week 0 is the registration week).
+    since = since or timezone.now() - timedelta(weeks=weeks)
+    users = get_user_model().objects.filter(registration_date__gte=since).order_by('pk')
+    user_rows = list(users.values_list('pk', 'registration_date'))
+    if not user_rows:
+        return {'cohorts': [], 'sizes': [], 'matrix': []}
+
+    user_ids = np.fromiter((pk for pk, _ in user_rows), dtype=np.int64, count=len(user_rows))
+    joined = _week(_seconds([date for _, date in user_rows]))
+    first_week = joined.min()
+    user_cohort = (joined - first_week).astype(np.int32)
+    cohort_count = int(user_cohort.max()) + 1
+
+    # active[u, k]: user u viewed something k weeks after joining
+    active = np.zeros((len(user_ids), weeks), dtype=bool)
+    views = ViewerHistory.objects.filter(user_id__in=users.values('pk'), view_date__gte=since)
+    for chunk in view_chunks(views, chunk_size):
+        index = np.searchsorted(user_ids, chunk['user_id'].to_numpy())
+        index = np.clip(index, 0, len(user_ids) - 1)
+        known = user_ids[index] == chunk['user_id'].to_numpy()
+        offset = _week(chunk['ts'].to_numpy()) - joined[index]
+        keep = known & (offset >= 0) & (offset < weeks)
+        active[index[keep], offset[keep]] = True
+
+    sizes = np.bincount(user_cohort, minlength=cohort_count)
+    retained = np.zeros((cohort_count, weeks), dtype=np.int64)
+    np.add.at(retained, user_cohort, active)
+
+    # Weeks a cohort has not reached yet are left out rather than shown as 0%
+    current_week = _week(np.int64(timezone.now().timestamp())) - first_week
+    matrix = []
+    for cohort in range(cohort_count):
+        reached = min(weeks, int(current_week - cohort) + 1)
+        if sizes[cohort]:
+            row = np.round(retained[cohort, :reached] * 100.0 / sizes[cohort], 1)
+        else:
+            row = np.zeros(reached)
+        matrix.append(row.tolist())
+
+    return {
+        'cohorts': [_week_start(first_week + cohort) for cohort in range(cohort_count)],
+        'sizes': sizes.tolist(),
+        'matrix': matrix,
+    }
+
+
+def video_retention(since=None, return_days=1, chunk_size=CHUNK_SIZE, queryset=None):
+    # Per video: viewers, repeat_viewers (viewed it more than once),
+    # repeat_rate, and retention, the share of its viewers who came back
+    # to watch anything at least return_days after first seeing it.
+    # Returns a DataFrame indexed by video_id.
+    views = ViewerHistory.objects.all() if queryset is None else queryset
+    if since is not None:
+        views = views.filter(view_date__gte=since)
+
+    def fold(pair_frames, last_frames):
+        pairs = pd.concat(pair_frames).groupby(level=[0, 1], sort=False).agg({'count': 'sum', 'min': 'min'})
+        last_seen = pd.concat(last_frames).groupby(level=0, sort=False).max()
+        return pairs, last_seen
+
+    pairs = last_seen = None
+    pending_pairs, pending_last = [], []
+    pending_size = 0
+    for chunk in view_chunks(views, chunk_size):
+        pending_pairs.append(chunk.groupby(['viewer', 'video_id'], sort=False)['ts'].agg(['count', 'min']))
+        pending_last.append(chunk.groupby('viewer', sort=False)['ts'].max())
+        pending_size += len(pending_pairs[-1])
+        # Fold chunk aggregates into the running totals once they are as
+        # large as the totals themselves, which keeps the merging linear
+        if pairs is None or pending_size >= len(pairs):
+            if pairs is not None:
+                pending_pairs.insert(0, pairs)
+                pending_last.insert(0, last_seen)
+            pairs, last_seen = fold(pending_pairs, pending_last)
+            pending_pairs, pending_last = [], []
+            pending_size = 0
+    if pending_pairs:
+        pairs, last_seen = fold([pairs, *pending_pairs], [last_seen, *pending_last])
+
+    columns = ['viewers', 'repeat_viewers', 'repeat_rate', 'retention']
+    if pairs is None:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='video_id', dtype=np.int64))
+
+    viewer_last = last_seen.reindex(pairs.index.get_level_values('viewer')).to_numpy()
+    frame = pd.DataFrame({
+        'video_id': pairs.index.get_level_values('video_id'),
+        'repeat': pairs['count'].to_numpy() > 1,
+        'returned': viewer_last >= pairs['min'].to_numpy() + return_days * DAY_SECONDS,
+    })
+    grouped = frame.groupby('video_id')
+    result = pd.DataFrame({
+        'viewers': grouped.size(),
+        'repeat_viewers': grouped['repeat'].sum(),
+    })
+    result['repeat_rate'] = result['repeat_viewers'] / result['viewers']
+    result['retention'] = grouped['returned'].mean()
+    return result[columns]
+
+
+def repeat_view_rate(since=None, chunk_size=CHUNK_SIZE):
+    # Site-wide share of (viewer, video) pairs with more than one view
+    retention = video_retention(since=since, chunk_size=chunk_size)
+    viewers = retention['viewers'].sum()
+    return float(retention['repeat_viewers'].sum() / viewers) if viewers else 0.0
@@ -0,0 +1,362 @@
+import bisect
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, IntegerField, When
+
+from .models import YoutubeVideo
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Title terms count this many times towards term frequency
+TITLE_WEIGHT = 3
+# Expansions of a query prefix ranked with BM25 (the exact term and the most
+# common ones); videos matching only rarer expansions still match, unscored
+MAX_PREFIX_EXPANSIONS = 50
+# Trigram postings scanned per misspelled token, which bounds fuzzy lookup cost
+MAX_TRIGRAM_CANDIDATES = 20000
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').casefold())
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def rebuild_marker():
+    # Touched by `manage.py rebuild_search_index`; workers rebuild when it is newer than their index
+    return getattr(settings, 'SEARCH_INDEX_REBUILD_MARKER', settings.BASE_DIR / '.search_index_rebuild')
+
+
+class SearchIndex:
+    # In-process inverted index over YoutubeVideo title and description,
+    # ranked with BM25. Link tokens are kept apart and only used by the
+    # admin search, which also matches on youtube_link.
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+        self.built_at = None
+        # Catalog version (tutorial.query_cache) this index reflects: read
+        # before the last build, and advanced by this process' own changes
+        self.version = None
+
+    def _clear(self):
+        self.postings = {}
+        self.link_postings = {}
+        self.doc_terms = {}
+        self.doc_links = {}
+        self.doc_lengths = {}
+        self.active = set()
+        self.total_length = 0
+        self._vocabulary = None
+        self._link_vocabulary = None
+        self._trigrams = None
+
+    # Maintenance
+
+    def build(self, videos, version=None):
+        # Index into a fresh copy so searches keep working during the build
+        fresh = SearchIndex()
+        for video in videos:
+            fresh._add(video)
+        with self._lock:
+            for name in ('postings', 'link_postings', 'doc_terms', 'doc_links', 'doc_lengths', 'active', 'total_length'):
+                setattr(self, name, getattr(fresh, name))
+            self._vocabulary = None
+            self._link_vocabulary = None
+            self._trigrams = None
+            self.built_at = time.time()
+            self.version = version
+
+    def add(self, video):
+        with self._lock:
+            self._remove(video.pk)
+            self._add(video)
+
+    def remove(self, video_id):
+        with self._lock:
+            self._remove(video_id)
+
+    def _add(self, video):
+        terms = Counter(tokenize(video.description))
+        for token in tokenize(video.title):
+            terms[token] += TITLE_WEIGHT
+        links = set(tokenize(video.youtube_link))
+
+        for token, frequency in terms.items():
+            if token not in self.postings and self._trigrams is not None:
+                for trigram in trigrams(token):
+                    self._trigrams.setdefault(trigram, set()).add(token)
+            self.postings.setdefault(token, {})[video.pk] = frequency
+        for token in links:
+            self.link_postings.setdefault(token, set()).add(video.pk)
+
+        self.doc_terms[video.pk] = terms
+        self.doc_links[video.pk] = links
+        length = sum(terms.values())
+        self.doc_lengths[video.pk] = length
+        self.total_length += length
+        if video.is_active:
+            self.active.add(video.pk)
+        self._vocabulary = None
+        self._link_vocabulary = None
+
+    def _remove(self, video_id):
+        terms = self.doc_terms.pop(video_id, None)
+        if terms is None:
+            return
+        for token in terms:
+            documents = self.postings.get(token)
+            if documents is not None:
+                documents.pop(video_id, None)
+                if not documents:
+                    del self.postings[token]
+                    if self._trigrams is not None:
+                        for trigram in trigrams(token):
+                            self._trigrams.get(trigram, set()).discard(token)
+        for token in self.doc_links.pop(video_id, ()):
+            documents = self.link_postings.get(token)
+            if documents is not None:
+                documents.discard(video_id)
+                if not documents:
+                    del self.link_postings[token]
+
+        self.total_length -= self.doc_lengths.pop(video_id, 0)
+        self.active.discard(video_id)
+        self._vocabulary = None
+        self._link_vocabulary = None
+
+    # Lookup
+
+    def vocabulary(self):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        return self._vocabulary
+
+    def link_vocabulary(self):
+        if self._link_vocabulary is None:
+            self._link_vocabulary = sorted(self.link_postings)
+        return self._link_vocabulary
+
+    def trigram_index(self):
+        # trigram -> vocabulary terms containing it; built on the first fuzzy
+        # lookup, then kept up to date by _add and _remove
+        if self._trigrams is None:
+            index = {}
+            for term in self.postings:
+                for trigram in trigrams(term):
+                    index.setdefault(trigram, set()).add(term)
+            self._trigrams = index
+        return self._trigrams
+
+    def closest_term(self, token, threshold):
+        # Vocabulary term with the highest trigram similarity to token
+        wanted = trigrams(token)
+        index = self.trigram_index()
+
+        shared = Counter()
+        scanned = 0
+        # Rare trigrams first: they are the most selective
+        for trigram in sorted(wanted, key=lambda trigram: len(index.get(trigram, ()))):
+            terms = index.get(trigram, ())
+            if scanned + len(terms) > MAX_TRIGRAM_CANDIDATES:
+                continue
+            scanned += len(terms)
+            shared.update(terms)
+
+        # Trigram Dice coefficient picks the candidates, and the closest
+        # spelling among them wins, so transposed letters still correct
+        candidates = [
+            term for term, count in shared.most_common(200)
+            if 2 * count / (len(wanted) + len(trigrams(term))) >= threshold
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda term: (SequenceMatcher(None, token, term).ratio(), -len(term)))
+
+    def correct(self, tokens, threshold):
+        # Replace tokens with no prefix match by their closest vocabulary term
+        corrected = []
+        changed = False
+        with self._lock:
+            vocabulary = self.vocabulary()
+            for token in tokens:
+                if self.expand(token, vocabulary) or len(token) < 3:
+                    corrected.append(token)
+                    continue
+                replacement = self.closest_term(token, threshold)
+                if replacement is None:
+                    return None
+                corrected.append(replacement)
+                changed = True
+        return corrected if changed else None
+
+    @staticmethod
+    def expand(prefix, vocabulary):
+        # Every vocabulary term starting with prefix
+        start = bisect.bisect_left(vocabulary, prefix)
+        end = bisect.bisect_left(vocabulary, prefix + '\U0010ffff', start)
+        return vocabulary[start:end]
+
+    def ranked_expansions(self, prefix):
+        # (expansions to score, expansions that only match); the exact term
+        # first, then the ones in the most documents
+        terms = self.expand(prefix, self.vocabulary())
+        if len(terms) <= MAX_PREFIX_EXPANSIONS:
+            return terms, []
+        terms = sorted(terms, key=lambda term: (term != prefix, -len(self.postings[term])))
+        return terms[:MAX_PREFIX_EXPANSIONS], terms[MAX_PREFIX_EXPANSIONS:]
+
+    def search(self, query, include_inactive=False, include_links=False, tokens=None):
+        # Ids of videos matching every query token (as a word prefix), best first
+        tokens = tokenize(query) if tokens is None else tokens
+        if not tokens:
+            return []
+
+        with self._lock:
+            document_count = len(self.doc_terms)
+            if not document_count:
+                return []
+            average_length = self.total_length / document_count or 1
+
+            scores = None
+            for token in dict.fromkeys(tokens):
+                token_scores = {}
+                scored, unscored = self.ranked_expansions(token)
+                for term in scored:
+                    documents = self.postings[term]
+                    idf = math.log(1 + (document_count - len(documents) + 0.5) / (len(documents) + 0.5))
+                    for video_id, frequency in documents.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[video_id] / average_length)
+                        score = idf * frequency * (self.k1 + 1) / (frequency + norm)
+                        token_scores[video_id] = token_scores.get(video_id, 0) + score
+                for term in unscored:
+                    for video_id in self.postings[term]:
+                        token_scores.setdefault(video_id, 0)
+
+                if include_links:
+                    for term in self.expand(token, self.link_vocabulary()):
+                        for video_id in self.link_postings[term]:
+                            token_scores.setdefault(video_id, 0)
+
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {video_id: score + token_scores[video_id]
+                              for video_id, score in scores.items() if video_id in token_scores}
+                if not scores:
+                    return []
+
+            if not include_inactive:
+                scores = {video_id: score for video_id, score in scores.items() if video_id in self.active}
+
+        # Highest score first; newer videos win ties
+        return sorted(scores, key=lambda video_id: (-scores[video_id], -video_id))
+
+    def fuzzy_search(self, query, threshold=None, **options):
+        # Exact search, falling back to typo-corrected tokens when nothing matches.
+        # Returns (ids, corrected query or None).
+        tokens = tokenize(query)
+        ids = self.search(query, tokens=tokens, **options)
+        if ids or not tokens:
+            return ids, None
+
+        if threshold is None:
+            threshold = getattr(settings, 'SEARCH_FUZZY_THRESHOLD', 0.4)
+        corrected = self.correct(tokens, threshold)
+        if corrected is None:
+            return [], None
+        return self.search(query, tokens=corrected, **options), ' '.join(corrected)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'documents': len(self.doc_terms),
+                'active': len(self.active),
+                'terms': len(self.postings),
+                'built_at': self.built_at,
+            }
+
+
+search_index = SearchIndex()
+_build_lock = threading.Lock()
+
+
+def _index_videos(index, version=None):
+    videos = YoutubeVideo.objects.only('id', 'title', 'description', 'youtube_link', 'is_active')
+    index.build(videos.iterator(chunk_size=2000), version)
+
+
+def _rebuild(version):
+    try:
+        _index_videos(search_index, version)
+    except Exception:
+        logger.exception("Failed to rebuild the search index")
+    finally:
+        _build_lock.release()
+        connections.close_all()
+
+
+def is_stale(index):
+    # Past SEARCH_INDEX_MAX_AGE or older than the rebuild marker. This
+    # process' own changes are applied in place by the signal handlers;
+    # other workers' reach it with the next rebuild.
+    max_age = getattr(settings, 'SEARCH_INDEX_MAX_AGE', 600)
+    if max_age and time.time() - index.built_at > max_age:
+        return True
+    try:
+        return os.stat(rebuild_marker()).st_mtime > index.built_at
+    except OSError:
+        return False
+
+
+def get_search_index(version=None):
+    # The first request builds the index while any others wait for it.
+    # Once stale, requests keep using this process' copy while a single
+    # background thread rebuilds it.
+    index = search_index
+    if index.built_at is None:
+        with _build_lock:
+            if index.built_at is None:
+                _index_videos(index, version)
+        return index
+
+    if is_stale(index) and _build_lock.acquire(blocking=False):
+        if is_stale(index):
+            threading.Thread(target=_rebuild, args=(version,), name='search-index-rebuild', daemon=True).start()
+        else:
+            _build_lock.release()
+    return index
+
+
+def reindex_videos(video_ids):
+    # For changes made with QuerySet.update(), which sends no signals
+    if search_index.built_at is None:
+        return
+    for video in YoutubeVideo.objects.filter(pk__in=video_ids):
+        search_index.add(video)
+
+
+def preserve_order(queryset, ids):
+    # Filter to ids and keep their order
+    if not ids:
+        return queryset.none()
+    ordering = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+    return queryset.filter(pk__in=ids).order_by(ordering)
@@ -0,0 +1,58 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .autocomplete import autocomplete
+from .models import YoutubeVideo
+from .query_cache import advance_index_version, catalog_version
+from .search_index import search_index
+
+
+def _suggested_title(video):
+    # The title autocomplete offers for a video, if any
+    return video.title if video.is_active else None
+
+
+def _remember_catalog_version(instance):
+    # The version the index reflects before this change, if it is built
+    instance._catalog_version = catalog_version() if search_index.built_at is not None else None
+
+
+@receiver(pre_save, sender=YoutubeVideo)
+def remember_suggested_title(sender, instance, **kwargs):
+    _remember_catalog_version(instance)
+    instance._suggested_title = None
+    if instance.pk is not None:
+        previous = sender.objects.filter(pk=instance.pk).only('title', 'is_active').first()
+        if previous is not None:
+            instance._suggested_title = _suggested_title(previous)
+
+
+@receiver(post_save, sender=YoutubeVideo)
+def index_video(sender, instance, **kwargs):
+    # Nothing to update until this process has built its index
+    if search_index.built_at is not None:
+        search_index.add(instance)
+    advance_index_version(getattr(instance, '_catalog_version', None))
+
+    # Only a create, rename, activation or deactivation changes the
+    # suggestions; other edits must not re-add the title's weight
+    old, new = getattr(instance, '_suggested_title', None), _suggested_title(instance)
+    if old != new:
+        if old:
+            autocomplete.remove_title(old)
+        if new:
+            autocomplete.add_title(new)
+
+
+@receiver(pre_delete, sender=YoutubeVideo)
+def remember_catalog_version(sender, instance, **kwargs):
+    _remember_catalog_version(instance)
+
+
+@receiver(post_delete, sender=YoutubeVideo)
+def unindex_video(sender, instance, **kwargs):
+    if search_index.built_at is not None:
+        search_index.remove(instance.pk)
+    advance_index_version(getattr(instance, '_catalog_version', None))
+    if instance.is_active:
+        autocomplete.remove_title(instance.title)
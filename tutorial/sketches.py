@@ -0,0 +1,148 @@
+import hashlib
+import math
+import zlib
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import DailyViewerSketch, DailyQuerySketch
+from .query_cache import normalize_query
+
+
+def _precision():
+    # 2**precision registers; standard error is about 1.04 / sqrt(2**precision)
+    return getattr(settings, 'HLL_PRECISION', 14)
+
+
+def _hash(value):
+    # Stable across processes and releases, unlike hash()
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    # Mergeable distinct-count sketch. Registers are stored zlib-compressed,
+    # so sparse sketches (most per-video days) take a few hundred bytes and
+    # a saturated one about 7 KB.
+
+    def __init__(self, precision=None, registers=None):
+        self.precision = precision or _precision()
+        self.m = 1 << self.precision
+        if registers is None:
+            registers = np.zeros(self.m, dtype=np.uint8)
+        self.registers = registers
+
+    def add(self, value):
+        h = _hash(value)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+    def to_bytes(self):
+        return zlib.compress(bytes([self.precision]) + self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        raw = zlib.decompress(data)
+        registers = np.frombuffer(raw, dtype=np.uint8, offset=1).copy()
+        return cls(precision=raw[0], registers=registers)
+
+
+def merged(sketches):
+    total = HyperLogLog()
+    for data in sketches:
+        total.merge(HyperLogLog.from_bytes(data))
+    return total
+
+
+def _merge_into(model, lookup, sketch):
+    # Registers only ever grow, so merging is idempotent; the row lock
+    # keeps concurrent writers from overwriting each other's registers
+    with transaction.atomic():
+        row = model.objects.select_for_update().filter(**lookup).first()
+        if row is None:
+            try:
+                with transaction.atomic():
+                    model.objects.create(**lookup, sketch=sketch.to_bytes())
+                return
+            except IntegrityError:
+                row = model.objects.select_for_update().get(**lookup)
+        row.sketch = HyperLogLog.from_bytes(row.sketch).merge(sketch).to_bytes()
+        row.save(update_fields=['sketch'])
+
+
+def viewer_key(event):
+    if event.get('user_id'):
+        return f"user:{event['user_id']}"
+    return f"ip:{event['ip_address']}"
+
+
+def record_viewers(events):
+    # One sketch per (day, video) and one per day across all videos
+    sketches = {}
+    for event in events:
+        date = timezone.localdate(event['view_date'])
+        key = viewer_key(event)
+        for video_id in (event['video_id'], None):
+            sketches.setdefault((date, video_id), HyperLogLog()).add(key)
+    for (date, video_id), sketch in sketches.items():
+        _merge_into(DailyViewerSketch, {'date': date, 'video_id': video_id}, sketch)
+
+
+def record_queries(events):
+    sketches = {}
+    for event in events:
+        query = normalize_query(event['query'])
+        if query:
+            sketches.setdefault(timezone.localdate(event['search_date']), HyperLogLog()).add(query)
+    for date, sketch in sketches.items():
+        _merge_into(DailyQuerySketch, {'date': date}, sketch)
+
+
+def _date_range(days):
+    today = timezone.localdate()
+    return today - timedelta(days=days), today
+
+
+def unique_viewers(days=30, video=None):
+    # Approximate distinct viewers (users, or IPs when anonymous) over the
+    # last `days` days plus today, for one video or the whole site
+    sketches = DailyViewerSketch.objects.filter(date__range=_date_range(days))
+    if video is None:
+        sketches = sketches.filter(video__isnull=True)
+    else:
+        sketches = sketches.filter(video=video)
+    return merged(sketches.values_list('sketch', flat=True).iterator()).count()
+
+
+def unique_queries(days=30):
+    sketches = DailyQuerySketch.objects.filter(date__range=_date_range(days))
+    return merged(sketches.values_list('sketch', flat=True).iterator()).count()
@@ -0,0 +1,56 @@
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot:
+    # A cached, periodically recomputed value. Once it is older than `ttl`
+    # seconds callers still get the stale copy while a single background
+    # thread (one per cache, guarded by a cache.add lock) recomputes it.
+    # Only the very first request, with nothing cached, waits for compute().
+
+    def __init__(self, key, compute, ttl):
+        self.key = key
+        self.compute = compute
+        self.ttl = ttl
+
+    @property
+    def lock_key(self):
+        return f"{self.key}:refreshing"
+
+    def get(self):
+        # Returns (value, unix time it was computed at)
+        snapshot = cache.get(self.key)
+        if snapshot is None:
+            return self.refresh()
+        if time.time() - snapshot['computed_at'] > self.ttl:
+            self.refresh_in_background()
+        return snapshot['value'], snapshot['computed_at']
+
+    def refresh(self):
+        computed_at = time.time()
+        value = self.compute()
+        # Kept well past the TTL so a stale copy is there to serve
+        cache.set(self.key, {'value': value, 'computed_at': computed_at}, None)
+        return value, computed_at
+
+    def refresh_in_background(self):
+        # The lock expires on its own should a refresh thread die
+        if not cache.add(self.lock_key, True, max(self.ttl, 60)):
+            return False
+        threading.Thread(target=self._refresh, name=f'snapshot-{self.key}', daemon=True).start()
+        return True
+
+    def _refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Failed to refresh snapshot %s", self.key)
+        finally:
+            cache.delete(self.lock_key)
+            connections.close_all()
@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+OPEN_SUFFIX = '.jsonl.open'
+CLOSED_SUFFIX = '.jsonl'
+
+# Payload fields stored as ISO strings in the spool
+DATETIME_FIELDS = ('view_date', 'search_date', 'impression_date', 'timestamp')
+
+
+def spool_dir():
+    return Path(getattr(settings, 'TRACKING_SPOOL_DIR', settings.BASE_DIR / 'spool'))
+
+
+def encode_event(kind, payload):
+    return json.dumps({'kind': kind, 'payload': payload}, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def decode_event(line):
+    record = json.loads(line)
+    payload = record['payload']
+    for field in DATETIME_FIELDS:
+        if isinstance(payload.get(field), str):
+            payload[field] = parse_datetime(payload[field])
+    return record['kind'], payload
+
+
+def closed_segments(directory=None):
+    directory = directory or spool_dir()
+    if not directory.exists():
+        return []
+    return sorted(path for path in directory.iterdir() if path.name.endswith(CLOSED_SUFFIX))
+
+
+def close_stale_segments(max_age, directory=None):
+    # Open segments left behind by workers that died without rotating
+    directory = directory or spool_dir()
+    if not directory.exists():
+        return []
+    closed = []
+    cutoff = time.time() - max_age
+    for path in directory.iterdir():
+        if path.name.endswith(OPEN_SUFFIX) and path.stat().st_mtime < cutoff:
+            target = path.with_name(path.name[:-len(OPEN_SUFFIX)] + CLOSED_SUFFIX)
+            path.rename(target)
+            closed.append(target)
+    return closed
+
+
+class SpoolWriter:
+    # Appends events to a per-process JSON-lines segment. A segment is
+    # renamed from *.jsonl.open to *.jsonl once it is full or old enough,
+    # and only closed segments are picked up by load_tracking_spool.
+
+    def __init__(self, directory=None, segment_bytes=None, segment_seconds=None):
+        self.directory = directory or spool_dir()
+        self.segment_bytes = segment_bytes or getattr(settings, 'TRACKING_SPOOL_SEGMENT_BYTES', 8 * 1024 * 1024)
+        self.segment_seconds = segment_seconds or getattr(settings, 'TRACKING_SPOOL_SEGMENT_SECONDS', 60)
+        self._file = None
+        self._path = None
+        self._opened_at = 0
+        self._sequence = 0
+
+    def append(self, events):
+        if not events:
+            return
+        if self._file is None:
+            self._open()
+
+        self._file.write(''.join(encode_event(kind, payload) + '\n' for kind, payload in events))
+        # One fsync per batch rather than per event
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        if self._file.tell() >= self.segment_bytes:
+            self.rotate()
+
+    def maybe_rotate(self):
+        if self._file is not None and time.monotonic() - self._opened_at >= self.segment_seconds:
+            self.rotate()
+
+    def rotate(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._path.rename(self._path.with_name(self._path.name[:-len(OPEN_SUFFIX)] + CLOSED_SUFFIX))
+        self._file = None
+        self._path = None
+
+    close = rotate
+
+    def _open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._sequence += 1
+        name = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{self._sequence:06d}{OPEN_SUFFIX}"
+        self._path = self.directory / name
+        self._file = open(self._path, 'a', encoding='utf-8')
+        self._opened_at = time.monotonic()
@@ -0,0 +1,207 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import (
+    YoutubeVideo, UserAgent, ViewerHistory, PageImpression, QueryStats, DailyVideoStats, DailySearchStats,
+    DailyDeviceStats,
+)
+from .packing import unpack_ids
+from .query_cache import normalize_query
+
+
+def _upsert(model, lookup, updates, create, exists=True):
+    # UPDATE the row matching lookup, creating it on first sight. The
+    # updates are F() expressions, so concurrent writers never lose counts.
+    # exists=False skips the UPDATE for a row the caller knows is missing.
+    if exists and model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **create)
+    except IntegrityError:
+        # Another process created the row first
+        model.objects.filter(**lookup).update(**updates)
+
+
+def _increment(model, lookup, counts, **values):
+    # Add counts to the row's fields and set the plain values
+    updates = {field: F(field) + amount for field, amount in counts.items()}
+    _upsert(model, lookup, {**updates, **values}, {**counts, **values})
+
+
+def _query_totals(events):
+    # normalized query -> [searches, results, zero-result searches, first, last]
+    totals = {}
+    for event in events:
+        query = normalize_query(event['query'])[:255]
+        if not query:
+            continue
+        date = event['search_date']
+        entry = totals.get(query)
+        if entry is None:
+            totals[query] = [1, event['results_count'], int(not event['results_count']), date, date]
+        else:
+            entry[0] += 1
+            entry[1] += event['results_count']
+            entry[2] += int(not event['results_count'])
+            entry[3] = min(entry[3], date)
+            entry[4] = max(entry[4], date)
+    return totals
+
+
+def record_searches(events):
+    # Fold a batch of search payloads into QueryStats and DailySearchStats,
+    # one UPDATE per distinct query and day in the batch
+    for query, (searches, results, zero_results, first_seen, last_seen) in _query_totals(events).items():
+        _upsert(
+            QueryStats,
+            {'query': query},
+            {
+                'search_count': F('search_count') + searches,
+                'results_total': F('results_total') + results,
+                'zero_result_count': F('zero_result_count') + zero_results,
+                'first_seen': Least(F('first_seen'), first_seen),
+                'last_seen': Greatest(F('last_seen'), last_seen),
+            },
+            {
+                'search_count': searches,
+                'results_total': results,
+                'zero_result_count': zero_results,
+                'first_seen': first_seen,
+                'last_seen': last_seen,
+            },
+        )
+
+    days = {}
+    for event in events:
+        totals = days.setdefault(timezone.localdate(event['search_date']), Counter())
+        totals['search_count'] += 1
+        totals['results_total'] += event['results_count']
+        totals['zero_result_count'] += int(not event['results_count'])
+    now = timezone.now()
+    for date, totals in days.items():
+        _increment(DailySearchStats, {'date': date}, dict(totals), updated_at=now)
+
+
+def _add_video_views(counts):
+    # counts: (date, video id, page type) -> views. Updates the daily
+    # rollups and the per-video counters, one UPDATE per video for the latter.
+    videos = {}
+    now = timezone.now()
+    for (date, video_id, page_type), count in counts.items():
+        _increment(
+            DailyVideoStats,
+            {'date': date, 'video_id': video_id, 'page_type': page_type},
+            {'count': count},
+            updated_at=now,
+        )
+        videos.setdefault(video_id, Counter())[page_type] += count
+
+    for video_id, views in videos.items():
+        YoutubeVideo.objects.filter(pk=video_id).update(
+            view_count=F('view_count') + sum(views.values()),
+            list_view_count=F('list_view_count') + views['list'],
+            detail_view_count=F('detail_view_count') + views['detail'],
+        )
+
+
+def record_views(events):
+    _add_video_views(Counter(
+        (timezone.localdate(event['view_date']), event['video_id'], event['page_type'])
+        for event in events
+    ))
+
+
+def record_devices(rows):
+    # rows are view payloads carrying user_agent_id (see tracking._with_agent_ids)
+    devices = dict(
+        UserAgent.objects.filter(pk__in={row['user_agent_id'] for row in rows}).values_list('id', 'device_type')
+    )
+    counts = Counter(
+        (timezone.localdate(row['view_date']), devices.get(row['user_agent_id'], 'unknown'))
+        for row in rows
+    )
+    now = timezone.now()
+    for (date, device_type), count in counts.items():
+        _increment(DailyDeviceStats, {'date': date, 'device_type': device_type}, {'count': count}, updated_at=now)
+
+
+def record_impressions(events):
+    # Every video shown on a rendered list page counts as one list view
+    _add_video_views(Counter(
+        (timezone.localdate(event['impression_date']), video_id, 'list')
+        for event in events
+        for video_id in set(event['video_ids'])
+    ))
+
+
+def raw_view_totals():
+    # video id -> page type -> views, counted from raw ViewerHistory and
+    # PageImpression the way record_views and record_impressions count them
+    totals = {}
+    rows = ViewerHistory.objects.values('video_id', 'page_type').annotate(count=Count('id')).order_by()
+    for row in rows.iterator(chunk_size=5000):
+        totals.setdefault(row['video_id'], Counter())[row['page_type']] += row['count']
+    # Impressions only hold packed ids, so they are counted here rather than in SQL
+    impressions = PageImpression.objects.values_list('video_ids', flat=True)
+    for video_ids in impressions.iterator(chunk_size=5000):
+        for video_id in set(unpack_ids(video_ids)):
+            totals.setdefault(video_id, Counter())['list'] += 1
+    return totals
+
+
+def reconcile_view_counts():
+    # Bring every video's view counters back in line with raw history.
+    # The videos are locked first, so a batch being written shows up in
+    # both the history and the counters or in neither, and the difference
+    # is applied as an F() increment rather than written back as a value.
+    # Returns the number of videos whose counters had drifted.
+    fields = YoutubeVideo.VIEW_COUNTER_FIELDS
+    with transaction.atomic():
+        counters = list(YoutubeVideo.objects.select_for_update().order_by('pk').values_list('pk', *fields))
+        totals = raw_view_totals()
+
+        drifted = 0
+        for video_id, *values in counters:
+            views = totals.get(video_id, Counter())
+            expected = {
+                'view_count': sum(views.values()),
+                'list_view_count': views['list'],
+                'detail_view_count': views['detail'],
+            }
+            deltas = {field: expected[field] - value for field, value in zip(fields, values) if expected[field] != value}
+            if deltas:
+                YoutubeVideo.objects.filter(pk=video_id).update(
+                    **{field: F(field) + delta for field, delta in deltas.items()}
+                )
+                drifted += 1
+    return drifted
+
+
+def search_totals():
+    # Totals across every query, read from QueryStats instead of SearchHistory
+    totals = QueryStats.objects.aggregate(
+        searches=Sum('search_count'),
+        results=Sum('results_total'),
+        queries=Count('id'),
+    )
+    searches = totals['searches'] or 0
+    return {
+        'total_searches': searches,
+        'avg_results': (totals['results'] or 0) / searches if searches else 0,
+        'unique_queries': totals['queries'],
+    }
+
+
+def popular_queries(limit=10):
+    return QueryStats.objects.order_by('-search_count').values('query', count=F('search_count'))[:limit]
+
+
+def stats_watermark(model, **filters):
+    # Time of the newest write to a rollup table, or to its rows matching
+    # filters (None while there are none)
+    return model.objects.filter(**filters).aggregate(watermark=Max('updated_at'))['watermark']
@@ -1,3 +1,1011 @@
-from django.test import TestCase
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    YoutubeVideo, ViewerHistory, SearchHistory, PageImpression, SpoolCheckpoint, QueryStats, DailyVideoStats,
+    DailySearchStats, DailyDeviceStats, UserAgent,
+)
+from .packing import pack_ids, unpack_ids
+from .stats import popular_queries, reconcile_view_counts, record_searches, search_totals
+from .timeseries import DAY, HOUR, WEEK, bucket_labels, time_series
+from .spool import SpoolWriter, closed_segments
+from . import query_cache, retention, search_index, tracking
+from .agents import UserAgentCache, agent_cache, intern_user_agents, parse_user_agent
+from .sketches import HyperLogLog, record_viewers, unique_viewers
+from .heavy_hitters import VIDEOS, HeavyHitters, SpaceSaving, top_items
+from .dedup import ViewDeduplicator
+from .trending import TrendingScores, compute_scores, decayed_views, logaddexp, trending, view_weight
+from .autocomplete import QUERY_WEIGHT, CompletionTrie, autocomplete, build_trie, suggest
+from .view.t_admin import dashboard_stats
+
+User = get_user_model()
+
+
+def make_video(title='Django tips', **kwargs):
+    user = User.objects.first() or User.objects.create(username='author', email='author@example.com')
+    return YoutubeVideo.objects.create(
+        user=user, title=title, description='x', youtube_link='https://youtu.be/x', **kwargs
+    )
+
+
+class SpoolLoaderTests(TestCase):
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.settings_override = override_settings(TRACKING_SPOOL_DIR=self.directory)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.video = make_video()
+
+    def spool_views(self, count):
+        writer = SpoolWriter(directory=self.directory)
+        writer.append([('view', {
+            'user_id': None,
+            'ip_address': f'10.0.0.{i}',
+            'user_agent': 'test-agent',
+            'video_id': self.video.pk,
+            'page_type': 'detail',
+            'view_date': timezone.now(),
+        }) for i in range(count)])
+        writer.close()
+
+    def test_resumes_from_checkpoint_after_failed_batch(self):
+        self.spool_views(5)
+        write_views = tracking.write_views
+        calls = []
+
+        def fail_second_batch(events):
+            calls.append(len(events))
+            write_views(events)
+            if len(calls) == 2:
+                raise RuntimeError("database went away")
+
+        hitters = mock.patch('tutorial.tracking.record_view_hitters')
+        with hitters as record_view_hitters, mock.patch.dict(tracking.WRITERS, {'view': fail_second_batch}):
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(RuntimeError):
+                    call_command('load_tracking_spool', batch_size=2, stdout=mock.Mock())
+
+        # The first batch and its checkpoint committed; the second rolled
+        # back, along with its heavy-hitter update
+        self.assertEqual(ViewerHistory.objects.count(), 2)
+        checkpoint = SpoolCheckpoint.objects.get()
+        self.assertEqual(checkpoint.events_loaded, 2)
+        self.assertFalse(checkpoint.completed)
+        self.assertEqual(sum(len(call.args[0]) for call in record_view_hitters.call_args_list), 2)
+
+        call_command('load_tracking_spool', batch_size=2, stdout=mock.Mock())
+        self.assertEqual(ViewerHistory.objects.count(), 5)
+        self.assertEqual(sorted(ViewerHistory.objects.values_list('ip_address', flat=True)),
+                         [f'10.0.0.{i}' for i in range(5)])
+        # Loaded segments take their checkpoints with them
+        self.assertEqual(closed_segments(self.directory), [])
+        self.assertFalse(SpoolCheckpoint.objects.exists())
+
+    def test_keep_leaves_segment_and_skips_it_next_time(self):
+        self.spool_views(3)
+        call_command('load_tracking_spool', keep=True, stdout=mock.Mock())
+        call_command('load_tracking_spool', keep=True, stdout=mock.Mock())
+        self.assertEqual(ViewerHistory.objects.count(), 3)
+        self.assertTrue(SpoolCheckpoint.objects.get().completed)
+
+    def test_prunes_checkpoints_of_deleted_segments(self):
+        SpoolCheckpoint.objects.create(segment='gone.jsonl', offset=10, completed=True)
+        call_command('load_tracking_spool', stdout=mock.Mock())
+        self.assertFalse(SpoolCheckpoint.objects.exists())
+
+
+@mock.patch.object(tracking.EventWriter, '_start')
+class EventWriterPolicyTests(TestCase):
+
+    def test_drop_oldest_keeps_newest_events(self, start):
+        writer = tracking.EventWriter(max_queue=2, policy=tracking.DROP_OLDEST)
+        for i in range(3):
+            self.assertTrue(writer.put('view', i))
+        with mock.patch('tutorial.tracking.persist_events', return_value=0) as persist:
+            writer.flush()
+        persist.assert_called_once_with([('view', 1), ('view', 2)])
+        stats = writer.stats()
+        self.assertEqual((stats['queued'], stats['dropped'], stats['written']), (3, 1, 2))
+
+    def test_block_gives_up_after_timeout(self, start):
+        writer = tracking.EventWriter(max_queue=1, policy=tracking.BLOCK, block_timeout=0.01)
+        self.assertTrue(writer.put('view', 1))
+        self.assertFalse(writer.put('view', 2))
+        self.assertEqual(writer.stats()['dropped'], 1)
+        self.assertEqual(writer.stats()['pending'], 1)
+
+    def test_sample_thins_events_once_half_full(self, start):
+        writer = tracking.EventWriter(max_queue=4, policy=tracking.SAMPLE, sample_rate=0.5)
+        with mock.patch('tutorial.tracking.random.random', side_effect=[0.9, 0.1]):
+            for i in range(4):
+                writer.put('view', i)
+        # The first two went in unsampled; of the rest one lost the draw
+        stats = writer.stats()
+        self.assertEqual((stats['queued'], stats['sampled_out'], stats['pending']), (3, 1, 3))
+
+    def test_failed_writes_are_counted(self, start):
+        writer = tracking.EventWriter(max_queue=10)
+        writer.put('view', 1)
+        writer.put('search', 2)
+        with mock.patch.dict(tracking.WRITERS, {'view': mock.Mock(), 'search': mock.Mock(side_effect=RuntimeError)}):
+            writer.flush()
+        stats = writer.stats()
+        self.assertEqual((stats['written'], stats['failed'], stats['pending']), (1, 1, 0))
+
+    def test_explicit_zero_settings_are_kept(self, start):
+        writer = tracking.EventWriter(max_queue=4, policy=tracking.SAMPLE,
+                                      sample_rate=0, flush_interval=0, block_timeout=0)
+        self.assertEqual((writer.sample_rate, writer.flush_interval, writer.block_timeout), (0, 0, 0))
+        for i in range(4):
+            writer.put('view', i)
+        # A zero sample rate drops everything past half full
+        stats = writer.stats()
+        self.assertEqual((stats['queued'], stats['sampled_out']), (2, 2))
+
+    def test_writer_thread_survives_a_failed_round(self, start):
+        writer = tracking.EventWriter(flush_interval=0)
+        # SystemExit ends the loop once the round after the failure has run
+        write_pending = mock.patch.object(writer, '_write_pending', side_effect=[RuntimeError, 0, SystemExit])
+        with write_pending as rounds, mock.patch('tutorial.tracking.connections'):
+            with self.assertLogs('tutorial.tracking', 'ERROR'):
+                thread = threading.Thread(target=writer._run)
+                thread.start()
+                thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(rounds.call_count, 3)
+
+
+@mock.patch.object(tracking.EventWriter, '_start')
+class EventWriterFlushTests(TestCase):
+
+    def setUp(self):
+        self.video = make_video()
+        self.addCleanup(agent_cache.clear)
+        agent_cache.clear()
+
+    def view(self, i):
+        return {
+            'user_id': None,
+            'ip_address': f'10.0.0.{i}',
+            'user_agent': 'test-agent',
+            'video_id': self.video.pk,
+            'page_type': 'detail',
+            'view_date': timezone.now(),
+        }
+
+    def test_views_are_buffered_until_flushed_in_one_batch(self, start):
+        writer = tracking.EventWriter(max_queue=10)
+        for i in range(3):
+            writer.put('view', self.view(i))
+        self.assertFalse(ViewerHistory.objects.exists())
+        self.assertEqual(writer.stats()['pending'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(writer.flush(), 3)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "tutorial_viewerhistory"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ViewerHistory.objects.count(), 3)
+        self.assertEqual(writer.flush(), 0)
+
+    def test_close_writes_out_queued_and_partial_batches(self, start):
+        writer = tracking.EventWriter(max_queue=10)
+        writer.put('view', self.view(1))
+        writer.put('view', self.view(2))
+        # One event already taken off the queue by the writer thread
+        writer._pending.append(writer._queue.get_nowait())
+
+        persist_hitters = mock.patch.object(tracking.heavy_hitters, 'persist')
+        persist_trending = mock.patch.object(tracking.trending_scores, 'persist')
+        with persist_hitters as hitters, persist_trending as trending_persist:
+            with self.captureOnCommitCallbacks(execute=True):
+                writer.close()
+        hitters.assert_called_once_with()
+        trending_persist.assert_called_once_with()
+        stats = writer.stats()
+        self.assertEqual((stats['queued'], stats['written'], stats['failed'], stats['pending']), (2, 2, 0, 0))
+        self.assertEqual(ViewerHistory.objects.count(), 2)
+
+
+def indexed_video(pk, title, description='', is_active=True):
+    return SimpleNamespace(pk=pk, title=title, description=description,
+                           youtube_link=f'https://youtu.be/v{pk}', is_active=is_active)
+
+
+class SearchIndexTests(TestCase):
+
+    def test_short_prefix_matches_past_the_scored_expansions(self):
+        index = search_index.SearchIndex()
+        count = search_index.MAX_PREFIX_EXPANSIONS + 30
+        index.build([indexed_video(pk, f'py{pk:03d} tutorial') for pk in range(1, count + 1)])
+        self.assertEqual(sorted(index.search('py')), list(range(1, count + 1)))
+        self.assertEqual(index.search('py007'), [7])
+
+    def test_stale_index_is_rebuilt_once_in_the_background(self):
+        release = threading.Event()
+        builds = []
+
+        def slow_build(index, version=None):
+            builds.append(threading.current_thread().name)
+            release.wait(5)
+            index.built_at = time.time()
+
+        index = search_index.search_index
+        self.addCleanup(setattr, index, 'built_at', index.built_at)
+        index.built_at = time.time() - 3600
+        with mock.patch.object(search_index, '_index_videos', slow_build), \
+                mock.patch.object(search_index.connections, 'close_all'):
+            served = [search_index.get_search_index() for _ in range(5)]
+            release.set()
+            for _ in range(50):
+                if not search_index._build_lock.locked():
+                    break
+                time.sleep(0.01)
+        self.assertTrue(all(result is index for result in served))
+        self.assertEqual(builds, ['search-index-rebuild'])
+
+
+class QueryCacheTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(query_cache.bump_catalog_version)
+        query_cache.bump_catalog_version()
+
+    @override_settings(SEARCH_CATALOG_CHECK_INTERVAL=0)
+    def test_catalog_version_follows_changes_made_elsewhere(self):
+        video = make_video()
+        version = query_cache.catalog_version()
+        self.assertEqual(query_cache.catalog_version(), version)
+        # Another worker's bulk update: no signal reaches this process
+        YoutubeVideo.objects.filter(pk=video.pk).update(is_active=False, timestamp_modified=timezone.now())
+        self.assertNotEqual(query_cache.catalog_version(), version)
+
+    @override_settings(SEARCH_CATALOG_CHECK_INTERVAL=60)
+    def test_catalog_version_is_reread_at_most_once_per_interval(self):
+        make_video()
+        version = query_cache.catalog_version()
+        with self.assertNumQueries(0):
+            self.assertEqual(query_cache.catalog_version(), version)
+
+    def build_index(self):
+        index = search_index.search_index
+        self.addCleanup(setattr, index, 'built_at', None)
+        search_index._index_videos(index, query_cache.catalog_version())
+        return index
+
+    @override_settings(SEARCH_CATALOG_CHECK_INTERVAL=60)
+    def test_own_changes_keep_the_index_current(self):
+        cache.clear()
+        make_video('Django tips')
+        index = self.build_index()
+        video = make_video('Flask basics')
+        video.title = 'Flask in depth'
+        video.save()
+        make_video('Old news').delete()
+        self.assertEqual(index.version, query_cache.catalog_version())
+
+        with mock.patch.object(search_index.threading, 'Thread') as thread:
+            self.assertEqual(query_cache.search_ids('flask depth'), ([video.pk], None))
+        thread.assert_not_called()
+        # Cached under the current version
+        with self.assertNumQueries(0):
+            self.assertEqual(query_cache.search_ids('flask depth'), ([video.pk], None))
+
+    @override_settings(SEARCH_CATALOG_CHECK_INTERVAL=0)
+    def test_other_workers_changes_are_served_but_not_cached(self):
+        cache.clear()
+        video = make_video('Django tips')
+        index = self.build_index()
+        # No signal reaches this process
+        YoutubeVideo.objects.filter(pk=video.pk).update(title='Flask tips', timestamp_modified=timezone.now())
+        with mock.patch.object(search_index.threading, 'Thread') as thread, \
+                mock.patch.object(query_cache.cache, 'set') as cache_set:
+            self.assertEqual(query_cache.search_ids('django'), ([video.pk], None))
+        thread.assert_not_called()
+        cache_set.assert_not_called()
+        self.assertNotEqual(index.version, query_cache.catalog_version())
+
+    @override_settings(SEARCH_CATALOG_CHECK_INTERVAL=60)
+    def test_video_id_list_pages_cost_one_query_once_cached(self):
+        cache.clear()
+        videos = [make_video(f'Video {i}') for i in range(3)]
+        queryset = YoutubeVideo.objects.filter(is_active=True)
+        ranked = [video.pk for video in videos] + [10 ** 6]
+        self.assertEqual(len(query_cache.VideoIdList(queryset, ranked)), 3)
+        results = query_cache.VideoIdList(queryset, ranked)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(results), 3)
+            self.assertEqual([video.pk for video in results[1:3]], ranked[1:3])
+
+    def test_video_id_list_skips_videos_gone_from_the_queryset(self):
+        videos = [make_video(f'Video {i}') for i in range(5)]
+        videos[1].is_active = False
+        videos[1].save()
+        ranked = [video.pk for video in reversed(videos)] + [10 ** 6]
+        results = query_cache.VideoIdList(YoutubeVideo.objects.filter(is_active=True), ranked)
+        self.assertEqual(len(results), 4)
+        self.assertEqual([video.pk for video in results[:4]],
+                         [videos[4].pk, videos[3].pk, videos[2].pk, videos[0].pk])
+
+
+class AutocompleteTests(TestCase):
+
+    def test_insert_adds_up_weights_and_keeps_top_k(self):
+        trie = CompletionTrie(k=2)
+        trie.insert('django', 1)
+        trie.insert('data', 2)
+        trie.insert('dash')
+        trie.insert('django', 2)
+        trie.insert('')
+        self.assertEqual(trie.weights, {'django': 3, 'data': 2, 'dash': 1})
+        self.assertEqual(trie.complete('d'), ['django', 'data'])
+        self.assertEqual(trie.complete('da'), ['data', 'dash'])
+        self.assertEqual(trie.complete('d', limit=1), ['django'])
+        self.assertEqual(trie.complete('flask'), [])
+        self.assertEqual(len(trie), 3)
+
+    def test_suggest_weights_queries_that_found_something(self):
+        make_video('Django tips')
+        now = timezone.now()
+        QueryStats.objects.create(query='django rest', search_count=3, zero_result_count=1,
+                                  first_seen=now, last_seen=now)
+        QueryStats.objects.create(query='djngo', search_count=4, zero_result_count=4,
+                                  first_seen=now, last_seen=now)
+        self.addCleanup(setattr, autocomplete, 'trie', None)
+        autocomplete.trie = None
+
+        self.assertEqual(suggest('  DJ '), ['django rest', 'django'])
+        self.assertEqual(autocomplete.trie.weights['django rest'], 2 * QUERY_WEIGHT)
+        self.assertEqual(suggest('djn'), [])
+        self.assertEqual(suggest('   '), [])
+
+    def test_removing_weight_lets_crowded_out_terms_back(self):
+        trie = CompletionTrie(k=2)
+        for term, weight in (('pandas', 5), ('python', 4), ('pytest', 3), ('panda', 1)):
+            trie.insert(term, weight)
+        self.assertEqual(trie.complete('p'), ['pandas', 'python'])
+        trie.remove('pandas', 3)
+        self.assertEqual(trie.complete('p'), ['python', 'pytest'])
+        trie.remove('python')
+        self.assertEqual(trie.complete('p'), ['pytest', 'pandas'])
+        self.assertEqual(trie.complete('pyth'), [])
+        self.assertNotIn('python', trie.weights)
+
+    def test_only_title_changes_touch_the_suggestions(self):
+        video = make_video('Django tips')
+        self.addCleanup(setattr, autocomplete, 'trie', None)
+        autocomplete._swap(build_trie())
+        trie = autocomplete.trie
+
+        video.description = 'edited'
+        video.save()
+        self.assertEqual(trie.weights['django'], 1)
+
+        video.title = 'Flask tips'
+        video.save()
+        self.assertNotIn('django', trie.weights)
+        self.assertEqual((trie.weights['flask'], trie.weights['tips']), (1, 1))
+
+        video.is_active = False
+        video.save()
+        self.assertNotIn('flask', trie.weights)
+
+        video.is_active = True
+        video.save()
+        video.delete()
+        self.assertEqual(trie.complete('fl'), [])
+
+    def test_limit_is_capped_at_top_k(self):
+        autocomplete.trie = CompletionTrie(k=20)
+        autocomplete.built_at = time.time()
+        self.addCleanup(setattr, autocomplete, 'trie', None)
+        for i in range(15):
+            autocomplete.trie.insert(f'python{i:02d}')
+        with override_settings(AUTOCOMPLETE_TOP_K=12):
+            response = self.client.get(reverse('youtube:autocomplete'), {'q': 'py', 'limit': 50})
+        self.assertEqual(len(response.json()['suggestions']), 12)
+
+
+class SearchStatsTests(TestCase):
+
+    def search(self, query, results_count, minutes=0):
+        return {
+            'query': query,
+            'results_count': results_count,
+            'search_date': timezone.make_aware(datetime(2026, 3, 2, 9, 0)) + timedelta(minutes=minutes),
+        }
+
+    def test_searches_fold_into_query_and_daily_totals(self):
+        record_searches([self.search('Django  tips', 3, 5), self.search('flask', 2), self.search('   ', 0)])
+        record_searches([self.search('tips django', 0, 1), self.search('flask', 4, 9)])
+
+        self.assertEqual(
+            sorted(QueryStats.objects.values_list('query', 'search_count', 'results_total', 'zero_result_count')),
+            [('django tips', 2, 3, 1), ('flask', 2, 6, 0)],
+        )
+        flask = QueryStats.objects.get(query='flask')
+        self.assertEqual((flask.last_seen - flask.first_seen), timedelta(minutes=9))
+        self.assertEqual(flask.avg_results, 3)
+        # Blank queries still count towards the day
+        day = DailySearchStats.objects.get()
+        self.assertEqual((day.search_count, day.results_total, day.zero_result_count), (5, 9, 2))
+
+    def test_totals_and_popular_queries(self):
+        self.assertEqual(search_totals(), {'total_searches': 0, 'avg_results': 0, 'unique_queries': 0})
+        record_searches([self.search('flask', 1)] + [self.search('django', 2)] * 3 + [self.search('pandas', 0)] * 2)
+        self.assertEqual(search_totals(), {'total_searches': 6, 'avg_results': 7 / 6, 'unique_queries': 3})
+        self.assertEqual(list(popular_queries(2)), [{'query': 'django', 'count': 3}, {'query': 'pandas', 'count': 2}])
+
+    def test_dashboard_reads_query_totals(self):
+        record_searches([self.search('django', 1)] * 2)
+        with CaptureQueriesContext(connection) as queries:
+            stats = dashboard_stats()
+        self.assertEqual(stats['total_searches'], 2)
+        self.assertFalse([query for query in queries if 'tutorial_searchhistory' in query['sql']])
+
+
+class ReconcileViewCountsTests(TestCase):
+
+    def test_counters_follow_raw_history_without_rollups(self):
+        first, second = make_video('First'), make_video('Second')
+        for page_type in ('detail', 'detail', 'list'):
+            ViewerHistory.objects.create(video=first, ip_address='10.0.0.1', page_type=page_type)
+        PageImpression.objects.create(ip_address='10.0.0.1', video_ids=pack_ids([first.pk, second.pk, first.pk]))
+        YoutubeVideo.objects.filter(pk=second.pk).update(view_count=9, list_view_count=9)
+
+        self.assertEqual(reconcile_view_counts(), 2)
+        counters = dict(YoutubeVideo.objects.values_list('pk', 'view_count'))
+        self.assertEqual(counters, {first.pk: 4, second.pk: 1})
+        first.refresh_from_db()
+        self.assertEqual((first.list_view_count, first.detail_view_count), (2, 2))
+        self.assertEqual(reconcile_view_counts(), 0)
+
+    def test_trending_score_is_left_alone(self):
+        video = make_video()
+        ViewerHistory.objects.create(video=video, ip_address='10.0.0.1')
+        YoutubeVideo.objects.filter(pk=video.pk).update(trending_score=42.0)
+        reconcile_view_counts()
+        video.refresh_from_db()
+        self.assertEqual((video.view_count, video.trending_score), (1, 42.0))
+
+
+class TimeSeriesTests(TestCase):
+
+    def setUp(self):
+        self.video = make_video()
+        self.end = timezone.make_aware(datetime(2026, 3, 11, 15, 30))
+        self.start = self.end - timedelta(days=5)
+
+    def view(self, moment, page_type='detail'):
+        ViewerHistory.objects.create(video=self.video, ip_address='10.0.0.1', view_date=moment, page_type=page_type)
+
+    def test_raw_history_is_zero_filled_per_day(self):
+        self.view(self.end - timedelta(days=4))
+        self.view(self.end - timedelta(days=4))
+        self.view(self.end)
+        self.view(self.start - timedelta(days=1))  # outside the range
+        buckets, values = time_series(ViewerHistory, 'view_date', DAY, self.start, self.end)
+        self.assertEqual(bucket_labels(buckets), [
+            '2026-03-06', '2026-03-07', '2026-03-08', '2026-03-09', '2026-03-10', '2026-03-11',
+        ])
+        self.assertEqual(values, [0, 2, 0, 0, 0, 1])
+
+    def test_hours_are_zero_filled(self):
+        self.view(self.end - timedelta(hours=2))
+        buckets, values = time_series(ViewerHistory, 'view_date', HOUR, self.end - timedelta(hours=3), self.end)
+        self.assertEqual(values, [0, 1, 0, 0])
+        self.assertEqual(bucket_labels(buckets, HOUR)[0], '2026-03-11 12:00')
+
+    def test_rollups_sum_and_filter_into_weeks(self):
+        for day, page_type, count in ((2, 'detail', 3), (2, 'list', 50), (9, 'detail', 4)):
+            DailyVideoStats.objects.create(
+                video=self.video, date=date(2026, 3, day), page_type=page_type, count=count,
+            )
+        buckets, values = time_series(
+            DailyVideoStats, 'date', WEEK, self.end - timedelta(days=21), self.end,
+            total=Sum('count'), page_type='detail',
+        )
+        self.assertEqual(buckets, [date(2026, 2, 16), date(2026, 2, 23), date(2026, 3, 2), date(2026, 3, 9)])
+        self.assertEqual(values, [0, 0, 3, 4])
+
+    def test_rollups_have_no_hours(self):
+        with self.assertRaises(ValueError):
+            time_series(DailyVideoStats, 'date', HOUR, self.start, self.end, total=Sum('count'))
+
+
+IPHONE = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148 Safari/604.1'
+DESKTOP = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36'
+
+
+IPAD = 'Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Version/17.0 Mobile/15E148 Safari/604.1'
+GOOGLEBOT = 'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'
+
+
+class UserAgentTests(TestCase):
+
+    def setUp(self):
+        # Ids cached by earlier tests belong to rolled-back rows
+        self.addCleanup(agent_cache.clear)
+        agent_cache.clear()
+
+    def test_device_types(self):
+        self.assertEqual(parse_user_agent(IPHONE),
+                         {'device_type': 'mobile', 'browser': 'Mobile Safari', 'os': 'iOS', 'is_bot': False})
+        self.assertEqual(parse_user_agent(DESKTOP)['device_type'], 'desktop')
+        self.assertEqual(parse_user_agent(DESKTOP)['browser'], 'Chrome')
+        self.assertEqual(parse_user_agent(IPAD)['device_type'], 'tablet')
+        self.assertTrue(parse_user_agent(GOOGLEBOT)['is_bot'])
+        self.assertEqual(parse_user_agent('')['device_type'], 'unknown')
+
+    def test_existing_agents_are_reused(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = intern_user_agents([IPHONE, DESKTOP, IPHONE])
+        self.assertEqual(UserAgent.objects.count(), 2)
+        self.assertEqual(UserAgent.objects.get(pk=ids[IPHONE]).device_type, 'mobile')
+        # Cached after the commit
+        with self.assertNumQueries(0):
+            self.assertEqual(intern_user_agents([DESKTOP]), {DESKTOP: ids[DESKTOP]})
+        # Rows found again after the cache is lost
+        agent_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(intern_user_agents([IPHONE, IPAD])[IPHONE], ids[IPHONE])
+        self.assertEqual(UserAgent.objects.count(), 3)
+
+    def test_rolled_back_agents_are_not_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                intern_user_agents([IPHONE])
+                raise RuntimeError
+        self.assertIsNone(agent_cache.get(IPHONE))
+        self.assertFalse(UserAgent.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = intern_user_agents([IPHONE])
+        self.assertEqual(agent_cache.get(IPHONE), ids[IPHONE])
+        self.assertEqual(UserAgent.objects.get().pk, ids[IPHONE])
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = UserAgentCache(max_size=2)
+        cache.update({'a': 1, 'b': 2})
+        cache.get('a')
+        cache.update({'c': 3})
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+
+class ChartTests(TestCase):
+
+    def setUp(self):
+        self.video = make_video()
+        self.client.force_login(User.objects.create(username='viewer', email='viewer@example.com'))
+        self.addCleanup(query_cache.bump_catalog_version)
+        query_cache.bump_catalog_version()
+        # Ids cached by earlier tests belong to rolled-back rows
+        self.addCleanup(agent_cache.clear)
+        agent_cache.clear()
+
+    def write_views(self, *user_agents):
+        with self.captureOnCommitCallbacks(execute=True):
+            tracking.write_views([{
+                'user_id': None,
+                'ip_address': '10.0.0.1',
+                'user_agent': user_agent,
+                'video_id': self.video.pk,
+                'page_type': 'detail',
+                'view_date': timezone.now(),
+            } for user_agent in user_agents])
+
+    def test_rename_changes_views_per_video_etag(self):
+        url = reverse('youtube:chart_video_views')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.video.title = 'Django tricks'
+        self.video.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['videos'][0]['title'], 'Django tricks')
+
+    def test_deletion_changes_views_per_video_etag(self):
+        make_video('Pandas basics').delete()
+        url = reverse('youtube:chart_video_views')
+        etag = self.client.get(url)['ETag']
+        query_cache.bump_catalog_version()
+        self.video.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_device_breakdown_reads_the_rollup(self):
+        self.write_views(IPHONE, IPHONE, DESKTOP)
+        self.assertEqual(
+            dict(DailyDeviceStats.objects.values_list('device_type', 'count')), {'mobile': 2, 'desktop': 1},
+        )
+        # Raw history is not consulted
+        ViewerHistory.objects.all().delete()
+        response = self.client.get(reverse('youtube:chart_devices'))
+        self.assertEqual(response.json()['devices'], [
+            {'device_type': 'mobile', 'count': 2},
+            {'device_type': 'desktop', 'count': 1},
+        ])
+
+    def test_new_views_change_device_breakdown_etag(self):
+        self.write_views(DESKTOP)
+        url = reverse('youtube:chart_devices')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.write_views(IPHONE)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_impressions_keep_views_over_time_etag(self):
+        self.write_views(DESKTOP)
+        url = reverse('youtube:chart_views')
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            tracking.write_impressions([{
+                'user_id': None,
+                'ip_address': '10.0.0.1',
+                'user_agent': DESKTOP,
+                'query': '',
+                'page_number': 1,
+                'video_ids': [self.video.pk],
+                'impression_date': timezone.now(),
+            }])
+        self.assertTrue(DailyVideoStats.objects.filter(page_type='list').exists())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.write_views(IPHONE)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_rebuild_matches_the_live_rollup(self):
+        self.write_views(IPHONE, DESKTOP, DESKTOP)
+        live = set(DailyDeviceStats.objects.values_list('date', 'device_type', 'count'))
+        call_command('rebuild_daily_stats', stdout=open(os.devnull, 'w'))
+        self.assertEqual(set(DailyDeviceStats.objects.values_list('date', 'device_type', 'count')), live)
+
+
+class HyperLogLogTests(TestCase):
+
+    def test_small_counts_are_nearly_exact(self):
+        sketch = HyperLogLog().update(f'user:{i}' for i in range(100))
+        sketch.update(f'user:{i}' for i in range(100))  # repeats don't count
+        self.assertAlmostEqual(sketch.count(), 100, delta=2)
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_large_counts_are_within_the_standard_error(self):
+        sketch = HyperLogLog(precision=12).update(f'ip:{i}' for i in range(50000))
+        # 3 standard errors of 1.04 / sqrt(2**12)
+        self.assertAlmostEqual(sketch.count(), 50000, delta=50000 * 3 * 1.04 / 64)
+
+    def test_merge_counts_the_union(self):
+        first = HyperLogLog(precision=12).update(f'user:{i}' for i in range(0, 6000))
+        second = HyperLogLog(precision=12).update(f'user:{i}' for i in range(4000, 10000))
+        union = HyperLogLog(precision=12).update(f'user:{i}' for i in range(10000))
+        merged = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+        self.assertEqual(merged.count(), union.count())
+        # Merging is idempotent
+        self.assertEqual(merged.merge(second).merge(first).count(), union.count())
+
+    def test_round_trip_and_precision_mismatch(self):
+        sketch = HyperLogLog(precision=10).update(['a', 'b', 'c'])
+        restored = HyperLogLog.from_bytes(sketch.to_bytes())
+        self.assertEqual(restored.precision, 10)
+        self.assertEqual(restored.count(), sketch.count())
+        with self.assertRaises(ValueError):
+            restored.merge(HyperLogLog(precision=11))
+
+    def test_daily_sketches_merge_across_batches_and_days(self):
+        video = make_video()
+        now = timezone.now()
+
+        def views(ips, when):
+            return [
+                {'user_id': None, 'ip_address': ip, 'video_id': video.pk, 'view_date': when}
+                for ip in ips
+            ]
+
+        record_viewers(views([f'10.0.0.{i}' for i in range(30)], now))
+        record_viewers(views([f'10.0.0.{i}' for i in range(20, 50)], now))
+        record_viewers(views([f'10.0.0.{i}' for i in range(40, 60)], now - timedelta(days=1)))
+        self.assertAlmostEqual(unique_viewers(days=7, video=video), 60, delta=2)
+        self.assertAlmostEqual(unique_viewers(days=7), 60, delta=2)
+        self.assertAlmostEqual(unique_viewers(days=0, video=video), 50, delta=2)
+
+
+class SpaceSavingTests(TestCase):
+
+    def stream(self, seed, length=5000):
+        # Zipf-like: item i is drawn with weight 1 / i
+        items = [f'item{i}' for i in range(1, 201)]
+        return random.Random(seed).choices(items, weights=[1 / i for i in range(1, 201)], k=length)
+
+    def summarize(self, items, capacity):
+        summary = SpaceSaving(capacity)
+        for item in items:
+            summary.offer(item)
+        return summary
+
+    def assertBounds(self, summary, truth):
+        total = sum(truth.values())
+        for item, (count, error) in summary.counters.items():
+            self.assertGreaterEqual(count, truth[item])
+            self.assertLessEqual(count - error, truth[item])
+        for item, seen in truth.items():
+            if seen > total / summary.capacity:
+                self.assertIn(item, summary.counters)
+
+    def test_counts_are_exact_below_capacity(self):
+        first = self.summarize(['a', 'b', 'a'], capacity=5)
+        second = self.summarize(['a', 'c'], capacity=5)
+        first.merge(second)
+        self.assertEqual(first.counters, {'a': [3, 0], 'b': [1, 0], 'c': [1, 0]})
+        self.assertEqual(first.floor(), 0)
+
+    def test_merge_keeps_the_space_saving_guarantees(self):
+        first, second = self.stream(1), self.stream(2)
+        merged = self.summarize(first, capacity=20).merge(self.summarize(second, capacity=20))
+        self.assertEqual(len(merged.counters), 20)
+        self.assertBounds(merged, Counter(first) + Counter(second))
+        self.assertEqual(merged.top(1)[0]['item'], 'item1')
+
+    def test_merge_charges_missing_items_the_other_floor(self):
+        full = self.summarize(['a', 'a', 'a', 'b', 'b', 'c'], capacity=2)
+        # 'c' took over 'b' and its count of 2
+        self.assertEqual(full.counters, {'a': [3, 0], 'c': [3, 2]})
+        self.assertEqual(full.floor(), 3)
+        merged = SpaceSaving(2, {'d': [5, 0]}).merge(full)
+        # 'd' may have been among full's evicted items, up to its floor
+        self.assertEqual(merged.counters['d'], [8, 3])
+
+    def test_buckets_merge_across_persists(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        hitters = HeavyHitters()
+        now = timezone.now()
+        first, second = self.stream(3, 2000), self.stream(4, 2000)
+        with override_settings(HEAVY_HITTERS_CAPACITY=20):
+            hitters.offer(VIDEOS, ((item, now) for item in first))
+            hitters.persist()
+            hitters.offer(VIDEOS, ((item, now) for item in second))
+            hitters.persist()
+            top = top_items(VIDEOS, 'hour', limit=3)
+        truth = Counter(first) + Counter(second)
+        self.assertEqual(top[0]['item'], 'item1')
+        for hitter in top:
+            self.assertGreaterEqual(hitter['count'], truth[hitter['item']])
+            self.assertLessEqual(hitter['count'] - hitter['error'], truth[hitter['item']])
+
+
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.make_aware(datetime(2026, 3, 18, 12, 0))
+        patcher = mock.patch.object(retention.timezone, 'now', return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.videos = [make_video('Django tips'), make_video('Flask tips')]
+        # The videos' author registered long before any cohort shown
+        User.objects.update(registration_date=self.now - timedelta(weeks=20))
+
+    def user(self, name, registered):
+        user = User.objects.create(username=name, email=f'{name}@example.com')
+        User.objects.filter(pk=user.pk).update(registration_date=self.at(registered))
+        return user
+
+    def at(self, day, hours=0):
+        return timezone.make_aware(datetime(2026, 3, day, 9, 0)) + timedelta(hours=hours)
+
+    def view(self, user, video, day, hours=0, ip='10.0.0.1'):
+        ViewerHistory.objects.create(user=user, video=self.videos[video], ip_address=ip, view_date=self.at(day, hours))
+
+    def test_cohort_matrix(self):
+        # Cohorts start on the Mondays 2 and 9 March; now is in the week of the 16th
+        first, second, late = self.user('first', 3), self.user('second', 4), self.user('late', 10)
+        for user, day in ((first, 4), (first, 11), (second, 5), (second, 17), (late, 10), (late, 16)):
+            self.view(user, 0, day)
+        self.view(None, 0, 4, ip='10.0.0.9')
+
+        expected = {
+            'cohorts': [date(2026, 3, 2), date(2026, 3, 9)],
+            'sizes': [2, 1],
+            # The second cohort has only reached its week 1
+            'matrix': [[100.0, 50.0, 50.0], [100.0, 100.0]],
+        }
+        self.assertEqual(retention.cohort_retention(weeks=3), expected)
+        self.assertEqual(retention.cohort_retention(weeks=3, chunk_size=2), expected)
+        self.assertEqual(retention.cohort_retention(weeks=3, since=self.now), {'cohorts': [], 'sizes': [], 'matrix': []})
+
+    def test_repeat_views_and_returns(self):
+        viewer = self.user('viewer', 2)
+        self.view(viewer, 0, 3)
+        self.view(viewer, 0, 3, hours=1)
+        self.view(viewer, 1, 5)
+        self.view(None, 0, 3, ip='10.0.0.9')
+
+        for chunk_size in (retention.CHUNK_SIZE, 1):
+            with self.subTest(chunk_size=chunk_size):
+                videos = retention.video_retention(chunk_size=chunk_size)
+                self.assertEqual(videos.loc[self.videos[0].pk].tolist(), [2, 1, 0.5, 0.5])
+                self.assertEqual(videos.loc[self.videos[1].pk].tolist(), [1, 0, 0.0, 0.0])
+                self.assertAlmostEqual(retention.repeat_view_rate(chunk_size=chunk_size), 1 / 3)
+        self.assertEqual(retention.repeat_view_rate(since=self.now), 0.0)
+
+        out = StringIO()
+        call_command('retention_report', weeks=3, chunk_size=2, stdout=out)
+        report = out.getvalue()
+        self.assertIn('2026-03-02      1  100.0  0.0    0.0', report)
+        self.assertRegex(report, r'Django tips +2 +50.0% +50.0%')
+
+
+@override_settings(TRENDING_HALF_LIFE=3600)
+class TrendingTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def views(self, video, *hours_ago):
+        for hours in hours_ago:
+            ViewerHistory.objects.create(
+                video=video, ip_address='10.0.0.1', page_type='detail',
+                view_date=self.now - timedelta(hours=hours),
+            )
+        return [(video.pk, self.now - timedelta(hours=hours)) for hours in hours_ago]
+
+    def test_logaddexp_does_not_overflow(self):
+        self.assertAlmostEqual(logaddexp(None, 5.0), 5.0)
+        self.assertAlmostEqual(logaddexp(0.0, 0.0), math.log(2))
+        # exp(1e4) overflows a float
+        self.assertAlmostEqual(logaddexp(1e4, 1e4 - math.log(3)), 1e4 + math.log(4 / 3))
+
+    def test_views_halve_every_half_life(self):
+        score = logaddexp(view_weight(self.now), view_weight(self.now - timedelta(hours=1)))
+        self.assertAlmostEqual(decayed_views(score, self.now), 1.5)
+        self.assertAlmostEqual(decayed_views(score, self.now + timedelta(hours=2)), 0.375)
+        self.assertEqual(decayed_views(0.0, self.now), 0.0)
+
+    def test_sql_logaddexp_matches_python(self):
+        video = make_video()
+        scores = TrendingScores()
+        # Two persists, so the second adds to a stored score in SQL
+        scores.offer(self.views(video, 5, 3))
+        scores.persist()
+        scores.offer(self.views(video, 1, 0))
+        scores.persist()
+        video.refresh_from_db()
+        self.assertAlmostEqual(video.trending_score, compute_scores()[video.pk], places=9)
+        self.assertAlmostEqual(decayed_views(video.trending_score, self.now), 1 + 0.5 + 0.125 + 0.03125, places=9)
+
+    def test_recent_views_outrank_older_ones(self):
+        old, recent = make_video('Old hit'), make_video('New hit')
+        scores = TrendingScores()
+        scores.offer(self.views(old, 10, 10, 10, 10, 10, 10, 10, 10))
+        scores.offer(self.views(recent, 0, 1))
+        scores.persist()
+        self.assertEqual(list(trending()), [recent, old])
+
+    def test_other_sort_is_a_new_impression(self):
+        make_video()
+        with mock.patch.object(tracking, 'view_dedup', ViewDeduplicator(window=300)), \
+                mock.patch.object(tracking.event_writer, 'put', return_value=True) as put:
+            self.client.get('/')
+            self.client.get('/?sort=trending')
+            self.client.get('/')
+        self.assertEqual([call.args[0] for call in put.call_args_list].count('impression'), 2)
+
+
+class TypoFallbackTests(TestCase):
+
+    def setUp(self):
+        self.index = search_index.SearchIndex()
+        self.index.build([
+            indexed_video(1, 'hello world'),
+            indexed_video(2, 'django tips'),
+            indexed_video(3, 'hidden gems', is_active=False),
+        ])
+
+    def test_correct_replaces_only_unmatched_tokens(self):
+        self.assertEqual(self.index.correct(['helo', 'wrld'], 0.4), ['hello', 'world'])
+        # 'djang' is a prefix of a term, so it is kept
+        self.assertEqual(self.index.correct(['djang', 'tipz'], 0.4), ['djang', 'tips'])
+        self.assertIsNone(self.index.correct(['hello'], 0.4))
+        self.assertIsNone(self.index.correct(['qqqqqq'], 0.4))
+
+    def test_fuzzy_search_falls_back_only_without_exact_matches(self):
+        self.assertEqual(self.index.fuzzy_search('hello'), ([1], None))
+        self.assertEqual(self.index.fuzzy_search('helo wrld'), ([1], 'hello world'))
+        self.assertEqual(self.index.fuzzy_search('qqqqqq'), ([], None))
+        # Inactive videos stay hidden behind the fallback too
+        self.assertEqual(self.index.fuzzy_search('hiden'), ([], 'hidden'))
+        self.assertEqual(self.index.fuzzy_search('hiden', include_inactive=True), ([3], 'hidden'))
+
+    def test_fallback_search_is_recorded_as_zero_results(self):
+        video = make_video('hello world')
+        with mock.patch('tutorial.view.t_user.search_ids', return_value=([video.pk], 'hello')), \
+                mock.patch.object(tracking.event_writer, 'put', return_value=True) as put:
+            response = self.client.get('/', {'q': 'helo'})
+        self.assertEqual(response.context['corrected_query'], 'hello')
+        (payload,) = [call.args[1] for call in put.call_args_list if call.args[0] == 'search']
+        self.assertEqual((payload['results_count'], payload['corrected_query'], payload['result_ids']),
+                         (0, 'hello', [video.pk]))
+
+        tracking.write_searches([payload, dict(payload, query='hello', results_count=1, corrected_query='')])
+        self.assertEqual(SearchHistory.objects.get(query='helo').corrected_query, 'hello')
+        self.assertEqual(QueryStats.objects.get(query='helo').zero_result_count, 1)
+        self.assertEqual(DailySearchStats.objects.get().zero_result_count, 1)
+        # Typos are never offered as completions
+        self.assertEqual(build_trie().complete('hel'), ['hello'])
+
+
+class ImpressionTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(agent_cache.clear)
+        agent_cache.clear()
+
+    def impression(self, video_ids):
+        return {
+            'user_id': None,
+            'ip_address': '10.0.0.1',
+            'user_agent': 'test-agent',
+            'query': '',
+            'page_number': 1,
+            'video_ids': video_ids,
+            'impression_date': timezone.now(),
+        }
+
+    def test_ids_pack_as_little_endian_int64(self):
+        self.assertEqual(pack_ids([1, 258]), b'\x01' + b'\x00' * 7 + b'\x02\x01' + b'\x00' * 6)
+        ids = [5, 2 ** 40, 3, 5]
+        self.assertEqual(unpack_ids(pack_ids(ids)), ids)
+        self.assertEqual(unpack_ids(memoryview(pack_ids(ids))), ids)
+        self.assertEqual(unpack_ids(b''), [])
+        self.assertEqual(unpack_ids(None), [])
+
+    def test_impressions_store_the_page_and_count_list_views(self):
+        first, second = make_video('First'), make_video('Second')
+        gone = make_video('Gone')
+        gone_id = gone.pk
+        gone.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            tracking.write_impressions([
+                self.impression([second.pk, first.pk, second.pk]),
+                self.impression([first.pk, gone_id]),
+            ])
+        self.assertEqual(
+            sorted(unpack_ids(ids) for ids in PageImpression.objects.values_list('video_ids', flat=True)),
+            [[first.pk, gone_id], [second.pk, first.pk, second.pk]],
+        )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        # A video repeated on one page is one list view
+        self.assertEqual((first.list_view_count, second.list_view_count), (2, 1))
+
+    def test_admin_page_reads_the_counter(self):
+        video = make_video()
+        with self.captureOnCommitCallbacks(execute=True):
+            tracking.write_impressions([self.impression([video.pk]) for _ in range(3)])
+        self.client.force_login(User.objects.create(username='staff', email='staff@example.com', is_staff=True))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('youtube:video_detail', args=[video.pk]))
+        self.assertEqual(response.context['list_view_count'], 3)
+        self.assertFalse(any('tutorial_pageimpression' in query['sql'] for query in queries))
 
-# Create your tests here.
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+from django.db import models
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+
+HOUR = 'hour'
+DAY = 'day'
+WEEK = 'week'
+MONTH = 'month'
+
+TRUNCATE = {
+    HOUR: TruncHour,
+    DAY: TruncDay,
+    WEEK: TruncWeek,
+    MONTH: TruncMonth,
+}
+
+LABEL_FORMATS = {
+    HOUR: '%Y-%m-%d %H:00',
+    DAY: '%Y-%m-%d',
+    WEEK: '%Y-%m-%d',
+    MONTH: '%Y-%m',
+}
+
+
+def bucket_for(start, end):
+    # Sensible bucket size for a range: hours up to two days, then days,
+    # weeks beyond four months
+    span = end - start
+    if span <= timedelta(days=2):
+        return HOUR
+    if span <= timedelta(days=120):
+        return DAY
+    return WEEK
+
+
+def floor_bucket(moment, bucket):
+    # Start of the bucket holding moment: an aware local datetime for hours, a date otherwise
+    if bucket == HOUR:
+        return timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+    if isinstance(moment, datetime):
+        moment = timezone.localdate(moment)
+    if bucket == WEEK:
+        return moment - timedelta(days=moment.weekday())
+    if bucket == MONTH:
+        return moment.replace(day=1)
+    return moment
+
+
+def next_bucket(start, bucket):
+    if bucket == HOUR:
+        return timezone.localtime(start + timedelta(hours=1))
+    if bucket == WEEK:
+        return start + timedelta(days=7)
+    if bucket == MONTH:
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def bucket_range(start, end, bucket):
+    buckets = []
+    current = floor_bucket(start, bucket)
+    last = floor_bucket(end, bucket)
+    while current <= last:
+        buckets.append(current)
+        current = next_bucket(current, bucket)
+    return buckets
+
+
+def time_series(queryset, date_field, bucket=DAY, start=None, end=None, total=None, **filters):
+    # Zero-filled totals per bucket between start and end (default: the
+    # last 30 days), computed with a single GROUP BY over a Trunc* of
+    # date_field. Works on raw history (DateTimeField, one row per event)
+    # and on the daily rollups (DateField, pass total=Sum(...)).
+    # Returns (buckets, values), oldest first.
+    if isinstance(queryset, type) and issubclass(queryset, models.Model):
+        queryset = queryset.objects.all()
+    end = end or timezone.now()
+    start = start or end - timedelta(days=30)
+
+    field = queryset.model._meta.get_field(date_field)
+    if isinstance(field, models.DateTimeField):
+        queryset = queryset.filter(**{f'{date_field}__gte': start, f'{date_field}__lte': end})
+    else:
+        if bucket == HOUR:
+            raise ValueError(f"{queryset.model.__name__}.{date_field} has no time of day to bucket by hour")
+        queryset = queryset.filter(**{
+            f'{date_field}__gte': floor_bucket(start, DAY),
+            f'{date_field}__lte': floor_bucket(end, DAY),
+        })
+
+    rows = (
+        queryset.filter(**filters)
+        .annotate(bucket=TRUNCATE[bucket](date_field))
+        .values('bucket')
+        .annotate(total=total or Count('pk'))
+        .order_by()
+    )
+    totals = {}
+    for row in rows:
+        key = row['bucket']
+        if bucket != HOUR and isinstance(key, datetime):
+            key = timezone.localdate(key) if timezone.is_aware(key) else key.date()
+        elif bucket == HOUR:
+            key = timezone.localtime(key)
+        totals[key] = totals.get(key, 0) + (row['total'] or 0)
+
+    buckets = bucket_range(start, end, bucket)
+    return buckets, [totals.get(key, 0) for key in buckets]
+
+
+def bucket_labels(buckets, bucket=DAY):
+    return [key.strftime(LABEL_FORMATS[bucket]) for key in buckets]
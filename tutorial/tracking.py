@@ -0,0 +1,352 @@
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .agents import intern_user_agents
+from .dedup import ViewDeduplicator
+from .models import YoutubeVideo, ViewerHistory, SearchHistory, PageImpression
+from .packing import pack_ids
+from .spool import SpoolWriter
+from .heavy_hitters import heavy_hitters, record_view_hitters, record_query_hitters
+from .sketches import record_viewers, record_queries
+from .stats import record_searches, record_views, record_devices, record_impressions
+from .trending import trending_scores, record_trending
+
+logger = logging.getLogger(__name__)
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+SAMPLE = 'sample'
+
+DATABASE = 'database'
+SPOOL = 'spool'
+
+
+def get_client_ip(request):
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        ip = x_forwarded_for.split(',')[0]
+    else:
+        ip = request.META.get('REMOTE_ADDR')
+    return ip
+
+
+def _with_agent_ids(events):
+    # Payloads carry the raw user-agent string; rows store the interned id
+    agent_ids = intern_user_agents(event['user_agent'] for event in events)
+    rows = []
+    for event in events:
+        row = dict(event)
+        row['user_agent_id'] = agent_ids[row.pop('user_agent')]
+        rows.append(row)
+    return rows
+
+
+def _existing_video_ids(video_ids):
+    # Videos can be deleted between the request and the write
+    return set(YoutubeVideo.objects.filter(pk__in=set(video_ids)).values_list('id', flat=True))
+
+
+def write_views(events):
+    existing = _existing_video_ids(event['video_id'] for event in events)
+    events = [event for event in events if event['video_id'] in existing]
+    with transaction.atomic():
+        rows = _with_agent_ids(events)
+        ViewerHistory.objects.bulk_create([ViewerHistory(**row) for row in rows])
+        record_views(events)
+        record_devices(rows)
+        record_viewers(events)
+        # The in-memory summaries can't roll back, so they only see
+        # batches that committed (the spool loader wraps this in its own
+        # transaction and may retry a batch)
+        transaction.on_commit(lambda: (record_view_hitters(events), record_trending(events)))
+
+
+def write_searches(events):
+    searches = []
+    for row in _with_agent_ids(events):
+        row['result_ids'] = pack_ids(row['result_ids'])
+        searches.append(SearchHistory(**row))
+    with transaction.atomic():
+        SearchHistory.objects.bulk_create(searches)
+        record_searches(events)
+        record_queries(events)
+        transaction.on_commit(lambda: record_query_hitters(events))
+
+
+def write_impressions(events):
+    impressions = []
+    for row in _with_agent_ids(events):
+        row['video_ids'] = pack_ids(row['video_ids'])
+        impressions.append(PageImpression(**row))
+    existing = _existing_video_ids(video_id for event in events for video_id in event['video_ids'])
+    with transaction.atomic():
+        PageImpression.objects.bulk_create(impressions)
+        record_impressions([
+            dict(event, video_ids=[video_id for video_id in event['video_ids'] if video_id in existing])
+            for event in events
+        ])
+
+
+# Event kind -> function persisting a batch of event payloads
+WRITERS = {
+    'view': write_views,
+    'search': write_searches,
+    'impression': write_impressions,
+}
+
+
+def persist_events(events):
+    # Write (kind, payload) pairs to the database, one batch per kind.
+    # Returns the number of events that failed to write.
+    grouped = {}
+    for kind, payload in events:
+        grouped.setdefault(kind, []).append(payload)
+
+    failed = 0
+    for kind, payloads in grouped.items():
+        try:
+            WRITERS[kind](payloads)
+        except Exception:
+            logger.exception("Failed to write %d %s events", len(payloads), kind)
+            failed += len(payloads)
+    return failed
+
+
+class EventWriter:
+    # Request threads put tracking events on a bounded queue; a single
+    # writer thread drains it and persists the events in batches, either
+    # straight to the database or to a local spool file (TRACKING_BACKEND).
+
+    def __init__(self, max_queue=None, batch_size=None, flush_interval=None,
+                 policy=None, sample_rate=None, block_timeout=None, backend=None):
+        self.max_queue = max_queue or getattr(settings, 'TRACKING_QUEUE_SIZE', 10000)
+        self.batch_size = batch_size or getattr(settings, 'TRACKING_BATCH_SIZE', 200)
+        # 0 is a meaningful setting for these three, so only None falls back
+        self.flush_interval = (
+            flush_interval if flush_interval is not None else getattr(settings, 'TRACKING_FLUSH_INTERVAL', 5)
+        )
+        self.policy = policy or getattr(settings, 'TRACKING_FULL_POLICY', DROP_OLDEST)
+        self.sample_rate = sample_rate if sample_rate is not None else getattr(settings, 'TRACKING_SAMPLE_RATE', 0.1)
+        self.block_timeout = (
+            block_timeout if block_timeout is not None else getattr(settings, 'TRACKING_BLOCK_TIMEOUT', 1)
+        )
+        self.backend = backend or getattr(settings, 'TRACKING_BACKEND', DATABASE)
+
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._pending = []
+        self._spool = None
+        self._counters = {'queued': 0, 'written': 0, 'dropped': 0, 'sampled_out': 0, 'failed': 0}
+
+    def put(self, kind, payload):
+        self._start()
+        event = (kind, payload)
+
+        # Under pressure keep only a sample of new events
+        if self.policy == SAMPLE and self._queue.qsize() >= self.max_queue // 2:
+            if random.random() >= self.sample_rate:
+                self._count('sampled_out')
+                return False
+
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            if not self._put_when_full(event):
+                self._count('dropped')
+                return False
+        self._count('queued')
+        return True
+
+    def _put_when_full(self, event):
+        if self.policy == BLOCK:
+            try:
+                self._queue.put(event, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                return False
+
+        if self.policy == DROP_OLDEST:
+            try:
+                self._queue.get_nowait()
+                self._count('dropped')
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(event)
+                return True
+            except queue.Full:
+                return False
+
+        return False
+
+    def flush(self):
+        # Write everything queued so far, including the writer's partial batch
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._pending.append(event)
+        return self._write_pending()
+
+    def close(self):
+        self.flush()
+        with self._write_lock:
+            if self._spool is not None:
+                self._spool.close()
+        heavy_hitters.persist()
+        trending_scores.persist()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters['pending'] = self._queue.qsize() + len(self._pending)
+        counters['policy'] = self.policy
+        counters['backend'] = self.backend
+        return counters
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='tracking-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    event = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                with self._lock:
+                    self._pending.append(event)
+                    if len(self._pending) >= self.batch_size:
+                        break
+            try:
+                self._write_pending()
+                if self._spool is not None:
+                    with self._write_lock:
+                        self._spool.maybe_rotate()
+            except Exception:
+                # Keep the thread alive; the next round retries the rotation
+                logger.exception("Tracking writer round failed")
+            finally:
+                # The writer thread owns its own connection; don't leave it open
+                connections.close_all()
+
+    def _write_pending(self):
+        with self._write_lock:
+            with self._lock:
+                events, self._pending = self._pending, []
+            if not events:
+                return 0
+
+            if self.backend == SPOOL:
+                failed = self._append_to_spool(events)
+            else:
+                failed = persist_events(events)
+            self._count('failed', failed)
+            self._count('written', len(events) - failed)
+            return len(events)
+
+    def _append_to_spool(self, events):
+        if self._spool is None:
+            self._spool = SpoolWriter()
+        try:
+            self._spool.append(events)
+        except Exception:
+            logger.exception("Failed to spool %d events", len(events))
+            return len(events)
+        return 0
+
+
+event_writer = EventWriter()
+
+# Write out whatever is still queued when the worker process exits
+atexit.register(event_writer.close)
+
+
+view_dedup = ViewDeduplicator()
+
+
+def _request_fields(request):
+    return {
+        'user_id': request.user.pk if request.user.is_authenticated else None,
+        'ip_address': get_client_ip(request),
+        'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+    }
+
+
+def _viewer(payload):
+    if payload['user_id']:
+        return ('user', payload['user_id'])
+    return ('ip', payload['ip_address'])
+
+
+def track_view(request, video, page_type='detail'):
+    payload = _request_fields(request)
+
+    # Collapse reloads by the same viewer within TRACKING_DEDUP_WINDOW
+    if view_dedup.seen((_viewer(payload), video.pk, page_type)):
+        return False
+
+    payload.update(
+        video_id=video.pk,
+        page_type=page_type,
+        view_date=timezone.now(),
+    )
+    return event_writer.put('view', payload)
+
+
+def track_search(request, query, result_ids=(), results_count=None, corrected_query=None):
+    # Results found only for a typo-corrected query don't count as matches
+    # for the query as typed, so it stays a zero-result search
+    payload = _request_fields(request)
+    snapshot_size = getattr(settings, 'SEARCH_SNAPSHOT_SIZE', 100)
+    if results_count is None:
+        results_count = 0 if corrected_query else len(result_ids)
+    payload.update(
+        query=query,
+        results_count=results_count,
+        corrected_query=(corrected_query or '')[:255],
+        result_ids=list(result_ids[:snapshot_size]),
+        search_date=timezone.now(),
+    )
+    return event_writer.put('search', payload)
+
+
+def track_impression(request, video_ids, page_number=1, query='', sort='latest'):
+    # The same page under another sort shows other videos, so it is a new impression
+    payload = _request_fields(request)
+    if view_dedup.seen((_viewer(payload), 'impression', page_number, query, sort)):
+        return False
+
+    payload.update(
+        query=query,
+        page_number=page_number,
+        video_ids=list(video_ids),
+        impression_date=timezone.now(),
+    )
+    return event_writer.put('impression', payload)
@@ -0,0 +1,146 @@
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+
+from .models import YoutubeVideo, ViewerHistory
+from .query_cache import search_ids
+
+logger = logging.getLogger(__name__)
+
+# Scores are stored relative to a fixed epoch instead of being decayed in
+# place: a view at time t adds exp(rate * (t - EPOCH)), and the score is the
+# log of the sum. Every score decays by the same factor as time passes, so
+# ordering by the stored value is ordering by the decayed one, and nothing
+# has to be rewritten as the clock moves.
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+# Only detail views count; list views come from rendering the list itself,
+# and would let the trending page keep its own order
+PAGE_TYPES = ('detail',)
+
+
+def _rate():
+    # Per-second decay rate for TRENDING_HALF_LIFE (seconds)
+    return math.log(2) / getattr(settings, 'TRENDING_HALF_LIFE', 2 * 24 * 3600)
+
+
+def view_weight(when, rate=None):
+    # Log of one view's contribution at time `when`
+    return (rate or _rate()) * (when - EPOCH).total_seconds()
+
+
+def logaddexp(a, b):
+    # log(exp(a) + exp(b)) without overflowing
+    if a is None:
+        return b
+    return max(a, b) + math.log1p(math.exp(-abs(a - b)))
+
+
+def decayed_views(score, now):
+    # Stored score -> recent views as of `now`, each weighted by
+    # 0.5 ** (age / TRENDING_HALF_LIFE)
+    if not score:
+        return 0.0
+    return math.exp(score - view_weight(now))
+
+
+class TrendingScores:
+    # Per-process pending score increments per video, added to
+    # YoutubeVideo.trending_score every TRENDING_PERSIST_INTERVAL seconds.
+    # Recording a view is one logaddexp on a dict entry.
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._persisted_at = time.monotonic()
+
+    def offer(self, views):
+        # views: (video id, when) pairs
+        rate = _rate()
+        with self._lock:
+            for video_id, when in views:
+                self._pending[video_id] = logaddexp(self._pending.get(video_id), view_weight(when, rate))
+
+    def maybe_persist(self):
+        interval = getattr(settings, 'TRENDING_PERSIST_INTERVAL', 60)
+        if time.monotonic() - self._persisted_at >= interval:
+            self.persist()
+
+    def persist(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._persisted_at = time.monotonic()
+        try:
+            for video_id, weight in pending.items():
+                # logaddexp in SQL, so concurrent writers never lose an update
+                YoutubeVideo.objects.filter(pk=video_id).update(
+                    trending_score=Greatest(F('trending_score'), Value(weight))
+                    + Ln(1 + Exp(-Abs(F('trending_score') - Value(weight))))
+                )
+        except Exception:
+            logger.exception("Failed to persist trending scores for %d videos", len(pending))
+
+
+trending_scores = TrendingScores()
+
+
+def record_trending(events):
+    trending_scores.offer(
+        (event['video_id'], event['view_date']) for event in events if event['page_type'] in PAGE_TYPES
+    )
+    trending_scores.maybe_persist()
+
+
+def compute_scores(views=None):
+    # video id -> score from raw history, for rebuilds
+    views = ViewerHistory.objects.all() if views is None else views
+    rate = _rate()
+    scores = {}
+    rows = views.filter(page_type__in=PAGE_TYPES).order_by().values_list('video_id', 'view_date')
+    for video_id, view_date in rows.iterator(chunk_size=5000):
+        scores[video_id] = logaddexp(scores.get(video_id), view_weight(view_date, rate))
+    return scores
+
+
+def rebuild_trending_scores(batch_size=1000):
+    # Recompute every score from ViewerHistory, e.g. after changing
+    # TRENDING_HALF_LIFE. Returns the number of videos with views.
+    scores = compute_scores()
+    videos = []
+    for video in YoutubeVideo.objects.only('id').iterator(chunk_size=2000):
+        video.trending_score = scores.get(video.pk, 0.0)
+        videos.append(video)
+    YoutubeVideo.objects.bulk_update(videos, ['trending_score'], batch_size=batch_size)
+    return len(scores)
+
+
+def trending(queryset=None):
+    # Highest decayed view rate first; videos without views by recency
+    queryset = YoutubeVideo.objects.filter(is_active=True) if queryset is None else queryset
+    return queryset.order_by('-trending_score', '-timestamp')
+
+
+def rank_ids(ids, queryset=None):
+    # Reorder an id list (e.g. search results) by trending score
+    queryset = YoutubeVideo.objects.all() if queryset is None else queryset
+    scores = dict(queryset.filter(pk__in=ids).values_list('pk', 'trending_score'))
+    return sorted((pk for pk in ids if pk in scores), key=lambda pk: -scores[pk])
+
+
+def related_videos(video, limit=6):
+    # Rail for a video page: videos matching its title, hottest first,
+    # topped up with site-wide trending videos
+    active = YoutubeVideo.objects.filter(is_active=True).exclude(pk=video.pk)
+    ids, _ = search_ids(video.title)
+    related = rank_ids([pk for pk in ids if pk != video.pk], active)[:limit]
+    videos = active.in_bulk(related)
+    rail = [videos[pk] for pk in related if pk in videos]
+    if len(rail) < limit:
+        rail.extend(trending(active.exclude(pk__in=related))[:limit - len(rail)])
+    return rail
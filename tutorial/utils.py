@@ -1,50 +1,10 @@
-from .models import ViewerHistory, SearchHistory
+from .tracking import track_view, track_search
 
 def track_video_view(request, video):
-    if request.user.is_authenticated:
-        user = request.user
-    else:
-        user = None
-    
-    # Get IP address
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    
-    # Get user agent
-    user_agent = request.META.get('HTTP_USER_AGENT', '')
-    
-    # Create view history
-    ViewerHistory.objects.create(
-        user=user,
-        video=video,
-        ip_address=ip,
-        user_agent=user_agent
-    )
+    # Queued for the background writer
+    track_view(request, video)
 
 def track_search_query(request, query, results_count):
-    if request.user.is_authenticated:
-        user = request.user
-    else:
-        user = None
-    
-    # Get IP address
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    
-    # Get user agent
-    user_agent = request.META.get('HTTP_USER_AGENT', '')
-    
-    # Create search history
-    SearchHistory.objects.create(
-        user=user,
-        query=query,
-        ip_address=ip,
-        user_agent=user_agent,
-        results_count=results_count
-    )
\ No newline at end of file
+    # Queued for the background writer
+    track_search(request, query, results_count=results_count)
+
@@ -1,14 +1,24 @@
 from django.shortcuts import render, redirect
+from django.conf import settings
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.http import JsonResponse
-from django.db.models import Count, Q, Avg
+from django.db.models import Count, Q, Avg, Sum
 from django.contrib import messages
 from django.utils import timezone
-from tutorial.models import YoutubeVideo, ViewerHistory, SearchHistory, SearchResult
+from tutorial.models import YoutubeVideo, ViewerHistory, SearchHistory, SearchResult, DailyVideoStats, DailySearchStats
+from tutorial.tracking import track_view, track_search
+from tutorial.search_index import preserve_order, reindex_videos
+from tutorial.autocomplete import autocomplete
+from tutorial.query_cache import search_ids, catalog_version, advance_index_version
+from tutorial.stats import search_totals, popular_queries
+from tutorial.timeseries import time_series, bucket_labels
+from tutorial.snapshots import Snapshot
+from tutorial.sketches import unique_viewers, unique_queries
+from tutorial.heavy_hitters import QUERIES, WINDOWS, top_items, top_videos
 import json
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -18,45 +28,56 @@ def get_client_ip(request):
         ip = request.META.get('REMOTE_ADDR')
     return ip
 
+def dashboard_stats():
+    stats = {}
+    
+    # Video statistics
+    stats['total_videos'] = YoutubeVideo.objects.count()
+    stats['active_videos'] = YoutubeVideo.objects.filter(is_active=True).count()
+    
+    # Viewer statistics. Views are detail-page views; list impressions
+    # are counted apart (list_view_count) and never shown as views.
+    stats['total_views'] = YoutubeVideo.objects.aggregate(total=Sum('detail_view_count'))['total'] or 0
+    stats['unique_viewers_30days'] = unique_viewers(30)
+
+    # Search statistics, from the per-query totals
+    stats['total_searches'] = search_totals()['total_searches']
+    
+    # Most viewed videos of the last 24 hours
+    stats['top_videos'] = [
+        {'id': hitter['video'].pk, 'title': hitter['video'].title, 'count': hitter['count']}
+        for hitter in top_videos('day', 10)
+    ]
+    
+    # Graph data for views over time, read from the daily rollups; the
+    # 30-day cards are the charts' totals, so the two always agree
+    days, views_data = time_series(DailyVideoStats, 'date', total=Sum('count'), page_type='detail')
+    days, searches_data = time_series(DailySearchStats, 'date', total=Sum('search_count'))
+    days_labels = bucket_labels(days)
+    stats['views_last_30days'] = sum(views_data)
+    stats['searches_last_30days'] = sum(searches_data)
+    
+    stats['days_labels'] = json.dumps(days_labels)
+    stats['views_data'] = json.dumps(views_data)
+    stats['searches_data'] = json.dumps(searches_data)
+    
+    return stats
+
+# Recomputed in the background once older than DASHBOARD_SNAPSHOT_TTL seconds
+dashboard_snapshot = Snapshot('tutorial:dashboard', dashboard_stats, getattr(settings, 'DASHBOARD_SNAPSHOT_TTL', 60))
+
 class YADashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'tutorial/admn/dashboard.html'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Get data for the last 30 days
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        
-        # Video statistics
-        context['total_videos'] = YoutubeVideo.objects.count()
-        context['active_videos'] = YoutubeVideo.objects.filter(is_active=True).count()
-        
-        # Viewer statistics
-        context['total_views'] = ViewerHistory.objects.count()
-        context['views_last_30days'] = ViewerHistory.objects.filter(view_date__gte=thirty_days_ago).count()
-    
-        # Search statistics
-        context['total_searches'] = SearchHistory.objects.count()
-        context['searches_last_30days'] = SearchHistory.objects.filter(search_date__gte=thirty_days_ago).count()
-        
-        # Graph data for views over time
-        days_labels = [(timezone.now() - timedelta(days=x)).strftime('%Y-%m-%d') for x in range(30, -1, -1)]
-        
-        # Views data
-        views_data = []
-        for day in days_labels:
-            views_count = ViewerHistory.objects.filter(view_date__date=day).count()
-            views_data.append(views_count)
-        
-        # Searches data
-        searches_data = []
-        for day in days_labels:
-            searches_count = SearchHistory.objects.filter(search_date__date=day).count()
-            searches_data.append(searches_count)
-        
-        context['days_labels'] = json.dumps(days_labels)
-        context['views_data'] = json.dumps(views_data)
-        context['searches_data'] = json.dumps(searches_data)
+        if self.request.GET.get('refresh'):
+            stats, computed_at = dashboard_snapshot.refresh()
+        else:
+            stats, computed_at = dashboard_snapshot.get()
+        context.update(stats)
+        context['snapshot_at'] = datetime.fromtimestamp(computed_at, tz=dt_timezone.utc)
         
         return context
 
@@ -72,29 +93,12 @@ class YAVideoListView(LoginRequiredMixin, ListView):
         # Search functionality
         search_query = self.request.GET.get('search', '')
         if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) | 
-                Q(description__icontains=search_query) |
-                Q(youtube_link__icontains=search_query)
-            )
+            # Admins also see inactive videos and can match on the link
+            result_ids, corrected_query = search_ids(search_query, include_inactive=True, include_links=True)
+            queryset = preserve_order(queryset, result_ids)
             
-            # Track search if there's a query
-            search_history = SearchHistory(
-                user=self.request.user if self.request.user.is_authenticated else None,
-                query=search_query,
-                ip_address=get_client_ip(self.request),
-                user_agent=self.request.META.get('HTTP_USER_AGENT', ''),
-                results_count=queryset.count()
-            )
-            search_history.save()
-            
-            # Track search results
-            for position, video in enumerate(queryset, 1):
-                SearchResult.objects.create(
-                    search=search_history,
-                    video=video,
-                    position=position
-                )
+            # Track search and its results off the request thread
+            track_search(self.request, search_query, result_ids, corrected_query=corrected_query)
         
         # Date filtering
         start_date = self.request.GET.get('start_date')
@@ -115,20 +119,17 @@ class YAVideoListView(LoginRequiredMixin, ListView):
         for video in context['videos']:
             video_data = {
                 'video': video,
-                'view_count': ViewerHistory.objects.filter(video=video).count(),
+                'view_count': video.detail_view_count,
             }
             videos_with_stats.append(video_data)
         
         context['videos_with_stats'] = videos_with_stats
         
         # Get total counts for graph data
-        view_data = []
-        for video in YoutubeVideo.objects.all():
-            view_count = ViewerHistory.objects.filter(video=video).count()
-            view_data.append({
-                'title': video.title,
-                'views': view_count
-            })
+        view_data = [
+            {'title': title, 'views': view_count}
+            for title, view_count in YoutubeVideo.objects.values_list('title', 'detail_view_count')
+        ]
         
         context['view_data_json'] = json.dumps(view_data)
         
@@ -149,31 +150,18 @@ class YAVideoDetailView(DetailView):
         video = self.get_object()
         
         # Add stats to context
-        context['view_count'] = ViewerHistory.objects.filter(video=video).count()
-        context['list_view_count'] = ViewerHistory.objects.filter(video=video, page_type='list').count()
-        context['detail_view_count'] = ViewerHistory.objects.filter(video=video, page_type='detail').count()
+        context['detail_view_count'] = video.detail_view_count
+        context['list_view_count'] = video.list_view_count
+        context['view_count'] = video.view_count
+        context['unique_viewers'] = unique_viewers(30, video=video)
     
         # Track this view
         if not self.request.user.is_staff:  # Don't track admin views
-            ViewerHistory.objects.create(
-                user=self.request.user if self.request.user.is_authenticated else None,
-                video=video,
-                ip_address=get_client_ip(self.request),
-                user_agent=self.request.META.get('HTTP_USER_AGENT', ''),
-                page_type='detail'
-            )
+            track_view(self.request, video, 'detail')
         
         # View history data for graph
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        days_labels = [(timezone.now() - timedelta(days=x)).strftime('%Y-%m-%d') for x in range(30, -1, -1)]
-        
-        views_data = []
-        for day in days_labels:
-            views_count = ViewerHistory.objects.filter(
-                video=video,
-                view_date__date=day
-            ).count()
-            views_data.append(views_count)
+        days, views_data = time_series(DailyVideoStats, 'date', total=Sum('count'), video=video, page_type='detail')
+        days_labels = bucket_labels(days)
         
         context['days_labels'] = json.dumps(days_labels)
         context['views_data'] = json.dumps(views_data)
@@ -251,13 +239,28 @@ class YAVideoBulkActionView(LoginRequiredMixin, View):
             return redirect('youtube:video_list')
         
         videos = YoutubeVideo.objects.filter(id__in=video_ids)
+        previous_version = catalog_version()
         
         if action == 'activate':
-            videos.update(is_active=True)
+            toggled = list(videos.filter(is_active=False).values_list('title', flat=True))
+            videos.update(is_active=True, timestamp_modified=timezone.now())
             messages.success(request, f"{len(video_ids)} videos activated successfully!")
         elif action == 'deactivate':
-            videos.update(is_active=False)
+            toggled = list(videos.filter(is_active=True).values_list('title', flat=True))
+            videos.update(is_active=False, timestamp_modified=timezone.now())
             messages.success(request, f"{len(video_ids)} videos deactivated successfully!")
+        
+        # update() sends no post_save, so refresh the search index and the
+        # suggestions by hand; timestamp_modified moves the catalog version
+        # for the other workers
+        if action in ('activate', 'deactivate'):
+            reindex_videos(video_ids)
+            advance_index_version(previous_version)
+            for title in toggled:
+                if action == 'activate':
+                    autocomplete.add_title(title)
+                else:
+                    autocomplete.remove_title(title)
         elif action == 'delete':
             videos.delete()
             messages.success(request, f"{len(video_ids)} videos deleted successfully!")
@@ -287,25 +290,33 @@ class YASearchHistoryView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
+        # Resolve the packed result snapshots of this page in one query
+        searches = context['searches']
+        result_ids = {search.pk: search.result_id_list for search in searches}
+        videos = YoutubeVideo.objects.only('id', 'title').in_bulk(
+            {video_id for ids in result_ids.values() for video_id in ids}
+        )
+        for search in searches:
+            search.result_videos = [videos[video_id] for video_id in result_ids[search.pk] if video_id in videos]
+        
         # Get total counts and statistics
-        context['total_searches'] = SearchHistory.objects.count()
-        context['avg_results'] = SearchHistory.objects.aggregate(Avg('results_count'))['results_count__avg'] or 0
-        context['unique_queries'] = SearchHistory.objects.values('query').distinct().count()
+        context.update(search_totals())
+        context['unique_queries_30days'] = unique_queries(30)
         
         # Popular searches
-        popular_searches = SearchHistory.objects.values('query').annotate(
-            count=Count('query')
-        ).order_by('-count')[:10]
-        context['popular_searches'] = popular_searches
+        context['popular_searches'] = popular_queries(10)
         
-        # Graph data for searches over time
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        days_labels = [(timezone.now() - timedelta(days=x)).strftime('%Y-%m-%d') for x in range(30, -1, -1)]
+        # Trending searches over a sliding window
+        window = self.request.GET.get('window', 'day')
+        if window not in WINDOWS:
+            window = 'day'
+        context['trending_window'] = window
+        context['trending_windows'] = list(WINDOWS)
+        context['trending_searches'] = top_items(QUERIES, window, 10)
         
-        searches_data = []
-        for day in days_labels:
-            searches_count = SearchHistory.objects.filter(search_date__date=day).count()
-            searches_data.append(searches_count)
+        # Graph data for searches over time
+        days, searches_data = time_series(DailySearchStats, 'date', total=Sum('search_count'))
+        days_labels = bucket_labels(days)
         
         context['days_labels'] = json.dumps(days_labels)
         context['searches_data'] = json.dumps(searches_data)
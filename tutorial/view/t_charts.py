@@ -0,0 +1,169 @@
+import hashlib
+from datetime import timedelta
+
+from django.contrib.auth.decorators import login_required
+from django.db.models import Max, Sum
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+
+from tutorial.heavy_hitters import QUERIES, VIDEOS, WINDOWS, top_items, top_videos
+from tutorial.models import YoutubeVideo, DailyVideoStats, DailySearchStats, DailyDeviceStats
+from tutorial.query_cache import catalog_version
+from tutorial.stats import stats_watermark
+from tutorial.timeseries import DAY, WEEK, MONTH, bucket_for, bucket_labels, time_series
+
+# Chart endpoints answer conditional GETs from the newest rollup write (and,
+# for per-video totals, the newest catalog change), so a polling chart gets
+# a 304 until new events have been loaded. "Views" are detail-page views;
+# list impressions are never plotted as views.
+
+MAX_DAYS = 365
+
+
+def chart_range(request):
+    # (start, end, bucket) from ?days= and ?bucket=; rollups have no hours
+    try:
+        days = max(1, min(int(request.GET.get('days', 30)), MAX_DAYS))
+    except ValueError:
+        days = 30
+    end = timezone.now()
+    start = end - timedelta(days=days)
+    bucket = request.GET.get('bucket') or bucket_for(start, end)
+    if bucket not in (DAY, WEEK, MONTH):
+        bucket = DAY
+    return start, end, bucket
+
+
+def video_watermark(request, *args, **kwargs):
+    # Detail rows only: every list render writes a 'list' row, which the
+    # view charts never plot
+    return stats_watermark(DailyVideoStats, page_type='detail')
+
+
+def search_watermark(request, *args, **kwargs):
+    return stats_watermark(DailySearchStats)
+
+
+def device_watermark(request, *args, **kwargs):
+    return stats_watermark(DailyDeviceStats)
+
+
+def catalog_watermark(request, *args, **kwargs):
+    # Titles and the catalog itself change without any rollup write
+    modified = YoutubeVideo.objects.aggregate(modified=Max('timestamp_modified'))['modified']
+    return max(filter(None, [video_watermark(request), modified]), default=None)
+
+
+def catalog_etag_version(request, *args, **kwargs):
+    # The video count, so a deletion changes the ETag too
+    return catalog_version()
+
+
+def watermark_etag(watermark_func, version_func=None):
+    def etag(request, *args, **kwargs):
+        watermark = watermark_func(request)
+        # The range is relative to today, so a new day changes the data too
+        key = ':'.join([
+            request.path,
+            request.GET.urlencode(),
+            watermark.isoformat() if watermark else '',
+            version_func(request) if version_func else '',
+            timezone.localdate().isoformat(),
+        ])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return etag
+
+
+def chart_view(watermark_func, version_func=None):
+    def decorator(view):
+        etag_func = watermark_etag(watermark_func, version_func)
+        view = condition(etag_func=etag_func, last_modified_func=watermark_func)(view)
+        view = cache_control(private=True, no_cache=True)(view)
+        return login_required(require_GET(view))
+    return decorator
+
+
+def series_response(buckets, values, bucket):
+    return JsonResponse({
+        'bucket': bucket,
+        'labels': bucket_labels(buckets, bucket),
+        'data': values,
+    })
+
+
+@chart_view(video_watermark)
+def views_over_time(request):
+    start, end, bucket = chart_range(request)
+    buckets, values = time_series(DailyVideoStats, 'date', bucket, start, end, total=Sum('count'), page_type='detail')
+    return series_response(buckets, values, bucket)
+
+
+@chart_view(search_watermark)
+def searches_over_time(request):
+    start, end, bucket = chart_range(request)
+    buckets, values = time_series(DailySearchStats, 'date', bucket, start, end, total=Sum('search_count'))
+    return series_response(buckets, values, bucket)
+
+
+@chart_view(video_watermark)
+def video_views_over_time(request, pk):
+    video = get_object_or_404(YoutubeVideo, pk=pk)
+    start, end, bucket = chart_range(request)
+    buckets, values = time_series(
+        DailyVideoStats, 'date', bucket, start, end, total=Sum('count'), video=video, page_type='detail'
+    )
+    return series_response(buckets, values, bucket)
+
+
+@chart_view(catalog_watermark, catalog_etag_version)
+def views_per_video(request):
+    # Same shape as the view_data_json embedded in the admin video list
+    videos = YoutubeVideo.objects.values_list('id', 'title', 'detail_view_count')
+    return JsonResponse({
+        'videos': [
+            {'id': video_id, 'title': title, 'views': view_count}
+            for video_id, title, view_count in videos
+        ],
+    })
+
+
+@chart_view(device_watermark)
+def device_breakdown(request):
+    # Whole days from the rollup, so the first day of the range is complete
+    start, end, bucket = chart_range(request)
+    devices = (
+        DailyDeviceStats.objects.filter(date__gte=timezone.localdate(start), date__lte=timezone.localdate(end))
+        .values('device_type')
+        .annotate(count=Sum('count'))
+        .order_by('-count')
+    )
+    return JsonResponse({'devices': list(devices)})
+
+
+@login_required
+@require_GET
+def trending(request):
+    # Heavy hitters of the last hour, day or week; already cached, so no ETag
+    stream = request.GET.get('stream', VIDEOS)
+    window = request.GET.get('window', 'day')
+    if stream not in (VIDEOS, QUERIES) or window not in WINDOWS:
+        return JsonResponse({'error': 'Unknown stream or window'}, status=400)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+
+    if stream == VIDEOS:
+        items = [
+            {'id': hitter['video'].pk, 'title': hitter['video'].title, 'count': hitter['count'], 'error': hitter['error']}
+            for hitter in top_videos(window, limit)
+        ]
+    else:
+        items = [
+            {'query': hitter['item'], 'count': hitter['count'], 'error': hitter['error']}
+            for hitter in top_items(QUERIES, window, limit)
+        ]
+    return JsonResponse({'stream': stream, 'window': window, 'items': items})
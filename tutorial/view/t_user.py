@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -7,30 +8,15 @@ from django.contrib import messages
 from django.template.loader import render_to_string
 from tutorial.models import YoutubeVideo, ViewerHistory, SearchHistory, SearchResult
 from tutorial.forms import SearchForm
+from tutorial.tracking import track_view, track_search, track_impression
+from tutorial.query_cache import search_ids, VideoIdList
+from tutorial.autocomplete import suggest
+from tutorial.trending import trending, rank_ids, related_videos
 
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 
-def get_client_ip(request):
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
-
-def record_view(request, video, page_type):
-    ip_address = get_client_ip(request)
-    user_agent = request.META.get('HTTP_USER_AGENT', '')
-    user = request.user if request.user.is_authenticated else None
-    
-    ViewerHistory.objects.create(
-        user=user,
-        video=video,
-        ip_address=ip_address,
-        user_agent=user_agent,
-        page_type=page_type
-    )
+SORTS = ('latest', 'trending')
 
 
 class UserListView(ListView):
@@ -42,44 +28,42 @@ class UserListView(ListView):
     def get_queryset(self):
         queryset = YoutubeVideo.objects.filter(is_active=True)
         query = self.request.GET.get('q', '')
+        self.sort = self.request.GET.get('sort', 'latest')
+        if self.sort not in SORTS:
+            self.sort = 'latest'
         
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) | 
-                Q(description__icontains=query)
-            )
+            # Ranked ids from the query cache (or the index on a miss),
+            # with a typo-corrected retry when nothing matches exactly
+            result_ids, self.corrected_query = search_ids(query)
             
-            # Record search history
-            ip_address = get_client_ip(self.request)
-            user_agent = self.request.META.get('HTTP_USER_AGENT', '')
-            user = self.request.user if self.request.user.is_authenticated else None
+            # Record search history and results off the request thread
+            track_search(self.request, query, result_ids, corrected_query=self.corrected_query)
             
-            search_history = SearchHistory.objects.create(
-                user=user,
-                query=query,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                results_count=queryset.count()
-            )
+            if self.sort == 'trending':
+                result_ids = rank_ids(result_ids, queryset)
             
-            # Record search results
-            for position, video in enumerate(queryset, 1):
-                SearchResult.objects.create(
-                    search=search_history,
-                    video=video,
-                    position=position
-                )
-        
-        # Record list page view for first video if exists
-        if queryset.exists() and not query:
-            first_video = queryset.first()
-            record_view(self.request, first_video, 'list')
+            # Pagination slices the id list; one pk IN query per page
+            return VideoIdList(queryset, result_ids)
             
+        if self.sort == 'trending':
+            # Indexed per-video decayed score; no history aggregation per request
+            return trending(queryset)
         return queryset
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['query'] = self.request.GET.get('q', '')
+        context['corrected_query'] = getattr(self, 'corrected_query', None)
+        context['sort'] = self.sort
+        
+        # One impression per rendered page, covering every video shown
+        videos = context['videos']
+        if videos:
+            page_number = context['page_obj'].number if context['page_obj'] else 1
+            track_impression(
+                self.request, [video.pk for video in videos], page_number, context['query'], self.sort
+            )
         return context
 
 
@@ -110,10 +94,27 @@ class UserDetailView(DetailView):
         # Add tokens from cookies if they exist
         context['user_tokens'] = self.request.COOKIES.get('comment_tokens', '')
         
+        # Related rail, hottest matching videos first
+        context['related_videos'] = related_videos(video)
+        
         return context
     
     def get(self, request, *args, **kwargs):
         response = super().get(request, *args, **kwargs)
         video = self.object
-        record_view(request, video, 'detail')
-        return response
\ No newline at end of file
+        track_view(request, video, 'detail')
+        return response
+
+
+def autocomplete_suggestions(request):
+    query = request.GET.get('q', '')
+    top_k = getattr(settings, 'AUTOCOMPLETE_TOP_K', 10)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', top_k)), top_k))
+    except ValueError:
+        limit = top_k
+    
+    return JsonResponse({
+        'query': query,
+        'suggestions': suggest(query, limit),
+    })
@@ -1,6 +1,7 @@
 from django.urls import path
 from . import t_admin
 from . import t_user
+from . import t_charts
 
 app_name = 'youtube'
 
@@ -13,9 +14,16 @@ urlpatterns = [
     path('videos/<int:pk>/delete/', t_admin.YAVideoDeleteView.as_view(), name='video_delete'),
     path('videos/bulk-action/', t_admin.YAVideoBulkActionView.as_view(), name='video_bulk_action'),
     path('search-history/', t_admin.YASearchHistoryView.as_view(), name='search_history'),
+    path('charts/views/', t_charts.views_over_time, name='chart_views'),
+    path('charts/searches/', t_charts.searches_over_time, name='chart_searches'),
+    path('charts/videos/', t_charts.views_per_video, name='chart_video_views'),
+    path('charts/videos/<int:pk>/views/', t_charts.video_views_over_time, name='chart_video_views_over_time'),
+    path('charts/devices/', t_charts.device_breakdown, name='chart_devices'),
+    path('charts/trending/', t_charts.trending, name='chart_trending'),
 
 
     path('u/video/<int:pk>/', t_user.UserDetailView.as_view(), name='detail'),
+    path('u/autocomplete/', t_user.autocomplete_suggestions, name='autocomplete'),
     
     
 
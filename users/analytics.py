@@ -0,0 +1,457 @@
+import json
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Sum
+from django.db.models.functions import Greatest, TruncDate, TruncHour
+from django.utils import timezone
+
+from tutorial.agents import intern_user_agents, device_distribution, browser_distribution
+from tutorial.stats import _upsert
+from .models import AnalyticsSession, PageVisit, NavigationTransition, VisitSession, DailyPageDwell
+
+PAGE_VISIT = 'page_visit'
+
+
+def _session_totals(events):
+    # session id -> totals for the batch. Events are in time order, so each
+    # visit's previous path is the one before it in the same session.
+    sessions = {}
+    for event in events:
+        totals = sessions.get(event['session_id'])
+        if totals is None:
+            sessions[event['session_id']] = totals = {
+                'first': event, 'last': event, 'count': 0, 'user_id': None, 'visits': [],
+            }
+        totals['last'] = event
+        totals['count'] += 1
+        totals['user_id'] = event['user_id'] or totals['user_id']
+        totals['visits'].append(event)
+    return sessions
+
+
+def _upsert_session(session_id, totals, existing):
+    first, last = totals['first'], totals['last']
+    updates = {
+        'page_count': F('page_count') + totals['count'],
+        'last_seen': Greatest(F('last_seen'), last['timestamp']),
+        'last_path': last['path'],
+    }
+    if totals['user_id']:
+        updates['user_id'] = totals['user_id']
+    _upsert(
+        AnalyticsSession,
+        {'session_id': session_id},
+        updates,
+        {
+            'user_id': totals['user_id'],
+            'user_agent_id': first['user_agent_id'],
+            'ip_address': first['ip_address'],
+            'landing_path': first['path'],
+            'referrer': first['referrer'],
+            'start_time': first['timestamp'],
+            'last_seen': last['timestamp'],
+            'last_path': last['path'],
+            'page_count': totals['count'],
+        },
+        exists=existing is not None,
+    )
+
+
+def record_transitions(visits):
+    # One UPDATE per (day, from, to) seen in the batch
+    counts = Counter(
+        (timezone.localdate(visit.timestamp), visit.previous_path, visit.path)
+        for visit in visits if visit.previous_path
+    )
+    now = timezone.now()
+    for (date, from_path, to_path), count in counts.items():
+        _upsert(
+            NavigationTransition,
+            {'date': date, 'from_path': from_path, 'to_path': to_path},
+            {'count': F('count') + count, 'updated_at': now},
+            {'count': count, 'updated_at': now},
+        )
+
+
+def write_page_visits(events):
+    agent_ids = intern_user_agents(event['user_agent'] for event in events)
+    rows = []
+    for event in sorted(events, key=lambda event: event['timestamp']):
+        row = dict(event)
+        row['user_agent_id'] = agent_ids[row.pop('user_agent')]
+        rows.append(row)
+
+    sessions = _session_totals(rows)
+    existing = AnalyticsSession.objects.in_bulk(list(sessions), field_name='session_id')
+    visits = []
+    for session_id, totals in sessions.items():
+        session = existing.get(session_id)
+        previous = session.last_path if session is not None and session.last_seen <= totals['first']['timestamp'] else ''
+        for row in totals['visits']:
+            visits.append(PageVisit(previous_path=previous, **row))
+            previous = row['path']
+
+    with transaction.atomic():
+        PageVisit.objects.bulk_create(visits)
+        for session_id, totals in sessions.items():
+            _upsert_session(session_id, totals, existing.get(session_id))
+        record_transitions(visits)
+
+
+def parse_filters(request, default_days=7):
+    # Shared ?days=, ?hours=, ?device_type= and ?user_type= handling.
+    # hours, when set, overrides days.
+    try:
+        days = max(1, min(int(request.GET.get('days', default_days)), 365))
+    except ValueError:
+        days = default_days
+    try:
+        hours = max(0, min(int(request.GET.get('hours', 0)), 24 * 365))
+    except ValueError:
+        hours = 0
+    device_type = request.GET.get('device_type', '')
+    user_type = request.GET.get('user_type', 'all')
+    if user_type not in ('all', 'authenticated', 'anonymous'):
+        user_type = 'all'
+    since = timezone.now() - (timedelta(hours=hours) if hours else timedelta(days=days))
+    return {'days': days, 'hours': hours, 'device_type': device_type, 'user_type': user_type, 'since': since}
+
+
+def visits(filters, queryset=None):
+    # PageVisit rows in the filtered range; every filter hits an index
+    queryset = PageVisit.objects.all() if queryset is None else queryset
+    queryset = queryset.filter(timestamp__gte=filters['since'])
+    if filters['device_type']:
+        queryset = queryset.filter(user_agent__device_type=filters['device_type'])
+    if filters['user_type'] == 'authenticated':
+        queryset = queryset.filter(user__isnull=False)
+    elif filters['user_type'] == 'anonymous':
+        queryset = queryset.filter(user__isnull=True)
+    return queryset
+
+
+def _filter_sessions(queryset, filters):
+    if filters['device_type']:
+        queryset = queryset.filter(user_agent__device_type=filters['device_type'])
+    if filters['user_type'] == 'authenticated':
+        queryset = queryset.filter(user__isnull=False)
+    elif filters['user_type'] == 'anonymous':
+        queryset = queryset.filter(user__isnull=True)
+    return queryset
+
+
+def sessions(filters, queryset=None):
+    queryset = AnalyticsSession.objects.all() if queryset is None else queryset
+    return _filter_sessions(queryset.filter(last_seen__gte=filters['since']), filters)
+
+
+def finished_sessions(filters, queryset=None):
+    # VisitSession rows (closed by users/sessionizer.py) that ended in range
+    queryset = VisitSession.objects.all() if queryset is None else queryset
+    return _filter_sessions(queryset.filter(end_time__gte=filters['since']), filters)
+
+
+def session_totals(session_queryset):
+    # total_time: seconds across the sessions. average_retention: seconds
+    # per page that was followed by another view (a session's duration is
+    # the sum of those gaps), or None when there are none.
+    totals = session_queryset.aggregate(total_time=Sum('duration'), pages=Sum('page_count'), count=Count('id'))
+    followed = (totals['pages'] or 0) - totals['count']
+    return {
+        'total_time': totals['total_time'] or None,
+        'average_retention': round(totals['total_time'] / followed, 1) if followed else None,
+    }
+
+
+def dwell_average(dwell_queryset):
+    # Mean seconds on page from DailyPageDwell rows, or None
+    totals = dwell_queryset.aggregate(seconds=Sum('total_seconds'), samples=Sum('samples'))
+    return round(totals['seconds'] / totals['samples'], 1) if totals['samples'] else None
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return 'N/A'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}m {seconds}s" if minutes else f"{seconds}s"
+
+
+def summary(filters):
+    visit_queryset = visits(filters)
+    totals = visit_queryset.aggregate(
+        total_page_views=Count('id'),
+        unique_users=Count('user', distinct=True),
+    )
+    totals['unique_sessions'] = sessions(filters).count()
+    duration = finished_sessions(filters).aggregate(average=Avg('duration'))['average']
+    totals['avg_duration'] = round(duration) if duration is not None else None
+    return totals
+
+
+def page_views_by_date(filters):
+    rows = (
+        visits(filters).annotate(date=TruncDate('timestamp'))
+        .values('date').annotate(count=Count('id')).order_by('date')
+    )
+    return [{'date': row['date'].isoformat(), 'count': row['count']} for row in rows]
+
+
+def top_pages(filters, limit=10):
+    visit_queryset = visits(filters)
+    total = visit_queryset.count()
+    rows = visit_queryset.values('path').annotate(count=Count('id')).order_by('-count')[:limit]
+    return [
+        {'url': row['path'], 'path': row['path'], 'count': row['count'],
+         'percentage': row['count'] * 100.0 / total if total else 0.0}
+        for row in rows
+    ]
+
+
+def user_activity(filters, limit=20):
+    # One row per signed-in user and per anonymous session, latest first
+    session_queryset = sessions(filters)
+    activity = []
+    rows = (
+        session_queryset.filter(user__isnull=False)
+        .values('user_id', 'user__email')
+        .annotate(total_sessions=Count('id'), last_visit=Max('last_seen'))
+        .order_by('-last_visit')[:limit]
+    )
+    finished = finished_sessions(filters)
+    times = dict(
+        finished.filter(user_id__in=[row['user_id'] for row in rows])
+        .values('user_id').annotate(total=Sum('duration')).values_list('user_id', 'total')
+    )
+    for row in rows:
+        activity.append({
+            'is_authenticated': True,
+            'id': row['user_id'],
+            'session_id': '',
+            'identifier': row['user__email'],
+            'last_visit': row['last_visit'],
+            'total_sessions': row['total_sessions'],
+            'total_time': times.get(row['user_id']) or None,
+        })
+    anonymous = list(session_queryset.filter(user__isnull=True).order_by('-last_seen')[:limit])
+    times = dict(
+        finished.filter(user__isnull=True, session_id__in=[session.session_id for session in anonymous])
+        .values('session_id').annotate(total=Sum('duration')).values_list('session_id', 'total')
+    )
+    for session in anonymous:
+        activity.append({
+            'is_authenticated': False,
+            'id': 0,
+            'session_id': session.session_id,
+            'identifier': f"Anonymous ({session.session_id[:8]})",
+            'last_visit': session.last_seen,
+            'total_sessions': 1,
+            'total_time': times.get(session.session_id) or None,
+        })
+    activity.sort(key=lambda entry: entry['last_visit'], reverse=True)
+    return activity[:limit]
+
+
+def devices(filters):
+    return device_distribution(visits(filters))
+
+
+def browsers(filters):
+    return browser_distribution(visits(filters))
+
+
+def app_metrics(filters):
+    # Per app (URL namespace): distinct visitors (sessions) and page views
+    rows = (
+        visits(filters).values('app_name')
+        .annotate(visitors=Count('session_id', distinct=True), page_views=Count('id'))
+        .order_by('-visitors', 'app_name')
+    )
+    dwell = (
+        DailyPageDwell.objects.filter(date__gte=timezone.localdate(filters['since']))
+        .values('app_name').annotate(seconds=Sum('total_seconds'), samples=Sum('samples'))
+    )
+    retention = {row['app_name']: row['seconds'] / row['samples'] for row in dwell if row['samples']}
+    return [
+        {'name': row['app_name'] or 'site', 'visitors': row['visitors'],
+         'page_views': row['page_views'], 'retention_time': format_duration(retention.get(row['app_name']))}
+        for row in rows
+    ]
+
+
+def _visit_json(visit):
+    return {
+        'url': visit.path,
+        'page_title': visit.page_title,
+        'timestamp': visit.timestamp.isoformat(),
+        'user': {'id': visit.user_id, 'email': visit.user.email} if visit.user_id else None,
+        'session_id': visit.session_id,
+        'referrer': visit.referrer,
+        'device_type': visit.device_type,
+        'browser': visit.browser,
+    }
+
+
+def visits_json(queryset, limit=1000):
+    # The charts on the report pages group the latest visits client-side
+    queryset = queryset.select_related('user', 'user_agent').order_by('-timestamp')[:limit]
+    return json.dumps([_visit_json(visit) for visit in queryset])
+
+
+def page_report(url, filters):
+    visit_queryset = visits(filters, PageVisit.objects.filter(path=url))
+    totals = visit_queryset.aggregate(total_views=Count('id'), unique_users=Count('user', distinct=True))
+    if not totals['total_views']:
+        return None
+    dwell = DailyPageDwell.objects.filter(date__gte=timezone.localdate(filters['since']))
+    latest = visit_queryset.exclude(view_name='').order_by('-timestamp').values_list('view_name', flat=True).first()
+    top_referrers = list(
+        visit_queryset.exclude(referrer='').values('referrer')
+        .annotate(count=Count('id')).order_by('-count')[:10]
+    )
+    return {
+        'url': url,
+        'page_title': latest or url,
+        'total_views': totals['total_views'],
+        'unique_users': totals['unique_users'],
+        'avg_retention': dwell_average(dwell.filter(path=url)),
+        'site_avg_retention': dwell_average(dwell),
+        'top_referrers': top_referrers,
+        'page_visits': visits_json(visit_queryset),
+    }
+
+
+def navigations(filters):
+    # Visits that followed another page in the same session
+    return visits(filters).exclude(previous_path='')
+
+
+def transitions(start, end):
+    # NavigationTransition rows for the days start..end, inclusive
+    return NavigationTransition.objects.filter(date__range=(start, end))
+
+
+def top_transitions(start, end, limit=20, from_path=None):
+    rows = transitions(start, end)
+    if from_path is not None:
+        rows = rows.filter(from_path=from_path)
+    return list(
+        rows.values(from_url=F('from_path'), to_url=F('to_path'))
+        .annotate(count=Sum('count')).order_by('-count')[:limit]
+    )
+
+
+def funnel(steps, start, end):
+    # For each consecutive pair of steps: moves straight from one to the
+    # next, all moves out of the first, and the share that continued.
+    # Transitions are counted pairwise, so this is the step-by-step
+    # conversion, not the share of sessions that completed every step.
+    rows = (
+        transitions(start, end).filter(from_path__in=steps[:-1])
+        .values('from_path', 'to_path').annotate(count=Sum('count'))
+    )
+    exits, moves = Counter(), Counter()
+    for row in rows:
+        exits[row['from_path']] += row['count']
+        moves[row['from_path'], row['to_path']] += row['count']
+    return [
+        {
+            'from_url': from_path,
+            'to_url': to_path,
+            'count': moves[from_path, to_path],
+            'exits': exits[from_path],
+            'rate': moves[from_path, to_path] / exits[from_path] if exits[from_path] else 0.0,
+        }
+        for from_path, to_path in zip(steps, steps[1:])
+    ]
+
+
+def navigation_trends(filters, limit=20):
+    if filters['hours'] or filters['device_type'] or filters['user_type'] != 'all':
+        # The daily transition table has no hours, devices or user types;
+        # these narrower views read the (indexed) visit log instead
+        navigation_queryset = navigations(filters)
+        frequent = list(
+            navigation_queryset.values(from_url=F('previous_path'), to_url=F('path'))
+            .annotate(count=Count('id')).order_by('-count')[:limit]
+        )
+        frequency = (
+            navigation_queryset.annotate(hour=TruncHour('timestamp'))
+            .values('hour').annotate(count=Count('id')).order_by('hour')
+        )
+        total = navigation_queryset.count()
+    else:
+        start, end = timezone.localdate(filters['since']), timezone.localdate()
+        frequent = top_transitions(start, end, limit)
+        daily = transitions(start, end).values('date').annotate(count=Sum('count')).order_by('date')
+        frequency = [
+            {'hour': timezone.make_aware(datetime.combine(row['date'], time.min)), 'count': row['count']}
+            for row in daily
+        ]
+        total = sum(row['count'] for row in frequency)
+    return {
+        'total_navigations': total,
+        'frequent_paths': frequent,
+        'frequency_data': json.dumps([{'hour': row['hour'].isoformat(), 'count': row['count']} for row in frequency]),
+        'sankey_data': json.dumps(sankey(frequent)),
+    }
+
+
+def sankey(paths):
+    # Sources and targets are separate nodes, so A -> B and B -> A never
+    # form the cycle d3-sankey cannot lay out
+    nodes, index = [], {}
+
+    def node(side, url):
+        if (side, url) not in index:
+            index[side, url] = len(nodes)
+            nodes.append({'name': url})
+        return index[side, url]
+
+    links = [
+        {'source': node('from', path['from_url']), 'target': node('to', path['to_url']), 'value': path['count']}
+        for path in paths
+    ]
+    return {'nodes': nodes, 'links': links}
+
+
+def _navigation_json(visit):
+    return {
+        'user': {'id': visit.user_id, 'email': visit.user.email} if visit.user_id else None,
+        'session_id': visit.session_id,
+        'from_url': visit.previous_path,
+        'to_url': visit.path,
+        'timestamp': visit.timestamp.isoformat(),
+        'device_type': visit.device_type,
+        'browser': visit.browser,
+    }
+
+
+def navigations_json(queryset, limit=1000):
+    queryset = queryset.select_related('user', 'user_agent').order_by('-timestamp')[:limit]
+    return json.dumps([_navigation_json(visit) for visit in queryset])
+
+
+def user_analytics(filters, user=None, session_id=None):
+    # Everything on the per-user page, for a signed-in user or one anonymous session
+    if user is not None:
+        visit_queryset = visits(filters, PageVisit.objects.filter(user=user))
+        session_queryset = sessions(filters, AnalyticsSession.objects.filter(user=user))
+        totals = session_totals(finished_sessions(filters, VisitSession.objects.filter(user=user)))
+    else:
+        visit_queryset = visits(filters, PageVisit.objects.filter(session_id=session_id))
+        session_queryset = sessions(filters, AnalyticsSession.objects.filter(session_id=session_id))
+        totals = session_totals(finished_sessions(filters, VisitSession.objects.filter(session_id=session_id)))
+    return {
+        'is_authenticated': user is not None,
+        'user': user,
+        'session_id': session_id or '',
+        'total_page_views': visit_queryset.count(),
+        'average_retention': totals['average_retention'],
+        'total_time': totals['total_time'],
+        'sessions': session_queryset.select_related('user_agent').order_by('-last_seen'),
+        'page_visits': visits_json(visit_queryset),
+        'navigation_paths': navigations_json(visit_queryset.exclude(previous_path='')),
+        'visits': visit_queryset,
+    }
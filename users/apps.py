@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        # Page visits go through the same batched writer (and spool) as
+        # the tutorial tracking events
+        from tutorial.tracking import WRITERS
+        from .analytics import PAGE_VISIT, write_page_visits
+
+        WRITERS[PAGE_VISIT] = write_page_visits
@@ -0,0 +1,210 @@
+import csv
+import io
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from tutorial.models import ViewerHistory, SearchHistory
+from tutorial.packing import unpack_ids
+
+# Rows fetched per database round trip and written per Parquet row group /
+# Feather record batch. Every format holds at most one chunk in memory.
+CHUNK_SIZE = 5000
+
+FORMATS = ('csv', 'parquet', 'feather')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'feather': 'application/vnd.apache.arrow.file',
+}
+
+
+def export_filters(start=None, end=None, days=30, video=None, user=None):
+    # Dates are inclusive; without a start, the `days` days up to `end`
+    end = end or timezone.localdate()
+    start = start or end - timedelta(days=max(1, min(days, 3650)) - 1)
+    if start > end:
+        raise ValueError("start is after end")
+    return {
+        'start': start,
+        'end': end,
+        'since': timezone.make_aware(datetime.combine(start, time.min)),
+        'until': timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+        'video': video,
+        'user': user,
+    }
+
+
+def parse_export_filters(request, default_days=30):
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD or ?days=, plus ?video= and ?user=
+    # ids. Raises ValueError on malformed values.
+    def date(name):
+        value = request.GET.get(name)
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+    def number(name):
+        value = request.GET.get(name)
+        return int(value) if value else None
+
+    return export_filters(
+        start=date('start'),
+        end=date('end'),
+        days=number('days') or default_days,
+        video=number('video'),
+        user=number('user'),
+    )
+
+
+def _views(filters):
+    queryset = ViewerHistory.objects.filter(view_date__gte=filters['since'], view_date__lt=filters['until'])
+    if filters['video'] is not None:
+        queryset = queryset.filter(video_id=filters['video'])
+    if filters['user'] is not None:
+        queryset = queryset.filter(user_id=filters['user'])
+    rows = queryset.order_by().values_list(
+        'id', 'view_date', 'video_id', 'user_id', 'page_type',
+        'user_agent__device_type', 'user_agent__browser', 'ip_address',
+    )
+    return rows.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _search_rows(filters):
+    queryset = SearchHistory.objects.filter(search_date__gte=filters['since'], search_date__lt=filters['until'])
+    if filters['user'] is not None:
+        queryset = queryset.filter(user_id=filters['user'])
+    rows = queryset.order_by().values_list(
+        'id', 'search_date', 'query', 'results_count', 'user_id',
+        'user_agent__device_type', 'user_agent__browser', 'ip_address', 'result_ids',
+    )
+    return rows.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _searches(filters):
+    # Result ids are packed, so the video filter runs here rather than in SQL
+    for row in _search_rows(filters):
+        if filters['video'] is None or filters['video'] in unpack_ids(row[-1]):
+            yield row[:-1]
+
+
+def _search_results(filters):
+    # One row per ranked result, unpacked from SearchHistory.result_ids;
+    # the old SearchResult table is no longer written
+    for search_id, search_date, query, *_, result_ids in _search_rows(filters):
+        for position, video_id in enumerate(unpack_ids(result_ids), 1):
+            if filters['video'] is None or video_id == filters['video']:
+                yield search_id, search_date, query, position, video_id
+
+
+# name -> (row generator, [(column, arrow type name)])
+DATASETS = {
+    'views': (_views, [
+        ('id', 'int64'), ('view_date', 'timestamp'), ('video_id', 'int64'), ('user_id', 'int64'),
+        ('page_type', 'string'), ('device_type', 'string'), ('browser', 'string'), ('ip_address', 'string'),
+    ]),
+    'searches': (_searches, [
+        ('id', 'int64'), ('search_date', 'timestamp'), ('query', 'string'), ('results_count', 'int64'),
+        ('user_id', 'int64'), ('device_type', 'string'), ('browser', 'string'), ('ip_address', 'string'),
+    ]),
+    'search_results': (_search_results, [
+        ('search_id', 'int64'), ('search_date', 'timestamp'), ('query', 'string'),
+        ('position', 'int64'), ('video_id', 'int64'),
+    ]),
+}
+
+
+def rows(dataset, filters):
+    generator, columns = DATASETS[dataset]
+    return [name for name, kind in columns], generator(filters)
+
+
+class Echo:
+    # File-like object whose write() hands the line back instead of storing it
+    def write(self, value):
+        return value
+
+
+def stream_csv(dataset, filters):
+    # CSV lines one at a time, for StreamingHttpResponse
+    header, records = rows(dataset, filters)
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for record in records:
+        yield writer.writerow(record)
+
+
+def _chunks(records, size=None):
+    size = size or CHUNK_SIZE
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _write_columnar(dataset, filters, fmt, out):
+    # Write a Parquet or Feather file to `out` one chunk at a time: each
+    # chunk becomes a DataFrame, then a row group / record batch. Yields the
+    # row count of each chunk once it is written; the footer goes out when
+    # the generator finishes. pandas and pyarrow are only imported here, so
+    # web workers that never export don't load them.
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    _, columns = DATASETS[dataset]
+    types = {'int64': pa.int64(), 'string': pa.string(), 'timestamp': pa.timestamp('us', tz='UTC')}
+    # A fixed schema, so an all-null chunk can't change a column's type
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    header, records = rows(dataset, filters)
+
+    if fmt == 'parquet':
+        writer = pa.parquet.ParquetWriter(out, schema)
+    else:
+        # lz4, as pandas.DataFrame.to_feather would use
+        writer = pa.ipc.new_file(out, schema, options=pa.ipc.IpcWriteOptions(compression='lz4'))
+    with writer:
+        for chunk in _chunks(records):
+            frame = pd.DataFrame.from_records(chunk, columns=header)
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            yield len(chunk)
+
+
+def write_columnar(dataset, filters, fmt, out):
+    # Returns the number of rows written
+    return sum(_write_columnar(dataset, filters, fmt, out))
+
+
+class Pipe(io.RawIOBase):
+    # Write-only file object that keeps what was written until drain()
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, value):
+        self.parts.append(bytes(value))
+        return len(value)
+
+    def drain(self):
+        value, self.parts = b''.join(self.parts), []
+        return value
+
+
+def stream_columnar(dataset, filters, fmt):
+    # The file's bytes one row group / record batch at a time, for
+    # StreamingHttpResponse; memory stays at one chunk however long the range
+    out = Pipe()
+    for _ in _write_columnar(dataset, filters, fmt, out):
+        yield out.drain()
+    yield out.drain()
+
+
+def filename(dataset, filters, fmt):
+    return f"{dataset}_{filters['start']:%Y%m%d}-{filters['end']:%Y%m%d}.{fmt}"
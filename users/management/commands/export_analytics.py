@@ -0,0 +1,39 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import exports
+
+
+class Command(BaseCommand):
+    help = ("Export raw ViewerHistory / SearchHistory rows to a CSV, Parquet or Feather file, "
+            "one chunk at a time")
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS))
+        parser.add_argument('output', help="File to write")
+        parser.add_argument('--format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--start', type=date.fromisoformat, help="First day (YYYY-MM-DD)")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last day (YYYY-MM-DD), default today")
+        parser.add_argument('--days', type=int, default=30, help="Days up to --end when --start is not given")
+        parser.add_argument('--video', type=int, help="Only this video id")
+        parser.add_argument('--user', type=int, help="Only this user id")
+
+    def handle(self, *args, **options):
+        try:
+            filters = exports.export_filters(
+                start=options['start'], end=options['end'], days=options['days'],
+                video=options['video'], user=options['user'],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        if options['format'] == 'csv':
+            written = -1
+            with open(options['output'], 'w', newline='') as out:
+                for written, line in enumerate(exports.stream_csv(options['dataset'], filters)):
+                    out.write(line)
+        else:
+            with open(options['output'], 'wb') as out:
+                written = exports.write_columnar(options['dataset'], filters, options['format'], out)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} rows to {options['output']}"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from users.sessionizer import sessionize, reset
+
+
+class Command(BaseCommand):
+    help = ("Close finished analytics sessions: walk new PageVisit rows in time order and store "
+            "VisitSession and DailyPageDwell records (run every few minutes)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help="Visits read, and committed with their sessions, per transaction")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Discard existing sessions and dwell totals and start from the first visit")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset()
+        closed = sessionize(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Closed {closed} sessions"))
@@ -0,0 +1,50 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+from tutorial.tracking import event_writer, get_client_ip
+from .analytics import PAGE_VISIT
+
+
+class PageVisitMiddleware:
+    # Records successful HTML page views as PageVisit rows. The request
+    # thread only builds a small dict and puts it on the tracking queue;
+    # sessions, user agents and previous pages are resolved by the writer.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cookie_name = getattr(settings, 'ANALYTICS_SESSION_COOKIE', 'analytics_session')
+        self.timeout = getattr(settings, 'ANALYTICS_SESSION_TIMEOUT', 1800)
+        self.excluded = tuple(getattr(settings, 'ANALYTICS_EXCLUDED_PATHS', ()))
+
+    def __call__(self, request):
+        if request.method != 'GET' or request.path.startswith(self.excluded):
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        response = self.get_response(request)
+        if not 200 <= response.status_code < 300 or not response.get('Content-Type', '').startswith('text/html'):
+            return response
+
+        session_id = request.COOKIES.get(self.cookie_name) or uuid.uuid4().hex
+        user = getattr(request, 'user', None)
+        match = request.resolver_match
+        event_writer.put(PAGE_VISIT, {
+            'session_id': session_id[:32],
+            'user_id': user.pk if user is not None and user.is_authenticated else None,
+            'ip_address': get_client_ip(request),
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            'path': request.path[:500],
+            'referrer': request.META.get('HTTP_REFERER', '')[:500],
+            'app_name': (match.namespace if match else '')[:100],
+            'view_name': (match.view_name if match else '')[:200],
+            'status_code': response.status_code,
+            'response_time_ms': int((time.perf_counter() - started) * 1000),
+            'timestamp': timezone.now(),
+        })
+
+        # Sliding expiry: the session ends after `timeout` seconds without a page view
+        response.set_cookie(self.cookie_name, session_id, max_age=self.timeout, httponly=True, samesite='Lax')
+        return response
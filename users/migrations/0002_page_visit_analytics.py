@@ -0,0 +1,56 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0021_video_trending_score'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=32, unique=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('landing_path', models.CharField(max_length=500)),
+                ('referrer', models.CharField(blank=True, max_length=500)),
+                ('start_time', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('last_path', models.CharField(max_length=500)),
+                ('page_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('user_agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tutorial.useragent')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_seen'], name='users_analy_last_se_6862d7_idx'), models.Index(fields=['user', 'last_seen'], name='users_analy_user_id_2c6d0e_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PageVisit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=32)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('path', models.CharField(max_length=500)),
+                ('previous_path', models.CharField(blank=True, max_length=500)),
+                ('referrer', models.CharField(blank=True, max_length=500)),
+                ('app_name', models.CharField(blank=True, max_length=100)),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('status_code', models.PositiveSmallIntegerField(default=200)),
+                ('response_time_ms', models.PositiveIntegerField(default=0)),
+                ('timestamp', models.DateTimeField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('user_agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tutorial.useragent')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['timestamp'], name='users_pagev_timesta_486d44_idx'), models.Index(fields=['path', 'timestamp'], name='users_pagev_path_6e2f83_idx'), models.Index(fields=['session_id', 'timestamp'], name='users_pagev_session_d3aa80_idx'), models.Index(fields=['user', 'timestamp'], name='users_pagev_user_id_a3d904_idx'), models.Index(fields=['app_name', 'timestamp'], name='users_pagev_app_nam_76b8f1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:34
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_transitions(apps, schema_editor):
+    PageVisit = apps.get_model('users', 'PageVisit')
+    NavigationTransition = apps.get_model('users', 'NavigationTransition')
+
+    now = timezone.now()
+    rows = (
+        PageVisit.objects.exclude(previous_path='')
+        .annotate(date=TruncDate('timestamp'))
+        .values('date', 'previous_path', 'path')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    NavigationTransition.objects.bulk_create(
+        (NavigationTransition(date=row['date'], from_path=row['previous_path'], to_path=row['path'],
+                              count=row['count'], updated_at=now)
+         for row in rows.iterator(chunk_size=5000)),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_page_visit_analytics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NavigationTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('from_path', models.CharField(max_length=500)),
+                ('to_path', models.CharField(max_length=500)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['from_path', 'date'], name='users_navig_from_pa_254c32_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'from_path', 'to_path'), name='unique_navigation_transition')],
+            },
+        ),
+        migrations.RunPython(backfill_transitions, migrations.RunPython.noop),
+    ]
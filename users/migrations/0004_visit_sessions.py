@@ -0,0 +1,60 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorial', '0021_video_trending_score'),
+        ('users', '0003_navigation_transitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionizerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('last_visit_id', models.BigIntegerField(default=0)),
+                ('open_sessions', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyPageDwell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('path', models.CharField(max_length=500)),
+                ('app_name', models.CharField(blank=True, max_length=100)),
+                ('total_seconds', models.FloatField(default=0)),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['path', 'date'], name='users_daily_path_2367dd_idx'), models.Index(fields=['app_name', 'date'], name='users_daily_app_nam_4191cd_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'path'), name='unique_daily_page_dwell')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VisitSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=32)),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('page_count', models.PositiveIntegerField()),
+                ('duration', models.FloatField()),
+                ('landing_path', models.CharField(max_length=500)),
+                ('exit_path', models.CharField(max_length=500)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('user_agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tutorial.useragent')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['end_time'], name='users_visit_end_tim_5a3755_idx'), models.Index(fields=['user', 'end_time'], name='users_visit_user_id_0b554a_idx'), models.Index(fields=['session_id', 'end_time'], name='users_visit_session_ec4adf_idx')],
+            },
+        ),
+    ]
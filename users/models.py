@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
+from django.conf import settings
 from django.db import models
 from datetime import timedelta
 from django.utils.timezone import now
@@ -47,4 +48,182 @@ class VerificationAttempt(models.Model):
 
     @property
     def max_reached(self):
-        return self.count >= 5
\ No newline at end of file
+        return self.count >= 5
+
+class AnalyticsSession(models.Model):
+    # One row per analytics session cookie (see users/middleware.py); the
+    # cookie expires after ANALYTICS_SESSION_TIMEOUT seconds of inactivity
+    session_id = models.CharField(max_length=32, unique=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    user_agent = models.ForeignKey('tutorial.UserAgent', on_delete=models.SET_NULL, null=True, blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    landing_path = models.CharField(max_length=500)
+    referrer = models.CharField(max_length=500, blank=True)
+    start_time = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    # Path of the latest visit, so the next batch can link its first visit to it
+    last_path = models.CharField(max_length=500)
+    page_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_seen']),
+            models.Index(fields=['user', 'last_seen']),
+        ]
+
+    @property
+    def device_type(self):
+        return self.user_agent.device_type if self.user_agent else 'unknown'
+
+    @property
+    def browser(self):
+        return self.user_agent.browser if self.user_agent else 'Other'
+
+    @property
+    def is_active(self):
+        timeout = getattr(settings, 'ANALYTICS_SESSION_TIMEOUT', 1800)
+        return self.last_seen >= now() - timedelta(seconds=timeout)
+
+    @property
+    def end_time(self):
+        return None if self.is_active else self.last_seen
+
+    @property
+    def duration(self):
+        # Seconds between the first and the latest page visit
+        return (self.last_seen - self.start_time).total_seconds()
+
+    def __str__(self):
+        return self.session_id
+
+
+class PageVisit(models.Model):
+    session_id = models.CharField(max_length=32)
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    user_agent = models.ForeignKey('tutorial.UserAgent', on_delete=models.SET_NULL, null=True, blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    path = models.CharField(max_length=500)
+    # Path of the session's previous visit; blank on its first page
+    previous_path = models.CharField(max_length=500, blank=True)
+    referrer = models.CharField(max_length=500, blank=True)
+    app_name = models.CharField(max_length=100, blank=True)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField(default=200)
+    # Server time spent rendering the page
+    response_time_ms = models.PositiveIntegerField(default=0)
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp']),
+            models.Index(fields=['path', 'timestamp']),
+            models.Index(fields=['session_id', 'timestamp']),
+            models.Index(fields=['user', 'timestamp']),
+            models.Index(fields=['app_name', 'timestamp']),
+        ]
+
+    @property
+    def url(self):
+        return self.path
+
+    @property
+    def page_title(self):
+        return self.view_name
+
+    # A visit with a previous path is one navigation from_url -> to_url
+    @property
+    def from_url(self):
+        return self.previous_path
+
+    @property
+    def to_url(self):
+        return self.path
+
+    @property
+    def device_type(self):
+        return self.user_agent.device_type if self.user_agent else 'unknown'
+
+    @property
+    def browser(self):
+        return self.user_agent.browser if self.user_agent else 'Other'
+
+    def __str__(self):
+        return f"{self.path} at {self.timestamp}"
+
+
+class NavigationTransition(models.Model):
+    # from_path -> to_path counts per day, from consecutive visits within
+    # a session; kept up to date by the page-visit writer
+    date = models.DateField()
+    from_path = models.CharField(max_length=500)
+    to_path = models.CharField(max_length=500)
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'from_path', 'to_path'], name='unique_navigation_transition'),
+        ]
+        indexes = [
+            models.Index(fields=['from_path', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.from_path} -> {self.to_path} on {self.date}: {self.count}"
+
+
+class VisitSession(models.Model):
+    # Finished sessions: consecutive visits of one analytics session no
+    # more than ANALYTICS_SESSION_TIMEOUT apart (users/sessionizer.py)
+    session_id = models.CharField(max_length=32)
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    user_agent = models.ForeignKey('tutorial.UserAgent', on_delete=models.SET_NULL, null=True, blank=True)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    page_count = models.PositiveIntegerField()
+    # Seconds from the first to the last page view
+    duration = models.FloatField()
+    landing_path = models.CharField(max_length=500)
+    exit_path = models.CharField(max_length=500)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['end_time']),
+            models.Index(fields=['user', 'end_time']),
+            models.Index(fields=['session_id', 'end_time']),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id} ({self.start_time} - {self.end_time})"
+
+
+class DailyPageDwell(models.Model):
+    # Time spent on a page before the next view in the same session; the
+    # last page of a session has no known dwell time and is not counted
+    date = models.DateField()
+    path = models.CharField(max_length=500)
+    app_name = models.CharField(max_length=100, blank=True)
+    total_seconds = models.FloatField(default=0)
+    samples = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'path'], name='unique_daily_page_dwell'),
+        ]
+        indexes = [
+            models.Index(fields=['path', 'date']),
+            models.Index(fields=['app_name', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.path} on {self.date}"
+
+
+class SessionizerCheckpoint(models.Model):
+    # Single row: how far the sessionizer has read PageVisit, and the
+    # sessions still open at that point
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    last_visit_id = models.BigIntegerField(default=0)
+    open_sessions = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
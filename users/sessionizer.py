@@ -0,0 +1,171 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from tutorial.stats import _upsert
+from .models import PageVisit, VisitSession, DailyPageDwell, SessionizerCheckpoint
+
+# Open-session fields stored as datetimes (ISO strings in the checkpoint)
+DATETIME_FIELDS = ('start', 'end')
+
+
+class Sessionizer:
+    # Walks page visits in time order, one open session per analytics
+    # session id. A visit more than `gap` after the previous one closes
+    # the session and starts a new one. Memory holds only the open
+    # sessions and the per-day dwell totals, never the visits.
+
+    def __init__(self, gap, open_sessions=None):
+        self.gap = gap
+        self.open = open_sessions or {}
+        # (date, path) -> [app name, seconds, samples]
+        self.dwell = {}
+
+    def feed(self, visit):
+        # Returns the session this visit closed, if any
+        finished = None
+        session = self.open.get(visit['session_id'])
+        if session is not None and visit['timestamp'] - session['end'] > self.gap:
+            finished = self.open.pop(visit['session_id'])
+            session = None
+
+        if session is None:
+            self.open[visit['session_id']] = {
+                'start': visit['timestamp'],
+                'end': visit['timestamp'],
+                'page_count': 1,
+                'landing_path': visit['path'],
+                'last_path': visit['path'],
+                'last_app': visit['app_name'],
+                'user_id': visit['user_id'],
+                'user_agent_id': visit['user_agent_id'],
+            }
+            return finished
+
+        # The previous page was on screen until this view
+        key = (timezone.localdate(session['end']), session['last_path'])
+        entry = self.dwell.setdefault(key, [session['last_app'], 0.0, 0])
+        entry[1] += (visit['timestamp'] - session['end']).total_seconds()
+        entry[2] += 1
+
+        session['end'] = visit['timestamp']
+        session['page_count'] += 1
+        session['last_path'] = visit['path']
+        session['last_app'] = visit['app_name']
+        session['user_id'] = visit['user_id'] or session['user_id']
+        return finished
+
+    def close_idle(self, now):
+        # Sessions that can no longer be extended by a visit at `now` or later
+        idle = [session_id for session_id, session in self.open.items() if now - session['end'] > self.gap]
+        return [(session_id, self.open.pop(session_id)) for session_id in idle]
+
+    def state(self):
+        return {
+            session_id: dict(session, **{field: session[field].isoformat() for field in DATETIME_FIELDS})
+            for session_id, session in self.open.items()
+        }
+
+    @classmethod
+    def from_state(cls, gap, state):
+        return cls(gap, {
+            session_id: dict(session, **{field: parse_datetime(session[field]) for field in DATETIME_FIELDS})
+            for session_id, session in state.items()
+        })
+
+
+def _session_row(session_id, session):
+    return VisitSession(
+        session_id=session_id,
+        user_id=session['user_id'],
+        user_agent_id=session['user_agent_id'],
+        start_time=session['start'],
+        end_time=session['end'],
+        page_count=session['page_count'],
+        duration=(session['end'] - session['start']).total_seconds(),
+        landing_path=session['landing_path'],
+        exit_path=session['last_path'],
+    )
+
+
+def _save_dwell(dwell):
+    now = timezone.now()
+    for (date, path), (app_name, seconds, samples) in dwell.items():
+        _upsert(
+            DailyPageDwell,
+            {'date': date, 'path': path},
+            {'total_seconds': F('total_seconds') + seconds, 'samples': F('samples') + samples, 'updated_at': now},
+            {'app_name': app_name, 'total_seconds': seconds, 'samples': samples, 'updated_at': now},
+        )
+
+
+def _sessionize_chunk(gap, horizon, chunk_size):
+    # Read up to chunk_size visits past the checkpoint and commit their
+    # finished sessions, their dwell and the advanced checkpoint together.
+    # The checkpoint row is locked for the chunk only, so concurrent runs
+    # take turns chunk by chunk and each picks up where the other stopped.
+    # Returns (sessions closed, whether the backlog is exhausted).
+    with transaction.atomic():
+        checkpoint, created = SessionizerCheckpoint.objects.select_for_update().get_or_create(pk=1)
+        sessionizer = Sessionizer.from_state(gap, checkpoint.open_sessions)
+
+        visits = PageVisit.objects.filter(timestamp__lte=horizon)
+        if checkpoint.last_timestamp is not None:
+            visits = visits.filter(
+                Q(timestamp__gt=checkpoint.last_timestamp)
+                | Q(timestamp=checkpoint.last_timestamp, id__gt=checkpoint.last_visit_id)
+            )
+        rows = list(visits.order_by('timestamp', 'id').values(
+            'id', 'session_id', 'timestamp', 'path', 'app_name', 'user_id', 'user_agent_id'
+        )[:chunk_size])
+
+        finished = []
+        for visit in rows:
+            session = sessionizer.feed(visit)
+            if session is not None:
+                finished.append(_session_row(visit['session_id'], session))
+        exhausted = len(rows) < chunk_size
+        if rows:
+            checkpoint.last_timestamp, checkpoint.last_visit_id = rows[-1]['timestamp'], rows[-1]['id']
+        # Close sessions the stream has moved past, so a long backlog never
+        # holds more than the sessions open at one moment; once it is read,
+        # anything idle at the horizon can't be extended any more
+        idle = sessionizer.close_idle(horizon if exhausted else rows[-1]['timestamp'])
+        finished.extend(_session_row(*session) for session in idle)
+
+        VisitSession.objects.bulk_create(finished)
+        _save_dwell(sessionizer.dwell)
+        checkpoint.open_sessions = sessionizer.state()
+        checkpoint.save()
+    return len(finished), exhausted
+
+
+def sessionize(now=None, chunk_size=5000):
+    # Feed every PageVisit since the checkpoint through the sessionizer and
+    # store the sessions that finished, committing chunk by chunk, so an
+    # interrupted run keeps the chunks it finished. Visits younger than
+    # ANALYTICS_SESSIONIZE_DELAY are left for the next run, so batches still
+    # in the tracking queue are not skipped. Returns the number of sessions
+    # closed.
+    now = now or timezone.now()
+    gap = timedelta(seconds=getattr(settings, 'ANALYTICS_SESSION_TIMEOUT', 1800))
+    horizon = now - timedelta(seconds=getattr(settings, 'ANALYTICS_SESSIONIZE_DELAY', 300))
+
+    closed = 0
+    exhausted = False
+    while not exhausted:
+        sessions, exhausted = _sessionize_chunk(gap, horizon, chunk_size)
+        closed += sessions
+    return closed
+
+
+def reset():
+    # Forget everything sessionized so far; the next run starts from the first visit
+    with transaction.atomic():
+        VisitSession.objects.all().delete()
+        DailyPageDwell.objects.all().delete()
+        SessionizerCheckpoint.objects.all().delete()
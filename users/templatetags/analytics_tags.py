@@ -0,0 +1,11 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def subtract(value, arg):
+    try:
+        return float(value) - float(arg)
+    except (TypeError, ValueError):
+        return ''
@@ -1,3 +1,399 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from tutorial.agents import agent_cache
+from tutorial.models import YoutubeVideo, ViewerHistory, SearchHistory
+from tutorial.packing import pack_ids
+from . import analytics, exports, sessionizer
+from .models import (
+    CustomUser, AnalyticsSession, PageVisit, NavigationTransition, VisitSession, DailyPageDwell,
+    SessionizerCheckpoint,
+)
+
+
+@mock.patch('users.middleware.event_writer')
+class PageVisitMiddlewareTests(TestCase):
+
+    def visits(self, writer):
+        return [call.args[1] for call in writer.put.call_args_list if call.args[0] == analytics.PAGE_VISIT]
+
+    def test_html_pages_are_queued_under_one_session(self, writer):
+        response = self.client.get('/about/', HTTP_REFERER='https://example.com/', HTTP_USER_AGENT='test-agent')
+        session_id = response.cookies['analytics_session'].value
+        self.client.get('/tos/')
+
+        first, second = self.visits(writer)
+        self.assertEqual((first['path'], second['path']), ('/about/', '/tos/'))
+        self.assertEqual((first['session_id'], second['session_id']), (session_id, session_id))
+        self.assertEqual((first['referrer'], first['user_agent'], first['user_id']),
+                         ('https://example.com/', 'test-agent', None))
+
+    def test_other_requests_are_not_recorded(self, writer):
+        self.client.post('/about/')
+        self.client.get('/accounts/analytics/')
+        self.client.get('/sitemap.xml')
+        self.assertEqual(self.visits(writer), [])
+
+
+class PageVisitWriterTests(TestCase):
+
+    def setUp(self):
+        # Ids cached by earlier tests belong to rolled-back rows
+        self.addCleanup(agent_cache.clear)
+        agent_cache.clear()
+        self.start = timezone.make_aware(datetime(2026, 3, 2, 9, 0))
+
+    def visit(self, minutes, session_id, path):
+        return {
+            'session_id': session_id,
+            'user_id': None,
+            'ip_address': '10.0.0.1',
+            'user_agent': 'test-agent',
+            'path': path,
+            'referrer': '',
+            'app_name': 'youtube',
+            'view_name': '',
+            'status_code': 200,
+            'response_time_ms': 5,
+            'timestamp': self.start + timedelta(minutes=minutes),
+        }
+
+    def test_visits_chain_within_sessions_and_count_transitions(self):
+        analytics.write_page_visits([self.visit(0, 'a', '/'), self.visit(1, 'a', '/videos/')])
+        # Out of order, and continuing session a from the previous batch
+        analytics.write_page_visits([
+            self.visit(3, 'a', '/'), self.visit(2, 'b', '/'), self.visit(4, 'b', '/videos/'),
+            self.visit(5, 'a', '/videos/'),
+        ])
+
+        self.assertEqual(
+            list(PageVisit.objects.filter(session_id='a').order_by('timestamp').values_list('previous_path', 'path')),
+            [('', '/'), ('/', '/videos/'), ('/videos/', '/'), ('/', '/videos/')],
+        )
+        session = AnalyticsSession.objects.get(session_id='a')
+        self.assertEqual((session.page_count, session.landing_path, session.last_path), (4, '/', '/videos/'))
+        self.assertEqual(session.last_seen, self.start + timedelta(minutes=5))
+        self.assertEqual(
+            sorted(NavigationTransition.objects.values_list('from_path', 'to_path', 'count')),
+            [('/', '/videos/', 3), ('/videos/', '/', 1)],
+        )
+
+    def test_record_transitions_adds_to_existing_rows(self):
+        visits = [PageVisit(previous_path='/', path='/videos/', timestamp=self.start)] * 2
+        visits.append(PageVisit(previous_path='', path='/', timestamp=self.start))
+        analytics.record_transitions(visits)
+        analytics.record_transitions(visits[:1])
+        self.assertEqual(
+            list(NavigationTransition.objects.values_list('date', 'from_path', 'to_path', 'count')),
+            [(self.start.date(), '/', '/videos/', 3)],
+        )
+
+
+class NavigationFunnelTests(TestCase):
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        now = timezone.now()
+        for days_ago, from_path, to_path, count in (
+            (0, '/', '/videos/', 6), (1, '/', '/videos/', 2), (0, '/', '/about/', 2),
+            (0, '/videos/', '/videos/1/', 3), (0, '/videos/', '/', 1), (30, '/', '/videos/', 50),
+        ):
+            NavigationTransition.objects.create(
+                date=self.today - timedelta(days=days_ago), from_path=from_path, to_path=to_path,
+                count=count, updated_at=now,
+            )
+
+    def test_funnel_rates_each_step(self):
+        steps = analytics.funnel(['/', '/videos/', '/videos/1/', '/done/'], self.today - timedelta(days=7), self.today)
+        self.assertEqual(
+            [(step['from_url'], step['to_url'], step['count'], step['exits']) for step in steps],
+            [('/', '/videos/', 8, 10), ('/videos/', '/videos/1/', 3, 4), ('/videos/1/', '/done/', 0, 0)],
+        )
+        self.assertEqual([step['rate'] for step in steps], [0.8, 0.75, 0.0])
+
+    def test_funnel_view(self):
+        url = reverse('accounts:navigation_funnel')
+        self.assertEqual(self.client.get(url, {'step': ['/', '/videos/']}).status_code, 302)
+
+        self.client.force_login(CustomUser.objects.create(username='staff', email='staff@example.com', is_staff=True))
+        self.assertEqual(self.client.get(url, {'step': ['/']}).status_code, 400)
+        response = self.client.get(url, {'step': ['/', '/videos/'], 'days': 3})
+        self.assertEqual(response.json()['start'], (self.today - timedelta(days=3)).isoformat())
+        self.assertEqual(response.json()['steps'][0]['count'], 8)
+
+
+class AnalyticsViewTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(agent_cache.clear)
+        agent_cache.clear()
+        self.staff = CustomUser.objects.create(username='staff', email='staff@example.com', is_staff=True)
+        now = timezone.now()
+        analytics.write_page_visits([
+            {
+                'session_id': 'a', 'user_id': self.staff.pk, 'ip_address': '10.0.0.1', 'user_agent': 'test-agent',
+                'path': path, 'referrer': '', 'app_name': 'youtube', 'view_name': '', 'status_code': 200,
+                'response_time_ms': 5, 'timestamp': now - timedelta(minutes=10 - minutes),
+            }
+            for minutes, path in ((0, '/'), (1, '/videos/'), (2, '/'))
+        ])
+
+    def test_staff_only(self):
+        self.client.force_login(CustomUser.objects.create(username='viewer', email='viewer@example.com'))
+        self.assertEqual(self.client.get(reverse('accounts:analytics_dashboard')).status_code, 302)
+
+    def test_report_pages_render(self):
+        self.client.force_login(self.staff)
+        for url, params in (
+            (reverse('accounts:analytics_dashboard'), {}),
+            (reverse('accounts:app_analytics'), {}),
+            (reverse('accounts:page_view_report'), {'url': 'https://example.com/videos/'}),
+            (reverse('accounts:navigation_trends'), {}),
+            (reverse('accounts:navigation_trends'), {'hours': 2}),
+            (reverse('accounts:user_analytics', args=[self.staff.pk]), {}),
+            (reverse('accounts:user_analytics', args=[0]), {'session_id': 'a'}),
+        ):
+            with self.subTest(url=url, params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 200)
+
+    def test_summary_and_trends(self):
+        filters = analytics.parse_filters(mock.Mock(GET={'days': '1'}))
+        totals = analytics.summary(filters)
+        self.assertEqual((totals['total_page_views'], totals['unique_users'], totals['unique_sessions']), (3, 1, 1))
+        self.assertEqual(analytics.top_pages(filters)[0]['path'], '/')
+        trends = analytics.navigation_trends(filters)
+        self.assertEqual(trends['total_navigations'], 2)
+        self.assertEqual(sorted((path['from_url'], path['to_url']) for path in trends['frequent_paths']),
+                         [('/', '/videos/'), ('/videos/', '/')])
+
+
+class SessionizerFeedTests(TestCase):
+
+    def setUp(self):
+        self.start = timezone.make_aware(datetime(2026, 3, 2, 9, 0))
+        self.sessionizer = sessionizer.Sessionizer(timedelta(minutes=30))
+
+    def feed(self, minutes, session_id, path, user_id=None):
+        return self.sessionizer.feed({
+            'session_id': session_id, 'timestamp': self.start + timedelta(minutes=minutes), 'path': path,
+            'app_name': 'youtube', 'user_id': user_id, 'user_agent_id': None,
+        })
+
+    def test_gaps_split_sessions_and_pages_collect_dwell(self):
+        self.assertIsNone(self.feed(0, 'a', '/'))
+        self.assertIsNone(self.feed(10, 'a', '/videos/', user_id=7))
+        self.assertIsNone(self.feed(15, 'b', '/'))
+        self.assertIsNone(self.feed(40, 'a', '/videos/1/'))
+        # 30 minutes since a's last view is still the same session; 31 is not
+        finished = self.feed(71, 'a', '/')
+        self.assertEqual(
+            (finished['start'], finished['end'], finished['page_count'], finished['landing_path'],
+             finished['last_path'], finished['user_id']),
+            (self.start, self.start + timedelta(minutes=40), 3, '/', '/videos/1/', 7),
+        )
+        self.assertEqual(self.sessionizer.dwell, {
+            (self.start.date(), '/'): ['youtube', 600.0, 1],
+            (self.start.date(), '/videos/'): ['youtube', 1800.0, 1],
+        })
+        self.assertEqual(self.sessionizer.open['a']['page_count'], 1)
+
+    def test_close_idle_and_state_round_trip(self):
+        self.feed(0, 'a', '/')
+        self.feed(20, 'b', '/')
+        restored = sessionizer.Sessionizer.from_state(self.sessionizer.gap, self.sessionizer.state())
+        self.assertEqual(restored.open, self.sessionizer.open)
+
+        self.assertEqual(restored.close_idle(self.start + timedelta(minutes=30)), [])
+        idle = restored.close_idle(self.start + timedelta(minutes=31))
+        self.assertEqual([session_id for session_id, session in idle], ['a'])
+        self.assertEqual(list(restored.open), ['b'])
+
+
+@override_settings(ANALYTICS_SESSION_TIMEOUT=1800, ANALYTICS_SESSIONIZE_DELAY=300)
+class SessionizerTests(TestCase):
+
+    def setUp(self):
+        self.start = timezone.make_aware(datetime(2026, 3, 2, 9, 0))
+        # minutes after start -> (session id, path)
+        visits = [
+            (0, 'a', '/'), (1, 'b', '/'), (2, 'a', '/videos/'), (5, 'a', '/videos/1/'),
+            (6, 'b', '/videos/2/'), (50, 'a', '/'), (52, 'a', '/videos/'), (55, 'c', '/'),
+            (56, 'c', '/accounts/'), (120, 'b', '/'),
+        ]
+        PageVisit.objects.bulk_create([
+            PageVisit(session_id=session_id, path=path, app_name='tutorial',
+                      timestamp=self.start + timedelta(minutes=minutes))
+            for minutes, session_id, path in visits
+        ])
+        self.end = self.start + timedelta(hours=4)
+
+    def results(self):
+        sessions = sorted(VisitSession.objects.values_list(
+            'session_id', 'start_time', 'end_time', 'page_count', 'landing_path', 'exit_path',
+        ))
+        dwell = sorted(DailyPageDwell.objects.values_list('date', 'path', 'total_seconds', 'samples'))
+        return sessions, dwell
+
+    def expected(self):
+        sessionizer.sessionize(now=self.end, chunk_size=1000)
+        results = self.results()
+        sessionizer.reset()
+        return results
+
+    def test_sessions_and_dwell(self):
+        self.assertEqual(sessionizer.sessionize(now=self.end), 5)
+        sessions, dwell = self.results()
+        self.assertEqual([(session[0], session[3]) for session in sessions],
+                         [('a', 3), ('a', 2), ('b', 2), ('b', 1), ('c', 2)])
+        self.assertEqual(dwell, [(self.start.date(), '/', 600.0, 4), (self.start.date(), '/videos/', 180.0, 1)])
+        checkpoint = SessionizerCheckpoint.objects.get()
+        self.assertEqual(checkpoint.open_sessions, {})
+        self.assertEqual(checkpoint.last_timestamp, self.start + timedelta(minutes=120))
+
+    def test_small_chunks_match_one_chunk(self):
+        expected = self.expected()
+        self.assertEqual(sessionizer.sessionize(now=self.end, chunk_size=3), 5)
+        self.assertEqual(self.results(), expected)
+
+    def test_resumes_after_a_failed_chunk(self):
+        expected = self.expected()
+        save_dwell = sessionizer._save_dwell
+        calls = []
+
+        def fail_third_chunk(dwell):
+            calls.append(dwell)
+            if len(calls) == 3:
+                raise RuntimeError("database went away")
+            save_dwell(dwell)
+
+        with mock.patch.object(sessionizer, '_save_dwell', fail_third_chunk):
+            with self.assertRaises(RuntimeError):
+                sessionizer.sessionize(now=self.end, chunk_size=3)
+        # The first two chunks stay committed
+        checkpoint = SessionizerCheckpoint.objects.get()
+        self.assertEqual(checkpoint.last_timestamp, self.start + timedelta(minutes=50))
+        self.assertEqual(set(checkpoint.open_sessions), {'a'})
+        self.assertEqual(VisitSession.objects.count(), 2)
+
+        self.assertEqual(sessionizer.sessionize(now=self.end, chunk_size=3), 3)
+        self.assertEqual(self.results(), expected)
+
+    def test_later_runs_pick_up_open_sessions(self):
+        expected = self.expected()
+        # Only the visits up to minute 52 are past the delay
+        sessionizer.sessionize(now=self.start + timedelta(minutes=58), chunk_size=2)
+        self.assertEqual(set(SessionizerCheckpoint.objects.get().open_sessions), {'a'})
+        sessionizer.sessionize(now=self.end, chunk_size=2)
+        self.assertEqual(self.results(), expected)
+
+    def test_rebuild_command_starts_over(self):
+        expected = self.expected()
+        sessionizer.sessionize(now=self.end)
+        VisitSession.objects.filter(session_id='a').delete()
+        out = io.StringIO()
+        call_command('sessionize_visits', stdout=out)
+        self.assertIn('Closed 0 sessions', out.getvalue())
+        self.assertNotEqual(self.results(), expected)
+
+        call_command('sessionize_visits', rebuild=True, chunk_size=4, stdout=out)
+        self.assertIn('Closed 5 sessions', out.getvalue())
+        self.assertEqual(self.results(), expected)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.staff = CustomUser.objects.create(username='staff', email='staff@example.com', is_staff=True)
+        self.videos = [
+            YoutubeVideo.objects.create(user=self.staff, title=title, description='x', youtube_link='https://youtu.be/x')
+            for title in ('Django tips', 'Flask tips')
+        ]
+        self.day = date(2026, 3, 2)
+        at = timezone.make_aware(datetime(2026, 3, 2, 12, 0))
+        for video, days_ago in ((0, 0), (1, 0), (0, 1), (0, 40)):
+            ViewerHistory.objects.create(video=self.videos[video], ip_address='10.0.0.1',
+                                         view_date=at - timedelta(days=days_ago))
+        first, second = (video.pk for video in self.videos)
+        SearchHistory.objects.create(query='tips', ip_address='10.0.0.1', results_count=2,
+                                     result_ids=pack_ids([second, first]), search_date=at)
+        SearchHistory.objects.create(query='flask', ip_address='10.0.0.1', results_count=1,
+                                     result_ids=pack_ids([second]), search_date=at)
+        self.client.force_login(self.staff)
+
+    def export(self, **params):
+        params.setdefault('end', self.day.isoformat())
+        return self.client.get(reverse('accounts:export_data'), params)
+
+    def test_filters(self):
+        filters = exports.export_filters(end=self.day, days=7)
+        self.assertEqual((filters['start'], filters['end']), (date(2026, 2, 24), self.day))
+        self.assertEqual(filters['until'] - filters['since'], timedelta(days=7))
+        with self.assertRaises(ValueError):
+            exports.export_filters(start=self.day, end=date(2026, 3, 1))
+
+        request = RequestFactory().get('/', {'start': '2026-03-01', 'end': '2026-03-02', 'video': '3'})
+        filters = exports.parse_export_filters(request)
+        self.assertEqual((filters['start'], filters['video'], filters['user']), (date(2026, 3, 1), 3, None))
+        with self.assertRaises(ValueError):
+            exports.parse_export_filters(RequestFactory().get('/', {'start': '03/01/2026'}))
+
+        self.assertEqual(self.export(type='views', start='yesterday').status_code, 400)
+        self.assertEqual(self.export(type='views', format='xlsx').status_code, 400)
+
+    def test_streamed_csv(self):
+        response = self.export(type='views', video=self.videos[0].pk)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="views_20260201-20260302.csv"')
+        records = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        # The view 40 days back is outside the default 30
+        self.assertEqual([record['video_id'] for record in records], [str(self.videos[0].pk)] * 2)
+
+        response = self.export(type='searches', video=self.videos[0].pk)
+        records = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([record['query'] for record in records], ['tips'])
+
+        response = self.export(type='search_results')
+        records = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([(record[2], record[3]) for record in records[1:]], [('tips', '1'), ('tips', '2'), ('flask', '1')])
+
+    @mock.patch.object(exports, 'CHUNK_SIZE', 2)
+    def test_columnar_output_streams_one_chunk_at_a_time(self):
+        import pandas as pd
+        import pyarrow.parquet
+
+        parts = list(exports.stream_columnar('views', exports.export_filters(end=self.day, days=365), 'parquet'))
+        # Two row groups, then the footer
+        self.assertEqual(len(parts), 3)
+        self.assertTrue(all(parts))
+        parquet = pyarrow.parquet.ParquetFile(io.BytesIO(b''.join(parts)))
+        self.assertEqual((parquet.num_row_groups, parquet.metadata.num_rows), (2, 4))
+
+        response = self.export(type='searches', format='feather')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.arrow.file')
+        frame = pd.read_feather(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(list(frame['query']), ['tips', 'flask'])
+        self.assertEqual(str(frame['search_date'].dtype), 'datetime64[us, UTC]')
+
+        response = self.export(type='views', format='parquet', start='2026-04-01', end='2026-04-02')
+        frame = pd.read_parquet(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual((len(frame), list(frame.columns)[:3]), (0, ['id', 'view_date', 'video_id']))
+
+    def test_command_writes_large_ranges_to_a_file(self):
+        import pandas as pd
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'views.feather')
+            out = io.StringIO()
+            call_command('export_analytics', 'views', path, format='feather', end=self.day, days=365, stdout=out)
+            self.assertIn('Wrote 4 rows', out.getvalue())
+            self.assertEqual(len(pd.read_feather(path)), 4)
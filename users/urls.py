@@ -15,6 +15,20 @@ urlpatterns = [
     path('confirm-email/<int:pk>/<str:code>/', views.confirm_email_link, name='confirm_email_link'),
     path('resend-code/', views.resend_confirmation_code, name='resend_code'),
 
+    # Analytics
+    path('analytics/', views.analytics_dashboard, name='analytics_dashboard'),
+    path('analytics/apps/', views.app_analytics, name='app_analytics'),
+    path('analytics/pages/', views.page_view_report, name='page_view_report'),
+    path('analytics/navigation/', views.navigation_trends, name='navigation_trends'),
+    path('analytics/navigation/funnel/', views.navigation_funnel, name='navigation_funnel'),
+    path('analytics/users/<int:user_id>/', views.user_analytics, name='user_analytics'),
+    path('analytics/refresh/page-views/', views.refresh_page_views_by_date, name='refresh_page_views_by_date'),
+    path('analytics/refresh/devices/', views.refresh_device_distribution, name='refresh_device_distribution'),
+    path('analytics/refresh/browsers/', views.refresh_browser_distribution, name='refresh_browser_distribution'),
+    path('analytics/refresh/top-pages/', views.refresh_top_pages, name='refresh_top_pages'),
+    path('analytics/refresh/user-activity/', views.refresh_user_activity, name='refresh_user_activity'),
+    path('analytics/export/', views.export_data, name='export_data'),
+
 
 
 
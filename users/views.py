@@ -4,7 +4,7 @@ from django.contrib.auth import login, authenticate, logout, get_user_model
 from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django.utils.timezone import now
-from django.http import JsonResponse, HttpResponseRedirect, HttpResponseBadRequest, HttpResponseForbidden
+from django.http import JsonResponse, HttpResponseRedirect, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
 from django.views import View
 from django.views.generic import ListView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
@@ -17,9 +17,11 @@ import json
 from datetime import datetime, timedelta
 
 from .forms import CustomUserCreationForm, EmailVerificationForm
-from .models import EmailVerification, VerificationAttempt, CustomUser
+from .models import EmailVerification, VerificationAttempt, CustomUser, PageVisit
 from .utils import create_verification_code, send_verification_email, send_welcome_email
 from . import utils
+from . import analytics
+from . import exports
 
 User = get_user_model()
 
@@ -328,6 +330,188 @@ def resend_confirmation_code(request):
     return redirect('accounts:email_confirmation')
 
 
+# Analytics (PageVisit / AnalyticsSession, recorded by users.middleware)
+
+staff_required = user_passes_test(lambda user: user.is_active and user.is_staff, login_url='accounts:login')
+
+
+def _filter_context(filters):
+    return {key: filters[key] for key in ('days', 'hours', 'device_type', 'user_type')}
+
+
+def _paginate(request, queryset, per_page=25):
+    return Paginator(queryset, per_page).get_page(request.GET.get('page'))
+
+
+@staff_required
+def analytics_dashboard(request):
+    filters = analytics.parse_filters(request)
+    context = _filter_context(filters)
+    context.update({
+        'summary': analytics.summary(filters),
+        'top_pages': analytics.top_pages(filters),
+        'user_activity': analytics.user_activity(filters),
+        'page_views_by_date': json.dumps(analytics.page_views_by_date(filters)),
+        'device_distribution': json.dumps(analytics.devices(filters)),
+        'browser_distribution': json.dumps(analytics.browsers(filters)),
+    })
+    return render(request, 'users/analytics/dashboard.html', context)
+
+
+@staff_required
+def app_analytics(request):
+    filters = analytics.parse_filters(request)
+    app_metrics = analytics.app_metrics(filters)
+    context = _filter_context(filters)
+    context.update({
+        'app_metrics': app_metrics,
+        'most_visited': app_metrics[0] if app_metrics else None,
+        'least_visited': min(app_metrics, key=lambda app: app['visitors']) if len(app_metrics) > 1 else None,
+    })
+    return render(request, 'users/analytics/app_analytics.html', context)
+
+
+@staff_required
+def page_view_report(request):
+    filters = analytics.parse_filters(request)
+    url = request.GET.get('url', '').strip()
+    context = _filter_context(filters)
+    context['url'] = url
+    if url:
+        # Full URLs pasted from the browser are reduced to their path
+        path = urlparse(url).path or url
+        context['report'] = analytics.page_report(path, filters)
+        if context['report'] is None:
+            context['error'] = f"No visits to {path} in the selected period."
+        else:
+            visits = analytics.visits(filters, PageVisit.objects.filter(path=path))
+            context['page_visits'] = _paginate(
+                request, visits.select_related('user', 'user_agent').order_by('-timestamp')
+            )
+    return render(request, 'users/analytics/page_view_report.html', context)
+
+
+@staff_required
+def navigation_trends(request):
+    filters = analytics.parse_filters(request)
+    navigations = analytics.navigations(filters)
+    context = _filter_context(filters)
+    context.update({
+        'trends': analytics.navigation_trends(filters),
+        'navigation_paths': _paginate(
+            request, navigations.select_related('user', 'user_agent').order_by('-timestamp')
+        ),
+        'navigation_paths_json': analytics.navigations_json(navigations),
+    })
+    return render(request, 'users/analytics/navigation_trends.html', context)
+
+
+@staff_required
+def user_analytics(request, user_id):
+    filters = analytics.parse_filters(request)
+    context = _filter_context(filters)
+    if user_id:
+        user = get_object_or_404(CustomUser, pk=user_id)
+        context['analytics'] = analytics.user_analytics(filters, user=user)
+    else:
+        session_id = request.GET.get('session_id', '')
+        if not session_id:
+            context['error'] = "No user or session selected."
+            context['analytics'] = {'is_authenticated': False, 'session_id': ''}
+            return render(request, 'users/analytics/user_detail.html', context)
+        context['analytics'] = analytics.user_analytics(filters, session_id=session_id)
+    context['page_visits'] = _paginate(
+        request, context['analytics']['visits'].select_related('user_agent').order_by('-timestamp')
+    )
+    return render(request, 'users/analytics/user_detail.html', context)
+
+
+@staff_required
+def navigation_funnel(request):
+    # ?step=/a/&step=/b/&step=/c/ over the last ?days= days, from the daily transition table
+    steps = [step for step in request.GET.getlist('step') if step]
+    if len(steps) < 2:
+        return HttpResponseBadRequest("At least two steps are required")
+    filters = analytics.parse_filters(request)
+    start, end = timezone.localdate(filters['since']), timezone.localdate()
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'steps': analytics.funnel(steps, start, end),
+    })
+
+
+def _serialize_activity(activity):
+    return [dict(entry, last_visit=entry['last_visit'].isoformat()) for entry in activity]
+
+
+@staff_required
+def refresh_page_views_by_date(request):
+    filters = analytics.parse_filters(request)
+    return JsonResponse({'page_views_by_date': analytics.page_views_by_date(filters)})
+
+
+@staff_required
+def refresh_device_distribution(request):
+    filters = analytics.parse_filters(request)
+    return JsonResponse({'device_distribution': analytics.devices(filters)})
+
+
+@staff_required
+def refresh_browser_distribution(request):
+    filters = analytics.parse_filters(request)
+    return JsonResponse({'browser_distribution': analytics.browsers(filters)})
+
+
+@staff_required
+def refresh_top_pages(request):
+    filters = analytics.parse_filters(request)
+    return JsonResponse({'top_pages': analytics.top_pages(filters)})
+
+
+@staff_required
+def refresh_user_activity(request):
+    filters = analytics.parse_filters(request)
+    return JsonResponse({'user_activity': _serialize_activity(analytics.user_activity(filters))})
+
+
+@staff_required
+def export_data(request):
+    # Small aggregate exports used by the dashboard buttons, as JSON, and
+    # raw history (?type=views|searches|search_results) streamed as
+    # ?format=csv|parquet|feather with memory flat in the row count
+    export_type = request.GET.get('type', 'summary')
+    if export_type in exports.DATASETS:
+        return _export_dataset(request, export_type)
+
+    filters = analytics.parse_filters(request)
+    if export_type == 'summary':
+        data = analytics.summary(filters)
+    elif export_type == 'app_metrics':
+        data = analytics.app_metrics(filters)
+    else:
+        return HttpResponseBadRequest("Unknown export type")
+    return JsonResponse({'data': data})
+
+
+def _export_dataset(request, dataset):
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponseBadRequest("Unknown export format")
+    try:
+        filters = exports.parse_export_filters(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Invalid export filters: {e}")
+
+    if fmt == 'csv':
+        content = exports.stream_csv(dataset, filters)
+    else:
+        content = exports.stream_columnar(dataset, filters, fmt)
+    response = StreamingHttpResponse(content, content_type=exports.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(dataset, filters, fmt)}"'
+    return response
+
+
 def terms_of_use(request):
     return render(request, 'users/compliance/terms_of_use.html')
 